@@ -73,8 +73,8 @@ define(IPA_DATA_VERSION, 20100614120000)
 #                                                      #
 ########################################################
 define(IPA_API_VERSION_MAJOR, 2)
-define(IPA_API_VERSION_MINOR, 228)
-# Last change: Expose ipaNTAdditionalSuffixes in trust-mod
+define(IPA_API_VERSION_MINOR, 231)
+# Last change: Add dnszone_import and dnszone_export
 
 
 ########################################################
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2017 FreeIPA Contributors see COPYING for license
+#
+"""Benchmark of the ipa command-line tool startup
+
+Measures the time and the peak memory (RSS) needed to initialize the
+client API and get a command, with plugin modules imported eagerly and on
+first use (lazy_plugins). Plugins are loaded in-tree, so no IPA server is
+needed:
+
+    $ python contrib/plugin-startup-bench.py --runs 10 ping
+
+Every run is a new Python process. The plugin manifest is generated by a
+first run which is not measured.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = """
+import json, resource, sys, time
+start = time.time()
+from ipalib import api
+api.bootstrap(context='cli', in_tree=True, lazy_plugins={lazy!r})
+api.finalize()
+api.Command[{command!r}]
+print(json.dumps(dict(
+    time=time.time() - start,
+    rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    modules=len(sys.modules),
+)))
+"""
+
+SRCDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(command, lazy):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in (SRCDIR, env.get('PYTHONPATH')) if p)
+    code = CHILD.format(command=command, lazy=lazy)
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('command', nargs='?', default='ping')
+    args = parser.parse_args()
+
+    run(args.command, True)
+
+    for lazy in (False, True):
+        results = [run(args.command, lazy) for _i in range(args.runs)]
+        print('lazy_plugins={!s:5}  time {:7.1f} ms  rss {:7d} kB  '
+              'modules {:5d}'.format(
+                  lazy,
+                  median(r['time'] for r in results) * 1000,
+                  median(r['rss'] for r in results),
+                  median(r['modules'] for r in results)))
+
+
+if __name__ == '__main__':
+    main()
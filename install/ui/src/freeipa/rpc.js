@@ -35,6 +35,55 @@ define([
    ],
    function(lang, Deferred, on, topic, auth, IPA, text, util, rpc /*exports*/) {
 
+/**
+ * Responses which came with an entity tag (ETag), by request data.
+ *
+ * Commands repeating a request send the tag in the If-None-Match header
+ * and use the cached response when the server replies 304 Not Modified.
+ * Only the last `max_size` responses are kept.
+ *
+ * @class rpc.response_cache
+ * @singleton
+ */
+rpc.response_cache = function() {
+
+    var that = IPA.object();
+
+    /** @property {number} max_size Maximum number of cached responses */
+    that.max_size = 100;
+
+    that.keys = [];
+    that.responses = {};
+
+    /**
+     * Get cached response for request data
+     * @param {string} key - request data
+     * @return {Object} `{ etag: string, text: string }` or undefined
+     */
+    that.get = function(key) {
+        if (!that.responses.hasOwnProperty(key)) return undefined;
+        return that.responses[key];
+    };
+
+    /**
+     * Cache response text with its entity tag
+     * @param {string} key - request data
+     * @param {string} etag
+     * @param {string} text
+     */
+    that.set = function(key, etag, text) {
+        if (!that.responses.hasOwnProperty(key)) {
+            that.keys.push(key);
+        }
+        that.responses[key] = { etag: etag, text: text };
+        while (that.keys.length > that.max_size) {
+            delete that.responses[that.keys.shift()];
+        }
+    };
+
+    return that;
+}();
+
 /**
  * Call an IPA command over JSON-RPC.
  *
@@ -384,6 +433,17 @@ rpc.command = function(spec) {
 
         function success_handler(data, text_status, xhr) {
 
+            var response_cache = rpc.response_cache;
+            if (xhr && xhr.status === 304) {
+                // not modified since the cached response
+                var cached = response_cache.get(this.data);
+                data = cached ? JSON.parse(cached.text) : null;
+            } else if (xhr && data && !data.error &&
+                    xhr.getResponseHeader('ETag')) {
+                response_cache.set(this.data, xhr.getResponseHeader('ETag'),
+                                   xhr.responseText);
+            }
+
             if (!data) {
                 // error_handler() publishes 'rpc-end'
                 error_handler.call(this, xhr, text_status, /* error_thrown */ {
@@ -474,6 +534,11 @@ rpc.command = function(spec) {
             error: error_handler_login
         };
 
+        var cached = rpc.response_cache.get(that.request.data);
+        if (cached) {
+            that.request.headers = { 'If-None-Match': cached.etag };
+        }
+
         if (that.notify_globally) {
             topic.publish('rpc-start');
         }
@@ -0,0 +1,124 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+asyncio interface to the RPC client (Python 3 only).
+
+Commands are executed on a bounded pool of worker threads. Each worker
+keeps its own keep-alive HTTPS connection of the ``rpcclient`` backend, so
+the session cookie handling, Kerberos negotiation and JSON decoding of the
+synchronous client are shared unchanged.
+
+>>> import asyncio
+>>> from ipalib import api
+>>> from ipaclient.asyncrpc import AsyncClient
+>>> api.bootstrap(context='cli')
+>>> api.finalize()
+>>> loop = asyncio.get_event_loop()
+>>> with AsyncClient(api, max_concurrency=8) as client:
+...     results = loop.run_until_complete(asyncio.gather(*(
+...         client.call('user_show', uid) for uid in (u'admin', u'bob'))))
+"""
+
+import functools
+import os
+import threading
+# pylint: disable=import-error
+# asyncio and concurrent.futures are not available on Python 2, which
+# pylint2 lints ipaclient with
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+# pylint: enable=import-error
+
+from ipalib import errors
+
+
+class AsyncClient(object):
+    """
+    Execute commands of *api* concurrently and return awaitable results.
+
+    At most *max_concurrency* commands are in flight at a time, the
+    ``rpc_max_concurrency`` setting is used by default.
+    """
+
+    def __init__(self, api, max_concurrency=None, loop=None):
+        if max_concurrency is None:
+            max_concurrency = api.env.rpc_max_concurrency
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be a positive number")
+        self.api = api
+        self.max_concurrency = max_concurrency
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._ccache = os.environ.get('KRB5CCNAME')
+        self._lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+        self._transports = []
+        self._authenticated = False
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def call(self, name, *args, **options):
+        """
+        Execute command *name* with *args* and *options*.
+
+        Return an asyncio future of the command result, command errors are
+        raised when the future is awaited.
+        """
+        if self._closed:
+            raise RuntimeError("AsyncClient is closed")
+        loop = self._loop or asyncio.get_event_loop()
+        return loop.run_in_executor(
+            self._executor,
+            functools.partial(self._execute, name, args, options))
+
+    def close(self):
+        """
+        Wait for pending commands and close the connections of all workers.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def _connect(self):
+        backend = self.api.Backend.rpcclient
+        if backend.isconnected():
+            return
+        backend.connect(ccache=self._ccache)
+        with self._lock:
+            self._transports.append(
+                backend.conn._ServerProxy__transport)  # pylint: disable=W0212
+
+    def _execute(self, name, args, options):
+        command = self.api.Command[name]
+
+        # Requests are serialized until the first one is authenticated, so
+        # that the Kerberos negotiation is done only once and the other
+        # workers connect with the session cookie it established.
+        if not self._authenticated:
+            with self._auth_lock:
+                if not self._authenticated:
+                    self._connect()
+                    try:
+                        result = command(*args, **options)
+                    except (errors.AuthenticationError, errors.NetworkError):
+                        raise
+                    except errors.PublicError:
+                        self._authenticated = True
+                        raise
+                    self._authenticated = True
+                    return result
+
+        self._connect()
+        return command(*args, **options)
@@ -32,7 +32,7 @@ from ipalib.dns import (get_record_rrtype,
                         part_name_format,
                         record_name_format)
 from ipalib.frontend import Command
-from ipalib.parameters import Bool, Str
+from ipalib.parameters import Bool, File, Str
 from ipalib.plugable import Registry
 from ipalib import _, ngettext
 from ipalib import util
@@ -130,6 +130,53 @@ class dnszone_mod(DNSZoneMethodOverride):
     pass
 
 
+@register(override=True, no_fail=True)
+class dnszone_import(MethodOverride):
+    def get_options(self):
+        for option in super(dnszone_import, self).get_options():
+            if option.name == 'zonefile':
+                option = option.clone_retype(option.name, File)
+            yield option
+
+
+@register(override=True, no_fail=True)
+class dnszone_export(MethodOverride):
+    takes_options = (
+        Str(
+            'out?',
+            include='cli',
+            doc=_('file to store the zone file in'),
+        ),
+    )
+
+    def forward(self, *keys, **options):
+        # pop `out` before sending to server as it is only client side option
+        out = options.pop('out', None)
+        if out:
+            util.check_writable_file(out)
+
+        result = super(dnszone_export, self).forward(*keys, **options)
+
+        if out and 'result' in result:
+            try:
+                with open(out, 'wb') as f:
+                    f.write(result['result'].encode('utf-8'))
+            except (OSError, IOError) as e:
+                raise errors.FileError(reason=unicode(e))
+            result['result'] = u''
+            result['summary'] = (
+                _("Zone file stored in file '%(file)s'") % dict(file=out))
+
+        return result
+
+    def output_for_cli(self, textui, output, *args, **options):
+        if output.get('result'):
+            textui.print_plain(output['result'].rstrip(u'\n'))
+        elif output.get('summary'):
+            textui.print_summary(output['summary'])
+        return 0
+
+
 # Support old servers without dnsrecord_split_parts
 # Do not add anything new here!
 @register(no_fail=True)
@@ -425,6 +472,7 @@ class dnsforwardzone_mod(MethodOverride):
 @register(override=True, no_fail=True)
 class dns_update_system_records(MethodOverride):
     record_groups = ('ipa_records', 'location_records')
+    diff_groups = ('ipa_records_diff', 'location_records_diff')
 
     takes_options = (
         Str(
@@ -441,6 +489,13 @@ class dns_update_system_records(MethodOverride):
                 for val in sorted(result[key]):
                     textui.print_indented(val, indent=2)
                 textui.print_line(u'')
+        for key in self.diff_groups:
+            if result.get(key):
+                textui.print_indented(u'{}:'.format(labels[key]), indent=1)
+                # keep removed and added records of a name together
+                for val in result[key]:
+                    textui.print_indented(val, indent=2)
+                textui.print_line(u'')
 
     def _nsupdate_output_file(self, out_f, result):
         """Store data in nsupdate format in file"""
@@ -490,8 +545,8 @@ class dns_update_system_records(MethodOverride):
     def output_for_cli(self, textui, output, *args, **options):
         output_super = copy.deepcopy(output)
         super_res = output_super.get('result', {})
-        super_res.pop('ipa_records', None)
-        super_res.pop('location_records', None)
+        for key in self.record_groups + self.diff_groups:
+            super_res.pop(key, None)
 
         super(dns_update_system_records, self).output_for_cli(
             textui, output_super, *args, **options)
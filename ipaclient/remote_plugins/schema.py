@@ -5,11 +5,12 @@
 import collections
 import errno
 import json
+import mmap
 import os
+import struct
 import sys
 import tempfile
 import types
-import zipfile
 
 import six
 
@@ -25,7 +26,12 @@ from ipapython.dn import DN
 from ipapython.dnsutil import DNSName
 from ipapython.ipa_log_manager import log_mgr
 
-FORMAT = '1'
+FORMAT = '2'
+
+# Cache file layout: header, JSON index of (offset, length) pairs relative to
+# the end of the index, then the JSON encoded members themselves.
+_MAGIC = b'IPASCHEM'
+_HEADER = struct.Struct('!8sI')
 
 if six.PY3:
     unicode = str
@@ -362,6 +368,8 @@ class Schema(object):
         self._dict = {}
         self._namespaces = {}
         self._help = None
+        self._data = None
+        self._start = 0
 
         for ns in self.namespaces:
             self._dict[ns] = {}
@@ -427,16 +435,43 @@ class Schema(object):
         return (fp, ttl,)
 
     def _read_schema(self, fingerprint):
-        # It's more efficient to read zip file members at once than to open
-        # the zip file a couple of times, see #6690.
+        # Map the cache file and read only its index, members are read and
+        # decoded from the mapping on first access, see #6690.
         filename = os.path.join(self._DIR, fingerprint)
-        with zipfile.ZipFile(filename, 'r') as schema:
-            for name in schema.namelist():
-                ns, _slash, key = name.partition('/')
-                if ns in self.namespaces:
-                    self._dict[ns][key] = schema.read(name)
-                elif name == '_help':
-                    self._help = schema.read(name)
+        with open(filename, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("{} is not a schema cache file".format(filename))
+        start = _HEADER.size + index_size
+        index = json.loads(data[_HEADER.size:start].decode('utf-8'))
+
+        # members are stored one after another, make sure the index covers
+        # the data exactly so that a damaged file is not found only when a
+        # member is used
+        locations = [index['_help']]
+        for ns in self.namespaces:
+            locations.extend(index[ns].values())
+        end = 0
+        for offset, length in sorted(locations):
+            if offset != end or length <= 0:
+                raise ValueError(
+                    "{} has an invalid index".format(filename))
+            end = offset + length
+        if end != len(data) - start:
+            raise ValueError("{} is truncated".format(filename))
+
+        self._data = data
+        self._start = start
+        for ns in self.namespaces:
+            self._dict[ns] = index[ns]
+        self._help = self._read_data(index['_help'])
+
+    def _read_data(self, location):
+        offset, length = location
+        offset += self._start
+        return self._data[offset:offset + length]
 
     def __getitem__(self, key):
         try:
@@ -486,27 +521,35 @@ class Schema(object):
                 os.rename(f.name, os.path.join(self._DIR, fingerprint))
 
     def _write_schema_data(self, fileobj):
-        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as schema:
-            for key, value in self._dict.items():
-                if key in self.namespaces:
-                    ns = value
-                    for member in ns:
-                        path = '{}/{}'.format(key, member)
-                        schema.writestr(path,
-                                        json.dumps(ns[member]).encode('utf-8'))
-                else:
-                    schema.writestr(key, json.dumps(value).encode('utf-8'))
-
-            schema.writestr(
-                '_help',
-                json.dumps(self._help).encode('utf-8')
-            )
+        index = {}
+        chunks = []
+        offset = 0
+
+        for key in self.namespaces:
+            index[key] = {}
+            for member, value in self._dict[key].items():
+                chunk = json.dumps(value).encode('utf-8')
+                index[key][member] = (offset, len(chunk))
+                chunks.append(chunk)
+                offset += len(chunk)
+
+        chunk = json.dumps(self._help).encode('utf-8')
+        index['_help'] = (offset, len(chunk))
+        chunks.append(chunk)
+
+        index = json.dumps(index).encode('utf-8')
+        fileobj.write(_HEADER.pack(_MAGIC, len(index)))
+        fileobj.write(index)
+        for chunk in chunks:
+            fileobj.write(chunk)
 
     def read_namespace_member(self, namespace, member):
         value = self._dict[namespace][member]
 
-        if isinstance(value, bytes):
-            value = json.loads(value.decode('utf-8'))
+        # members read from the cache file are (offset, length) pairs until
+        # they are decoded
+        if isinstance(value, list):
+            value = json.loads(self._read_data(value).decode('utf-8'))
             self._dict[namespace][member] = value
 
         return value
@@ -931,6 +931,7 @@ Registry = plugable.Registry
 
 class API(plugable.API):
     bases = (Command, Object, Method, Backend, Updater)
+    lazy_bases = (Command, Object)
 
     @property
     def packages(self):
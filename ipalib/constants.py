@@ -149,6 +149,50 @@ DEFAULT_CONFIG = (
     ('startup_timeout', 300),
     # How long http connection should wait for reply [seconds].
     ('http_timeout', 30),
+    # Maximum number of commands executed concurrently by
+    # ipaclient.asyncrpc.AsyncClient
+    ('rpc_max_concurrency', 8),
+    # How long the client waits for servers to accept a TCP connection when
+    # choosing the fastest one [seconds]
+    ('server_probe_timeout', 2),
+    # How long the ranking of servers by latency is cached [seconds]
+    ('server_ranking_ttl', 3600),
+    # Import client plugin modules on first use, as listed in a cached
+    # plugin manifest, when plugins are finalized on-demand
+    ('lazy_plugins', True),
+
+    # Server-side pool of GSSAPI bound LDAP connections:
+    # maximum number of idle connections kept per process (0 disables pool)
+    ('ldap_pool_size', 8),
+    # idle connections older than this are unbound [seconds]
+    ('ldap_pool_max_idle', 300),
+    # idle connections older than this are checked before reuse [seconds]
+    ('ldap_pool_check_interval', 10),
+    # Cached IPA configuration and similar entries are revalidated after
+    # this time [seconds] (0 disables the cache)
+    ('ldap_entry_cache_ttl', 60),
+    # Maximum number of results of read-only commands cached per process
+    # (0 disables the cache)
+    ('response_cache_size', 256),
+    # Maximum number of per-principal membership graphs kept per process
+    # (0 disables the graphs)
+    ('member_graph_size', 4),
+    # Maximum number of per-principal DNS zone indexes kept per process
+    # (0 disables the indexes)
+    ('dns_zone_index_size', 4),
+
+    # Maximum number of threads executing methods of a parallel batch
+    ('batch_max_workers', 4),
+
+    # ipa-dnskeysyncd synchronizes DNSSEC key changes with BIND this many
+    # seconds after the first change of a batch [seconds]
+    ('dnskeysyncd_batch_delay', 2),
+    # Maximum number of zones ipa-dnskeysyncd synchronizes concurrently
+    ('dnskeysyncd_max_workers', 4),
+
+    # Log phase timings and LDAP counters of every RPC request and serve
+    # them aggregated per command at /ipa/metrics
+    ('perf_metrics', False),
 
     # Web Application mount points
     ('mount_ipa', '/ipa/'),
@@ -169,6 +213,9 @@ DEFAULT_CONFIG = (
     ('debug', False),
     ('startup_traceback', False),
     ('mode', 'production'),
+    # 'full' or 'sampled', None to sample only in production mode:
+    ('output_validation', None),
+    ('output_validation_entries', 10),
     ('wait_for_dns', 0),
 
     # CA plugin:
@@ -34,7 +34,7 @@ from ipalib.text import _
 from ipalib.errors import (ZeroArgumentError, MaxArgumentError, OverlapError,
     VersionError, OptionError,
     ValidationError, ConversionError)
-from ipalib import errors, messages
+from ipalib import errors, messages, perf
 from ipalib.request import context, context_frame
 from ipalib.util import classproperty, json_serialize
 
@@ -407,10 +407,23 @@ class Command(HasParam):
     options = Plugin.finalize_attr('options')
     params = Plugin.finalize_attr('params')
     params_by_default = Plugin.finalize_attr('params_by_default')
+    # Set in _on_finalize() so that a call only touches the params which
+    # are supplied or defaulted:
+    _param_index = Plugin.finalize_attr('_param_index')
+    _option_index = Plugin.finalize_attr('_option_index')
+    _required_params = Plugin.finalize_attr('_required_params')
+    _default_params = Plugin.finalize_attr('_default_params')
+    _default_index = Plugin.finalize_attr('_default_index')
+    _default_deps = Plugin.finalize_attr('_default_deps')
     obj = None
 
     use_output_validation = True
+    # Whether the server may serve the result from its response cache. Only
+    # set for read-only commands whose result depends on nothing but the
+    # directory content visible to the caller.
+    cache_response = False
     output = Plugin.finalize_attr('output')
+    _output_names = Plugin.finalize_attr('_output_names')
     has_output = ('result',)
     output_params = Plugin.finalize_attr('output_params')
     has_output_params = tuple()
@@ -458,23 +471,56 @@ class Command(HasParam):
                 # add message only on server side
                 self.add_message(
                     messages.VersionMissing(server_version=self.api_version))
-        params = self.args_options_2_params(*args, **options)
+        with perf.timed('params'):
+            params = self.args_options_2_params(*args, **options)
         self.debug(
             'raw: %s(%s)', self.name, ', '.join(self._repr_iter(**params))
         )
-        if self.api.env.in_server:
-            params.update(self.get_default(**params))
-        params = self.normalize(**params)
-        params = self.convert(**params)
+        with perf.timed('normalize'):
+            if self.api.env.in_server:
+                params.update(self.get_default(**params))
+            params = self.normalize(**params)
+        with perf.timed('convert'):
+            params = self.convert(**params)
         self.debug(
             '%s(%s)', self.name, ', '.join(self._repr_iter(**params))
         )
         if self.api.env.in_server:
-            self.validate(**params)
+            with perf.timed('validate'):
+                self.validate(**params)
         (args, options) = self.params_2_args_options(**params)
-        ret = self.run(*args, **options)
+        call_messages = self.context.__messages
+
+        batch = getattr(context, 'rpc_batch', None)
+        if batch is not None and not self.api.env.in_server:
+            if self.__can_batch():
+                ret = batch.add(self.forwarded_name, args, options)
+                ret.add_postprocessor(
+                    lambda r: self.__finish_call(r, options, call_messages))
+                return ret
+            # keep the order of commands queued before this one
+            batch.flush()
+
+        with perf.timed('execute'):
+            ret = self.run(*args, **options)
+        return self.__finish_call(ret, options, call_messages)
+
+    def __can_batch(self):
+        """
+        Return True if the command can be queued by a batched RPC client,
+        i.e. it is forwarded to the server without any client-side
+        processing.
+        """
+        cls = type(self)
+        return (six.get_unbound_function(cls.run) is
+                six.get_unbound_function(Command.run) and
+                six.get_unbound_function(cls.forward) is
+                six.get_unbound_function(Command.forward) and
+                self.forwarded_name != 'batch')
+
+    def __finish_call(self, ret, options, call_messages):
         if isinstance(ret, dict):
-            for message in self.context.__messages:
+            for message in call_messages:
                 messages.add_message(options['version'], ret, message)
         if (
             isinstance(ret, dict)
@@ -483,9 +529,29 @@ class Command(HasParam):
         ):
             ret['summary'] = self.get_summary_default(ret)
         if self.use_output_validation and (self.output or ret is not None):
-            self.validate_output(ret, options['version'])
+            with perf.timed('validate_output'):
+                self.validate_output(ret, options['version'],
+                                     limit=self.__get_output_limit())
         return ret
 
+    def __get_output_limit(self):
+        """
+        Return how many items of list outputs are validated, None for all.
+
+        All items are validated in ``full`` mode; in ``sampled`` mode, only
+        the first ``output_validation_entries`` of them. By default, output
+        is sampled in production mode and fully validated otherwise.
+        """
+        mode = self.api.env.output_validation
+        if mode is None:
+            if self.api.is_production_mode():
+                mode = 'sampled'
+            else:
+                mode = 'full'
+        if mode == 'sampled':
+            return self.api.env.output_validation_entries
+        return None
+
     def add_message(self, message):
         self.context.__messages.append(message)
 
@@ -511,11 +577,10 @@ class Command(HasParam):
         for arg in self.args():
             value = params.get(arg.name, None)
             yield repr(arg.safe_value(value))
-        for option in self.options():
-            if option.name not in params:
-                continue
-            value = params[option.name]
-            yield '%s=%r' % (option.name, option.safe_value(value))
+        index = self._option_index
+        for name in sorted((n for n in params if n in index), key=index.get):
+            option = self.options[name]
+            yield '%s=%r' % (name, option.safe_value(params[name]))
 
     def args_options_2_params(self, *args, **options):
         """
@@ -551,9 +616,9 @@ class Command(HasParam):
                 break
 
     def __options_2_params(self, options):
-        for name in self.params:
-            if name in options:
-                yield (name, options.pop(name))
+        index = self._param_index
+        for name in [n for n in options if n in index]:
+            yield (name, options.pop(name))
         # If any options remain, they are either internal or unknown
         unused_keys = set(options).difference(self.internal_options)
         if unused_keys:
@@ -598,8 +663,9 @@ class Command(HasParam):
         return (args, options)
 
     def __params_2_options(self, params):
-        for name in self.options:
-            if name in params:
+        index = self._option_index
+        for name in params:
+            if name in index:
                 yield(name, params[name])
 
     def prompt_param(self, param, default=None, optional=False, kw=dict(),
@@ -692,8 +758,8 @@ class Command(HasParam):
         {}
         """
         if _params is None:
-            _params = [p.name for p in self.params()
-                       if p.name not in kw and (p.required or p.autofill)]
+            _params = [name for name in self._default_params
+                       if name not in kw]
         return dict(self.__get_default_iter(_params, kw))
 
     def get_default_of(self, _name, **kw):
@@ -709,15 +775,15 @@ class Command(HasParam):
         """
         # Find out what additional parameters are needed to dynamically create
         # the default values with default_from.
+        params = set(params)
         dep = set()
-        for param in reversed(self.params_by_default):
-            if param.name in params or param.name in dep:
-                if param.default_from is None:
-                    continue
-                for name in param.default_from.keys:
-                    dep.add(name)
+        for name in params:
+            dep.update(self._default_deps.get(name, ()))
 
-        for param in self.params_by_default():
+        index = self._default_index
+        names = sorted((n for n in params | dep if n in index), key=index.get)
+        for name in names:
+            param = self.params_by_default[name]
             default = None
             hasdefault = False
             if param.name in dep:
@@ -755,9 +821,12 @@ class Command(HasParam):
         If any value fails the validation, `ipalib.errors.ValidationError`
         (or a subclass thereof) will be raised.
         """
-        for param in self.params():
-            value = kw.get(param.name, None)
-            param.validate(value, supplied=param.name in kw)
+        index = self._param_index
+        names = set(n for n in kw if n in index)
+        names.update(self._required_params)
+        for name in sorted(names, key=index.get):
+            param = self.params[name]
+            param.validate(kw.get(name, None), supplied=name in kw)
 
     def verify_client_version(self, client_version):
         """
@@ -873,10 +942,39 @@ class Command(HasParam):
                     pass
             params.insert(pos, i)
         self.params_by_default = NameSpace(params, sort=False)
+
+        self._param_index = dict(
+            (p.name, i) for (i, p) in enumerate(self.params()))
+        self._option_index = dict(
+            (name, i) for (i, name) in enumerate(self.options))
+        self._required_params = frozenset(
+            p.name for p in self.params() if p.required)
+        self._default_params = tuple(
+            p.name for p in self.params() if p.required or p.autofill)
+        self._default_index = dict(
+            (p.name, i) for (i, p) in enumerate(self.params_by_default()))
+        self._default_deps = dict(
+            (p.name, self.__get_default_deps(p))
+            for p in self.params_by_default() if p.default_from is not None)
+
         self.output = NameSpace(self._iter_output(), sort=False)
+        self._output_names = frozenset(self.output)
         self._create_param_namespace('output_params')
         super(Command, self)._on_finalize()
 
+    def __get_default_deps(self, param):
+        """
+        Return names of the parameters needed to create the default value of
+        ``param`` with default_from, directly or through other parameters.
+        """
+        dep = set()
+        for p in reversed(self.params_by_default):
+            if p is param or p.name in dep:
+                if p.default_from is None:
+                    continue
+                dep.update(p.default_from.keys)
+        return frozenset(dep)
+
     def _iter_output(self):
         if type(self.has_output) is not tuple:
             raise TypeError('%s.has_output: need a %r; got a %r: %r' % (
@@ -964,17 +1062,21 @@ class Command(HasParam):
             flags=['no_option', 'no_output'],
         )
 
-    def validate_output(self, output, version=API_VERSION):
+    def validate_output(self, output, version=API_VERSION, limit=None):
         """
         Validate the return value to make sure it meets the interface contract.
+
+        If ``limit`` is not None, only the first ``limit`` items of list
+        outputs are passed to their ``validate`` callback.
         """
         nice = '%s.validate_output()' % self.name
         if not isinstance(output, dict):
             raise TypeError('%s: need a %r; got a %r: %r' % (
                 nice, dict, type(output), output)
             )
-        expected_set = set(self.output)
-        actual_set = set(output) - set(['messages'])
+        expected_set = self._output_names
+        actual_set = set(output)
+        actual_set.discard('messages')
         if expected_set != actual_set:
             missing = expected_set - actual_set
             if missing:
@@ -993,6 +1095,11 @@ class Command(HasParam):
                     nice, o.name, o.type, type(value), value)
                 )
             if callable(o.validate):
+                if (limit is not None and isinstance(value, (list, tuple))
+                        and len(value) > limit):
+                    perf.count('output_items_not_validated',
+                               len(value) - limit)
+                    value = value[:limit]
                 o.validate(self, value, version)
 
     def get_output_params(self):
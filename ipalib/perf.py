@@ -0,0 +1,205 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Per-request performance counters and per-process request metrics.
+
+The RPC server starts collecting statistics of a request with
+`start_request`. Code executed during the request then records the time
+spent in its phases with `timed` and increments counters with `count`.
+Both are no-ops when no statistics are collected, e.g. on the client::
+
+    stats = start_request()
+    with timed('execute'):
+        count('ldap_searches')
+    finish_request(u'user_show', stats)
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+from ipalib.request import context
+
+# Upper bounds of the request duration histogram buckets [seconds]
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats(object):
+    """
+    Phase timings and counters of a single request.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.duration = None
+        self.timings = collections.OrderedDict()
+        self.counters = collections.defaultdict(int)
+        self.active = False
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def format(self):
+        """
+        Return the statistics as ``key=value`` log fields.
+        """
+        fields = ['duration=%.6f' % (self.duration or 0.0)]
+        fields.extend('%s=%.6f' % (phase, seconds)
+                      for phase, seconds in self.timings.items())
+        fields.extend('%s=%s' % (name, value)
+                      for name, value in sorted(self.counters.items()))
+        return ' '.join(fields)
+
+
+def get_stats():
+    """
+    Return the statistics of the current request, or None.
+    """
+    return getattr(context, 'perf_stats', None)
+
+
+def start_request():
+    """
+    Start collecting statistics of a request in the current thread.
+    """
+    stats = RequestStats()
+    context.perf_stats = stats
+    return stats
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """
+    Add the time spent in the context to *phase* of the current request.
+
+    Phases nested in another phase are not recorded separately, their time
+    is included in the outer phase.
+    """
+    stats = getattr(context, 'perf_stats', None)
+    if stats is None or stats.active:
+        yield
+        return
+
+    stats.active = True
+    start = time.time()
+    try:
+        yield
+    finally:
+        stats.add_time(phase, time.time() - start)
+        stats.active = False
+
+
+def count(name, value=1):
+    """
+    Add *value* to counter *name* of the current request.
+    """
+    stats = getattr(context, 'perf_stats', None)
+    if stats is not None:
+        stats.counters[name] += value
+
+
+class _CommandMetrics(object):
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.phases = collections.defaultdict(float)
+        self.counters = collections.defaultdict(int)
+
+
+class Metrics(object):
+    """
+    Aggregated statistics of the requests served by this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def observe(self, command, stats):
+        with self._lock:
+            metrics = self._commands.get(command)
+            if metrics is None:
+                metrics = self._commands[command] = _CommandMetrics()
+            for i, bound in enumerate(BUCKETS):
+                if stats.duration <= bound:
+                    metrics.buckets[i] += 1
+            metrics.count += 1
+            metrics.sum += stats.duration
+            for phase, seconds in stats.timings.items():
+                metrics.phases[phase] += seconds
+            for name, value in stats.counters.items():
+                metrics.counters[name] += value
+
+    def clear(self):
+        with self._lock:
+            self._commands.clear()
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            commands = sorted(self._commands.items())
+            lines = [
+                '# HELP ipa_request_duration_seconds '
+                'Duration of RPC requests.',
+                '# TYPE ipa_request_duration_seconds histogram',
+            ]
+            for command, metrics in commands:
+                for bound, value in zip(BUCKETS, metrics.buckets):
+                    lines.append(
+                        'ipa_request_duration_seconds_bucket'
+                        '{command="%s",le="%s"} %d' % (command, bound, value))
+                lines.append(
+                    'ipa_request_duration_seconds_bucket'
+                    '{command="%s",le="+Inf"} %d' % (command, metrics.count))
+                lines.append(
+                    'ipa_request_duration_seconds_sum{command="%s"} %.6f' % (
+                        command, metrics.sum))
+                lines.append(
+                    'ipa_request_duration_seconds_count{command="%s"} %d' % (
+                        command, metrics.count))
+
+            lines.extend([
+                '# HELP ipa_request_phase_seconds_total '
+                'Time spent in the phases of RPC requests.',
+                '# TYPE ipa_request_phase_seconds_total counter',
+            ])
+            for command, metrics in commands:
+                for phase, seconds in sorted(metrics.phases.items()):
+                    lines.append(
+                        'ipa_request_phase_seconds_total'
+                        '{command="%s",phase="%s"} %.6f' % (
+                            command, phase, seconds))
+
+            names = sorted(set(
+                name for _command, metrics in commands
+                for name in metrics.counters))
+            for name in names:
+                lines.append('# TYPE ipa_%s_total counter' % name)
+                for command, metrics in commands:
+                    if name in metrics.counters:
+                        lines.append('ipa_%s_total{command="%s"} %s' % (
+                            name, command, metrics.counters[name]))
+
+        return u'\n'.join(lines) + u'\n'
+
+
+metrics = Metrics()
+
+
+def finish_request(command, stats):
+    """
+    Stop collecting statistics of the current request and add them to the
+    metrics of *command*.
+    """
+    stats.duration = time.time() - stats.start
+    try:
+        del context.perf_stats
+    except AttributeError:
+        pass
+    metrics.observe(command, stats)
@@ -24,6 +24,9 @@ The classes in this module make heavy use of Python container emulation. If
 you are unfamiliar with this Python feature, see
 http://docs.python.org/ref/sequence-types.html
 """
+import errno
+import hashlib
+import json
 import operator
 import sys
 import threading
@@ -41,7 +44,7 @@ from ipalib.config import Env
 from ipalib.text import _
 from ipalib.util import classproperty
 from ipalib.base import ReadOnly, lock, islocked
-from ipalib.constants import DEFAULT_CONFIG
+from ipalib.constants import DEFAULT_CONFIG, USER_CACHE_PATH
 from ipapython import ipautil
 from ipapython.ipa_log_manager import (
     log_mgr,
@@ -120,6 +123,90 @@ class Registry(object):
         return iter(self.__registry.values())
 
 
+class LazyPlugin(object):
+    """
+    Placeholder for a plugin whose module has not been imported yet.
+
+    It carries what `API` needs to register and enumerate the plugin. The
+    module is imported and the placeholder replaced by the plugin class
+    when the plugin is first used, see `API._resolve`.
+    """
+    def __init__(self, module, name, version, bases):
+        self.module = module
+        self.name = name
+        self.version = version
+        self.full_name = '{}/{}'.format(name, version)
+        self.bases = bases
+
+    def __repr__(self):
+        return '<lazy plugin %s from %s>' % (self.full_name, self.module)
+
+
+class PluginManifest(object):
+    """
+    Cached map of the plugins registered by the modules of a package.
+
+    The manifest is generated when the package is imported in full and
+    stored in the user cache. It lists, for every module, the name, version
+    and bases of its plugins and the arguments they were registered with.
+    Modules which cannot be loaded lazily are listed as ``None``.
+
+    The manifest is keyed by the IPA version, the API context and the size
+    and mtime of every module of the package, it is ignored when any of
+    them changes.
+    """
+    _DIR = os.path.join(USER_CACHE_PATH, 'ipa', 'plugins')
+
+    def __init__(self, api, package_name, package_dir):
+        self.modules = list(find_modules_in_dir(package_dir))
+        self._path = os.path.join(self._DIR, package_name)
+        self._log = api.log
+
+        stats = []
+        for name in self.modules:
+            st = os.stat(os.path.join(package_dir, name + '.py'))
+            stats.append((name, st.st_size, int(st.st_mtime)))
+        key = json.dumps([VERSION, api.env.context, api.env.in_server,
+                          package_dir, stats])
+        self.key = hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def read(self):
+        """
+        Return the manifest as a dict mapping module names to the list of
+        their plugins, or None if there is no valid manifest.
+        """
+        try:
+            with open(self._path, 'r') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            if not (isinstance(e, EnvironmentError) and
+                    e.errno == errno.ENOENT):  # pylint: disable=no-member
+                self._log.debug('Failed to read plugin manifest: %s', e)
+            return None
+
+        try:
+            if manifest['key'] != self.key:
+                return None
+            modules = manifest['modules']
+        except (KeyError, TypeError):
+            return None
+        if sorted(modules) != sorted(self.modules):
+            return None
+        return modules
+
+    def write(self, modules):
+        try:
+            try:
+                os.makedirs(self._DIR)
+            except EnvironmentError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(self._path, 'w') as f:
+                json.dump(dict(key=self.key, modules=modules), f)
+        except EnvironmentError as e:
+            self._log.debug('Failed to write plugin manifest: %s', e)
+
+
 class Plugin(ReadOnly):
     """
     Base class for all plugins.
@@ -315,11 +402,23 @@ class APINameSpace(collections.Mapping):
 
     def __iter__(self):
         self.__enumerate()
+        lazy = [p for p in self.__plugins if isinstance(p, LazyPlugin)]
+        if lazy:
+            for plugin in lazy:
+                self.__api._resolve(plugin)
+            self.__enumerate()
         return iter(self.__plugins)
 
     def get_plugin(self, key):
         self.__enumerate()
-        return self.__plugins_by_key[key]
+        plugin = self.__plugins_by_key[key]
+        if isinstance(plugin, LazyPlugin):
+            plugin = self.__api._resolve(plugin)
+        return plugin
+
+    def _reset(self):
+        self.__plugins = None
+        self.__plugins_by_key = None
 
     def __getitem__(self, key):
         plugin = self.get_plugin(key)
@@ -340,6 +439,10 @@ class API(ReadOnly):
     Dynamic API object through which `Plugin` instances are accessed.
     """
 
+    # Modules whose plugins are all subclasses of these bases are imported
+    # on first use when plugins are finalized on-demand.
+    lazy_bases = ()
+
     def __init__(self):
         super(API, self).__init__()
         self.__plugins = set()
@@ -347,6 +450,8 @@ class API(ReadOnly):
         self.__default_map = {}
         self.__instances = {}
         self.__next = {}
+        self.__lazy = {}
+        self.__resolved = {}
         self.__done = set()
         self.env = Env()
 
@@ -610,12 +715,34 @@ class API(ReadOnly):
                 name=package_name, file=package_file
             )
 
-        self.log.debug("importing all plugin modules in %s...", package_name)
-        modules = getattr(package, 'modules', find_modules_in_dir(package_dir))
-        modules = ['.'.join((package_name, name)) for name in modules]
+        manifest = None
+        lazy = None
+        modules = getattr(package, 'modules', None)
+        if modules is None:
+            if (self.lazy_bases and self.env.plugins_on_demand and
+                    self.env.lazy_plugins):
+                manifest = PluginManifest(self, package_name, package_dir)
+                lazy = manifest.read()
+                modules = manifest.modules
+            else:
+                modules = find_modules_in_dir(package_dir)
+
+        if lazy is not None:
+            self.log.debug("loading plugin manifest of %s...", package_name)
+        else:
+            self.log.debug("importing all plugin modules in %s...",
+                           package_name)
+        entries = {}
+
+        for module_name in modules:
+            name = '.'.join((package_name, module_name))
+            if lazy is not None and lazy[module_name] is not None:
+                for entry in lazy[module_name]:
+                    self.__add_lazy_plugin(name, entry)
+                continue
 
-        for name in modules:
             self.log.debug("importing plugin module %s", name)
+            entries[module_name] = None
             try:
                 module = importlib.import_module(name)
             except errors.SkipPluginModule as e:
@@ -632,6 +759,82 @@ class API(ReadOnly):
                 self.add_module(module)
             except errors.PluginModuleError as e:
                 self.log.debug("%s", e)
+            else:
+                entries[module_name] = self.__get_manifest_entries(module)
+
+        if manifest is not None and lazy is None:
+            manifest.write(entries)
+
+    def __get_manifest_entries(self, module):
+        """
+        Return the manifest entries of the plugins of ``module``, or None if
+        the module cannot be loaded lazily.
+        """
+        entries = []
+        for kwargs in module.register:
+            plugin = kwargs['plugin']
+            if not (isinstance(plugin, type) and
+                    issubclass(plugin, self.lazy_bases)):
+                return None
+            entries.append(dict(
+                name=plugin.name,
+                version=plugin.version,
+                bases=[b.__name__ for b in self.bases
+                       if issubclass(plugin, b)],
+                override=kwargs.get('override', False),
+                no_fail=kwargs.get('no_fail', False),
+            ))
+        return entries
+
+    def __add_lazy_plugin(self, module, entry):
+        bases = tuple(b for b in self.bases if b.__name__ in entry['bases'])
+        plugin = LazyPlugin(module, entry['name'], entry['version'], bases)
+        self.__lazy.setdefault(module, []).append(plugin)
+        self.add_plugin(plugin,
+                        override=entry['override'],
+                        no_fail=entry['no_fail'])
+
+    def _resolve(self, plugin):
+        """
+        Return the plugin class ``plugin`` stands for.
+
+        If ``plugin`` is a `LazyPlugin`, its module is imported and all the
+        placeholders of the module are replaced by the plugin classes.
+        """
+        if not isinstance(plugin, LazyPlugin):
+            return plugin
+
+        lazy = self.__lazy.pop(plugin.module, None)
+        if lazy is not None:
+            self.log.debug("importing plugin module %s", plugin.module)
+            module = importlib.import_module(plugin.module)
+            registered = [kwargs['plugin'] for kwargs in module.register]
+            if ([p.full_name for p in registered] !=
+                    [p.full_name for p in lazy]):
+                raise errors.PluginModuleError(name=plugin.module)
+
+            for placeholder, cls in zip(lazy, registered):
+                self.__replace_plugin(placeholder, cls)
+
+            for base in self.bases:
+                namespace = self.__dict__.get(base.__name__)
+                if isinstance(namespace, APINameSpace):
+                    namespace._reset()
+
+        return self.__resolved[plugin]
+
+    def __replace_plugin(self, placeholder, plugin):
+        self.__resolved[placeholder] = plugin
+        if placeholder in self.__plugins:
+            self.__plugins.remove(placeholder)
+            self.__plugins.add(plugin)
+        if self.__plugins_by_key.get(plugin.full_name) is placeholder:
+            self.__plugins_by_key[plugin.full_name] = plugin
+        if placeholder in self.__next:
+            self.__next[plugin] = self.__next.pop(placeholder)
+        for key, value in list(self.__next.items()):
+            if value is placeholder:
+                self.__next[key] = plugin
 
     def add_module(self, module):
         """
@@ -658,7 +861,7 @@ class API(ReadOnly):
         :param plugin: A subclass of `Plugin` to attempt to add.
         :param override: If true, override an already added plugin.
         """
-        if not callable(plugin):
+        if not callable(plugin) and not isinstance(plugin, LazyPlugin):
             raise TypeError('plugin must be callable; got %r' % plugin)
 
         # Find the base class or raise SubclassError:
@@ -740,7 +943,7 @@ class API(ReadOnly):
         production_mode = self.is_production_mode()
 
         for base in self.bases:
-            for plugin in self.__plugins:
+            for plugin in list(self.__plugins):
                 if not any(issubclass(b, base) for b in plugin.bases):
                     continue
                 if not self.env.plugins_on_demand:
@@ -765,6 +968,7 @@ class API(ReadOnly):
             lock(self)
 
     def _get(self, plugin):
+        plugin = self._resolve(plugin)
         if not callable(plugin):
             raise TypeError('plugin must be callable; got %r' % plugin)
         if plugin not in self.__plugins:
@@ -781,7 +985,7 @@ class API(ReadOnly):
         if not callable(plugin):
             raise TypeError('plugin must be callable; got %r' % plugin)
 
-        return self.__next[plugin]
+        return self._resolve(self.__next[plugin])
 
 
 class IPAHelpFormatter(optparse.IndentedHelpFormatter):
@@ -33,6 +33,8 @@ Also see the `ipaserver.rpcserver` module.
 from __future__ import absolute_import
 
 from decimal import Decimal
+import collections
+import contextlib
 import datetime
 import os
 import locale
@@ -41,16 +43,20 @@ import json
 import re
 import socket
 import gzip
+import errno
+import threading
+import time
+import zlib
 
 import gssapi
 from dns import resolver, rdatatype
 from dns.exception import DNSException
 from ssl import SSLError
 import six
-from six.moves import urllib
+from six.moves import queue, urllib
 
 from ipalib.backend import Connectible
-from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT
+from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT, USER_CACHE_PATH
 from ipalib.errors import (public_errors, UnknownError, NetworkError,
                            XMLRPCMarshallError, JSONError)
 from ipalib import errors, capabilities
@@ -400,6 +406,66 @@ def json_encode_binary(val, version, pretty_print=False):
         return json.dumps(result)
 
 
+def _iter_json(val, depth):
+    """Serialize *val* as JSON chunks, top *depth* levels separately"""
+    if depth and isinstance(val, dict) and all(
+            isinstance(k, six.string_types) for k in val):
+        yield u'{'
+        for i, (k, v) in enumerate(six.iteritems(val)):
+            yield (u', ' if i else u'') + json.dumps(k) + u': '
+            for chunk in _iter_json(v, depth - 1):
+                yield chunk
+        yield u'}'
+    elif depth and isinstance(val, (list, tuple)):
+        yield u'['
+        for i, v in enumerate(val):
+            if i:
+                yield u', '
+            for chunk in _iter_json(v, depth - 1):
+                yield chunk
+        yield u']'
+    else:
+        yield json.dumps(val)
+
+
+def _join_chunks(chunks, chunk_size):
+    buf = []
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            yield u''.join(buf).encode('utf-8')
+            buf = []
+            size = 0
+    if buf:
+        yield u''.join(buf).encode('utf-8')
+
+
+def json_encode_binary_iter(val, version, pretty_print=False,
+                            chunk_size=65536):
+    """Serialize a Python object structure to UTF-8 encoded JSON chunks
+
+    Same as `json_encode_binary`, but the JSON document is encoded lazily
+    in chunks of about *chunk_size* characters, so that a large response
+    is never held in memory as a whole. Values are converted eagerly, so
+    conversion errors are raised by this function, not by the iterator.
+
+    :param object val: Python object structure
+    :param str version: client version
+    :param bool pretty_print: indent and sort JSON (encoded in one chunk)
+    :param int chunk_size: approximate size of the chunks
+    :return: iterator of bytes
+    """
+    if pretty_print:
+        return iter([json_encode_binary(val, version, pretty_print=True)
+                     .encode('utf-8')])
+    result = _JSONPrimer(version).convert(val)
+    # the top levels of a response are typically a dict holding a list of
+    # entries, each entry is encoded at once by the fast C encoder
+    return _join_chunks(_iter_json(result, 3), chunk_size)
+
+
 def _ipa_obj_hook(dct, _iteritems=six.iteritems, _list=list):
     """JSON object hook
 
@@ -487,6 +553,10 @@ class MultiProtocolTransport(Transport):
     def __init__(self, *args, **kwargs):
         Transport.__init__(self)
         self.protocol = kwargs.get('protocol', None)
+        # entity tag sent in If-None-Match with the next request and the
+        # one received with the last response
+        self.if_none_match = None
+        self.etag = None
 
     def getparser(self):
         if self.protocol == 'json':
@@ -504,9 +574,40 @@ class MultiProtocolTransport(Transport):
         # gzip compression would be set up here, but we have it turned off
         # (encode_threshold is None)
 
+        if self.if_none_match is not None:
+            connection.putheader("If-None-Match", self.if_none_match)
+
         connection.putheader("Content-Length", str(len(request_body)))
         connection.endheaders(request_body)
 
+    def parse_response(self, response):
+        if hasattr(response, 'getheader'):
+            encoding = response.getheader('Content-Encoding', '')
+            self.etag = response.getheader('ETag')
+        else:
+            encoding = ''
+            self.etag = None
+        if encoding not in ('gzip', 'deflate'):
+            return Transport.parse_response(self, response)
+
+        # decompress the response while reading it instead of buffering
+        # the whole compressed body first, gzip and zlib headers are
+        # detected automatically
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        p, u = self.getparser()
+        while True:
+            data = response.read(65536)
+            if not data:
+                break
+            data = decompressor.decompress(data)
+            if self.verbose:
+                print("body: %r" % data)
+            p.feed(data)
+        p.feed(decompressor.flush())
+        p.close()
+
+        return u.close()
+
 
 class LanguageAwareTransport(MultiProtocolTransport):
     """Transport sending Accept-Language header"""
@@ -689,6 +790,15 @@ class KerbTransport(SSLTransport):
                     self.__send_request(h, host, handler, request_body, verbose)
                     response = h.getresponse()
 
+                if response.status == 304:
+                    # the response to a conditional request did not change,
+                    # keep the connection alive
+                    response.read()
+                    if not self._auth_complete(response):
+                        continue
+                    self.etag = response.getheader('ETag')
+                    return None
+
                 if response.status != 200:
                     if (response.getheader("content-length", 0)):
                         response.read()
@@ -729,8 +839,7 @@ class KerbTransport(SSLTransport):
                 connection.set_debuglevel(1)
             if self.accept_gzip_encoding and gzip:
                 connection.putrequest("POST", handler, skip_accept_encoding=True)
-                connection.putheader("Accept-Encoding", "gzip")
-                headers.append(("Accept-Encoding", "gzip"))
+                headers.append(("Accept-Encoding", "gzip, deflate"))
             else:
                 connection.putrequest("POST", handler)
             headers.append(("User-Agent", self.user_agent))
@@ -829,6 +938,138 @@ class DelegatedKerbTransport(KerbTransport):
              gssapi.RequirementFlag.out_of_sequence_detection]
 
 
+def _probe_server(url, timeout, results):
+    """
+    Put *url* and the time it took to open a TCP connection to its server
+    to queue *results*, or *url* and None if the server is unreachable.
+    """
+    split_url = urllib.parse.urlsplit(url)
+    port = split_url.port or (443 if split_url.scheme == 'https' else 80)
+    start = time.time()
+    try:
+        sock = socket.create_connection((split_url.hostname, port), timeout)
+    except (socket.error, ValueError):
+        results.put((url, None))
+    else:
+        sock.close()
+        results.put((url, time.time() - start))
+
+
+class BatchResult(object):
+    """
+    Future-like result of a command queued by `RPCClient.batched`.
+
+    `result` flushes the queue if the command has not been sent yet and
+    returns the command result or raises its error.
+    """
+
+    def __init__(self, batch):
+        self._batch = batch
+        self._done = False
+        self._result = None
+        self._error = None
+        self._postprocessors = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        if not self._done:
+            self._batch.flush()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def exception(self):
+        if not self._done:
+            self._batch.flush()
+        return self._error
+
+    def add_postprocessor(self, callback):
+        """
+        Call *callback* with the command result once it is received and use
+        its return value as the result instead.
+        """
+        self._postprocessors.append(callback)
+
+    def set_result(self, result):
+        try:
+            for callback in self._postprocessors:
+                result = callback(result)
+        except Exception as e:
+            self.set_exception(e)
+        else:
+            self._result = result
+            self._done = True
+
+    def set_exception(self, error):
+        self._error = error
+        self._done = True
+
+
+class _Batch(object):
+    """
+    Queue of commands sent by *client* as batch requests of at most
+    *max_items* commands.
+    """
+
+    def __init__(self, client, max_items):
+        self.client = client
+        self.max_items = max_items
+        self.pending = []
+
+    def add(self, name, args, options):
+        result = BatchResult(self)
+        self.pending.append((name, args, options, result))
+        if len(self.pending) >= self.max_items:
+            self.flush()
+        return result
+
+    def flush(self):
+        while self.pending:
+            items = self.pending[:self.max_items]
+            del self.pending[:self.max_items]
+            self._send(items)
+
+    def abort(self, error):
+        pending, self.pending = self.pending, []
+        for _name, _args, _options, result in pending:
+            result.set_exception(error)
+
+    def _send(self, items):
+        methods = [
+            {u'method': unicode(name), u'params': [list(args), options]}
+            for name, args, options, _result in items
+        ]
+        version = items[0][2].get('version', VERSION_WITHOUT_CAPABILITIES)
+        try:
+            response = self.client.forward(u'batch', *methods, version=version)
+        except Exception as e:
+            for _name, _args, _options, result in items:
+                result.set_exception(e)
+            raise
+
+        for item, value in zip(items, response['results']):
+            result = item[3]
+            error = value.get('error')
+            if error is None:
+                value.pop('error', None)
+                result.set_result(value)
+                continue
+            try:
+                error_class = errors_by_code[value['error_code']]
+            except KeyError:
+                result.set_exception(UnknownError(
+                    code=value.get('error_code'),
+                    error=error,
+                    server=getattr(context, 'request_url', None),
+                ))
+            else:
+                kw = dict(value.get('error_kw') or {})
+                kw['message'] = error
+                result.set_exception(error_class(**kw))
+
+
 class RPCClient(Connectible):
     """
     Forwarding backend plugin for XML-RPC client.
@@ -875,6 +1116,109 @@ class RPCClient(Connectible):
 
         return servers
 
+    _RANKING_DIR = os.path.join(USER_CACHE_PATH, 'ipa', 'servers', 'ranking')
+
+    def _read_server_ranking(self, urls):
+        """
+        Return the ranking of *urls* stored for the realm, or None if there
+        is none, it expired or it was made for a different set of servers.
+        """
+        path = os.path.join(self._RANKING_DIR, self.env.realm)
+        try:
+            with open(path, 'r') as f:
+                ranking = json.load(f)
+        except Exception as e:
+            if not (isinstance(e, EnvironmentError) and
+                    e.errno == errno.ENOENT):  # pylint: disable=no-member
+                self.log.debug('Failed to read server ranking: %s', e)
+            return None
+
+        try:
+            if (ranking['expiration'] < time.time() or
+                    sorted(ranking['servers']) != sorted(urls)):
+                return None
+            return ranking['servers']
+        except (KeyError, TypeError):
+            return None
+
+    def _write_server_ranking(self, urls):
+        path = os.path.join(self._RANKING_DIR, self.env.realm)
+        try:
+            try:
+                os.makedirs(self._RANKING_DIR)
+            except EnvironmentError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(path, 'w') as f:
+                json.dump(dict(
+                    expiration=time.time() + self.env.server_ranking_ttl,
+                    servers=urls), f)
+        except EnvironmentError as e:
+            self.log.debug('Failed to write server ranking: %s', e)
+
+    def forget_server_ranking(self):
+        """
+        Remove the stored server ranking of the realm, the servers are
+        probed again on the next connection.
+        """
+        path = os.path.join(self._RANKING_DIR, self.env.realm)
+        try:
+            os.remove(path)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                self.log.debug('Failed to remove server ranking: %s', e)
+
+    def rank_servers(self, urls):
+        """
+        Return *urls* ordered by the latency of their servers.
+
+        The servers are probed concurrently. Servers which answer within
+        twice the time of the fastest one are ordered by latency, slower
+        servers follow in their original order and unreachable servers
+        come last. The ranking is stored per realm for
+        ``server_ranking_ttl`` seconds.
+        """
+        ranking = self._read_server_ranking(urls)
+        if ranking is not None:
+            return ranking
+
+        timeout = self.env.server_probe_timeout
+        results = queue.Queue()
+        for url in urls:
+            thread = threading.Thread(target=_probe_server,
+                                      args=(url, timeout, results))
+            thread.daemon = True
+            thread.start()
+
+        reachable = []
+        unreachable = []
+        deadline = time.time() + timeout
+        for _i in range(len(urls)):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                url, latency = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if latency is None:
+                unreachable.append(url)
+                continue
+            if not reachable:
+                # don't wait for slow servers once there is a fast one
+                deadline = min(deadline, time.time() + latency)
+            reachable.append((latency, url))
+
+        ranking = [url for _latency, url in sorted(reachable)]
+        ranking.extend(url for url in urls
+                       if url not in ranking and url not in unreachable)
+        ranking.extend(unreachable)
+        self.log.debug('Server ranking: %s', ', '.join(ranking))
+
+        if reachable:
+            self._write_server_ranking(ranking)
+        return ranking
+
     def get_session_cookie_from_persistent_storage(self, principal):
         '''
         Retrieves the session cookie for the given principal from the
@@ -1002,6 +1346,8 @@ class RPCClient(Connectible):
             # No session key, do full Kerberos auth
             pass
         urls = self.get_url_list(rpc_uri)
+        if fallback and len(urls) > 1:
+            urls = self.rank_servers(urls)
 
         proxy_kw = {
             'allow_none': True,
@@ -1068,6 +1414,7 @@ class RPCClient(Connectible):
                     else:
                         self.log.info(
                             'Connection to %s failed with %s', url, e)
+                        self.forget_server_ranking()
                     # try the next url
                     break
                 except Exception as e:
@@ -1076,12 +1423,44 @@ class RPCClient(Connectible):
                     else:
                         self.log.info(
                             'Connection to %s failed with %s', url, e)
+                        self.forget_server_ranking()
                     # try the next url
                     break
         # finished all tries but no serverproxy was found
         raise NetworkError(uri=_('any of the configured servers'),
                            error=', '.join(urls))
 
+    @contextlib.contextmanager
+    def batched(self, max_items=100):
+        """
+        Send commands called within the context in batch requests.
+
+        Commands forwarded to the server are queued and return a
+        `BatchResult` instead of their result. The queue is sent as a
+        ``batch`` command once it holds *max_items* commands, when a
+        result of a queued command is requested, before a command which
+        can't be queued is executed and when the context is left. Nested
+        contexts share the queue of the outermost one.
+
+        >>> with api.Backend.rpcclient.batched():
+        ...     results = [api.Command.user_show(uid) for uid in uids]
+        >>> results[0].result()
+        """
+        if getattr(context, 'rpc_batch', None) is not None:
+            yield context.rpc_batch
+            return
+
+        batch = _Batch(self, max_items)
+        context.rpc_batch = batch
+        try:
+            yield batch
+        except BaseException:
+            del context.rpc_batch
+            batch.abort(RuntimeError("batch was aborted"))
+            raise
+        del context.rpc_batch
+        batch.flush()
+
     def destroy_connection(self):
         conn = getattr(context, self.id, None)
         if conn is not None:
@@ -1179,6 +1558,10 @@ class xmlclient(RPCClient):
 
 
 class JSONServerProxy(object):
+    # maximum total size in bytes of the requests and responses kept for
+    # conditional requests
+    max_responses_size = 1024 * 1024
+
     def __init__(self, uri, transport, encoding, verbose, allow_none):
         split_uri = urllib.parse.urlsplit(uri)
         if split_uri.scheme not in ("http", "https"):
@@ -1196,6 +1579,11 @@ class JSONServerProxy(object):
         # by calling serverproxy('transport')
         self._ServerProxy__transport = transport
 
+        # request payload -> (ETag, response) of responses the server sent
+        # an entity tag for, so that they can be requested conditionally
+        self.__responses = collections.OrderedDict()
+        self.__responses_size = 0
+
     def __request(self, name, args):
         print_json = self.__verbose >= 2
         payload = {'method': unicode(name), 'params': args, 'id': 0}
@@ -1209,12 +1597,36 @@ class JSONServerProxy(object):
                 payload
             )
 
-        response = self.__transport.request(
-            self.__host,
-            self.__handler,
-            payload.encode('utf-8'),
-            verbose=self.__verbose >= 3,
-        )
+        cached = self.__responses.pop(payload, None)
+        if cached is not None:
+            self.__responses_size -= len(payload) + len(cached[1])
+        transport = self.__transport
+        transport.if_none_match = cached[0] if cached else None
+        transport.etag = None
+        try:
+            response = transport.request(
+                self.__host,
+                self.__handler,
+                payload.encode('utf-8'),
+                verbose=self.__verbose >= 3,
+            )
+        except ProtocolError as e:
+            if e.errcode != 304 or cached is None:
+                raise
+            response = None
+        finally:
+            transport.if_none_match = None
+
+        if response is None:
+            if cached is None:
+                raise JSONError(error=_('Empty response'))
+            root_logger.debug('Response not modified')
+            etag, response = cached
+        else:
+            etag = transport.etag
+
+        if etag:
+            self.__store_response(payload, etag, response)
 
         if print_json:
             root_logger.info(
@@ -1244,6 +1656,18 @@ class JSONServerProxy(object):
 
         return response['result']
 
+    def __store_response(self, payload, etag, response):
+        size = len(payload) + len(response)
+        if size > self.max_responses_size:
+            return
+        self.__responses[payload] = (etag, response)
+        self.__responses_size += size
+        # drop the least recently used responses
+        while self.__responses_size > self.max_responses_size:
+            old_payload, (_etag, old_response) = self.__responses.popitem(
+                last=False)
+            self.__responses_size -= len(old_payload) + len(old_response)
+
     def __getattr__(self, name):
         def _call(*args):
             return self.__request(name, args)
@@ -538,6 +538,23 @@ def rdn_key(rdn):
     return (len(rdn),) + tuple(ava_key(k) for k in rdn)
 
 
+# Normalized keys of RDNs which are not the leftmost RDN of a DN, i.e. of
+# containers and suffixes such as cn=users,cn=accounts,dc=example,dc=com.
+# DNs below the same suffix share these keys, so comparing them in
+# endswith() and friends mostly boils down to identity checks.
+_interned_rdn_keys = {}
+_INTERNED_RDN_KEYS_MAX = 4096
+
+
+def _intern_rdn_key(key):
+    try:
+        return _interned_rdn_keys[key]
+    except KeyError:
+        if len(_interned_rdn_keys) < _INTERNED_RDN_KEYS_MAX:
+            _interned_rdn_keys[key] = key
+        return key
+
+
 if six.PY2:
     # Python 2: Input/output is unicode; we store UTF-8 bytes
     def val_encode(s):
@@ -1098,18 +1115,54 @@ class DN(object):
 
     The str method of an DN returns the string representation in RFC 4514 DN
     syntax with proper escaping.
+
+    DN objects are immutable. The string representation, the normalized
+    (lower case) form used for comparison and the hash value are computed
+    once on first use and cached.
     '''
 
+    __slots__ = ('rdns', '_key', '_hash', '_str')
+
     AVA_type = AVA
     RDN_type = RDN
 
     def __init__(self, *args, **kwds):
-        self.rdns = self._rdns_from_sequence(args)
+        if len(args) == 1 and isinstance(args[0], DN):
+            other = args[0]
+            self.rdns = other.rdns
+            self._key = other._key
+            self._hash = other._hash
+            self._str = other._str
+            return
 
-    def _copy_rdns(self, rdns=None):
-        if not rdns:
+        self.rdns = self._rdns_from_sequence(args)
+        self._key = None
+        self._hash = None
+        self._str = None
+
+    @classmethod
+    def _from_rdns(cls, rdns):
+        dn = cls.__new__(cls)
+        dn.rdns = rdns
+        dn._key = None
+        dn._hash = None
+        dn._str = None
+        return dn
+
+    def _get_key(self):
+        """
+        Return the normalized form of the DN, a tuple of RDN keys.
+        """
+        key = self._key
+        if key is None:
             rdns = self.rdns
-        return [[list(a) for a in rdn] for rdn in rdns]
+            if rdns:
+                key = (rdn_key(rdns[0]),) + tuple(
+                    _intern_rdn_key(rdn_key(rdn)) for rdn in rdns[1:])
+            else:
+                key = ()
+            self._key = key
+        return key
 
     def _rdns_from_value(self, value):
         if isinstance(value, six.string_types):
@@ -1122,7 +1175,8 @@ class DN(object):
             for rdn in rdns:
                 sort_avas(rdn)
         elif isinstance(value, DN):
-            rdns = value._copy_rdns()
+            # DN objects are immutable, their RDNs can be shared
+            rdns = value.rdns
         elif isinstance(value, (tuple, list, AVA)):
             ava = get_ava(value)
             rdns = [[ava]]
@@ -1149,14 +1203,23 @@ class DN(object):
             rdns.extend(rdn)
         return rdns
 
+    def __copy__(self):
+        return self
+
     def __deepcopy__(self, memo):
         return self
 
+    def __reduce__(self):
+        return (self.__class__, (self.ldap_text(),))
+
     def _get_rdn(self, rdn):
         return self.RDN_type(*rdn, **{'raw': True})
 
     def ldap_text(self):
-        return dn2str(self.rdns)
+        text = self._str
+        if text is None:
+            text = self._str = dn2str(self.rdns)
+        return text
 
     def x500_text(self):
         return dn2str(reversed(self.rdns))
@@ -1181,9 +1244,9 @@ class DN(object):
         if isinstance(key, six.integer_types):
             return self._get_rdn(self.rdns[key])
         if isinstance(key, slice):
-            cls = self.__class__
-            new_dn = cls.__new__(cls)
-            new_dn.rdns = self.rdns[key]
+            new_dn = self._from_rdns(self.rdns[key])
+            if self._key is not None:
+                new_dn._key = self._key[key]
             return new_dn
         elif isinstance(key, six.string_types):
             for rdn in self.rdns:
@@ -1196,19 +1259,15 @@ class DN(object):
                                 (key.__class__.__name__))
 
     def __hash__(self):
-        # Hash is computed from DN's string representation.
+        # Hash is computed from DN's normalized form.
         #
         # Because attrs & values are comparison case-insensitive the
         # hash value between two objects which compare as equal but
         # differ in case must yield the same hash value.
-
-        str_dn = ';,'.join([
-            '++'.join([
-                '=='.join((atype, avalue or ''))
-                for atype, avalue, _dummy in rdn
-            ]) for rdn in self.rdns
-        ])
-        return hash(str_dn.lower())
+        result = self._hash
+        if result is None:
+            result = self._hash = hash(self._get_key())
+        return result
 
     def __eq__(self, other):
         # Try coercing to DN, if successful compare to coerced object
@@ -1223,11 +1282,14 @@ class DN(object):
         if not isinstance(other, DN):
             return False
 
-        if len(self) != len(other):
+        if self is other:
+            return True
+
+        if len(self.rdns) != len(other.rdns):
             return False
 
         # Perform comparison between objects of same type
-        return self._cmp_sequence(other, 0, len(self)) == 0
+        return self._get_key() == other._get_key()
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -1239,18 +1301,11 @@ class DN(object):
         if len(self) != len(other):
             return len(self) < len(other)
 
-        return self._cmp_sequence(other, 0, len(self)) < 0
-
-    def _cmp_sequence(self, pattern, self_start, pat_len):
-        self_idx = self_start
-        pat_idx = 0
-        while pat_idx < pat_len:
-            r = cmp_rdns(self.rdns[self_idx], pattern.rdns[pat_idx])
-            if r != 0:
-                return r
-            self_idx += 1
-            pat_idx += 1
-        return 0
+        return self._get_key() < other._get_key()
+
+    def _match_sequence(self, pattern, self_start, pat_len):
+        return (self._get_key()[self_start:self_start + pat_len] ==
+                pattern._get_key()[:pat_len])
 
     def __add__(self, other):
         return self.__class__(self, other)
@@ -1317,7 +1372,7 @@ class DN(object):
                 start = end - pat_len
 
         if end-start >= pat_len:
-            return not self._cmp_sequence(pattern, start, pat_len)
+            return self._match_sequence(pattern, start, pat_len)
         return 0
 
 
@@ -1331,8 +1386,7 @@ class DN(object):
             end = len(self) - other_len
             i = 0
             while i <= end:
-                result = self._cmp_sequence(other, i, other_len)
-                if result == 0:
+                if self._match_sequence(other, i, other_len):
                     return True
                 i += 1
             return False
@@ -1366,8 +1420,7 @@ class DN(object):
         stop = max(start, end - pat_len)
 
         while i <= stop:
-            result = self._cmp_sequence(pattern, i, pat_len)
-            if result == 0:
+            if self._match_sequence(pattern, i, pat_len):
                 return i
             i += 1
         return -1
@@ -1409,8 +1462,7 @@ class DN(object):
         stop = start
 
         while i >= stop:
-            result = self._cmp_sequence(pattern, i, pat_len)
-            if result == 0:
+            if self._match_sequence(pattern, i, pat_len):
                 return i
             i -= 1
         return -1
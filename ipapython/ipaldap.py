@@ -37,10 +37,12 @@ import ldap
 import ldap.sasl
 import ldap.filter
 from ldap.controls import SimplePagedResultsControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.controls.vlv import VLVRequestControl, VLVResponseControl
 import six
 
 # pylint: disable=ipa-forbidden-import
-from ipalib import errors, _
+from ipalib import errors, perf, _
 from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT
 # pylint: enable=ipa-forbidden-import
 from ipapython.ipautil import format_netloc, CIDict
@@ -72,6 +74,31 @@ TRUNCATED_ADMIN_LIMIT = object()
 DIRMAN_DN = DN(('cn', 'directory manager'))
 
 
+def _decode_bytes(val):
+    return val
+
+
+def _decode_unicode(val):
+    return val.decode('utf-8')
+
+
+def _decode_datetime(val):
+    return datetime.datetime.strptime(
+        val.decode('utf-8'), LDAP_GENERALIZED_TIME_FORMAT)
+
+
+def _decode_dnsname(val):
+    return DNSName.from_text(val.decode('utf-8'))
+
+
+def _decode_dn(val):
+    return DN(val.decode('utf-8'))
+
+
+def _decode_principal(val):
+    return Principal(val.decode('utf-8'))
+
+
 class _ServerSchema(object):
     '''
     Properties of a schema retrieved from an LDAP server.
@@ -275,6 +302,21 @@ class LDAPEntry(collections.MutableMapping):
         if nice == nice_sync and raw == raw_sync:
             return
 
+        if (not nice and not nice_sync and not raw_sync and
+                len(set(raw)) == len(raw)):
+            # values were only set in raw form, which is the case for all
+            # entries read from LDAP; decode them all at once
+            try:
+                nice.extend(self._conn.decode(raw, name))
+            except ValueError as e:
+                raise ValueError("{error} in LDAP entry '{dn}'".format(
+                    error=e, dn=self._dn))
+            # decoded values are immutable, no need to deep copy them
+            self._sync[name] = (list(nice), list(raw))
+            if len(nice) > 1:
+                self._not_list.discard(name)
+            return
+
         nice_adds = set(nice) - set(nice_sync)
         nice_dels = set(nice_sync) - set(nice)
         raw_adds = set(raw) - set(raw_sync)
@@ -682,6 +724,17 @@ class LDAPClient(object):
         'nsslapd-minssf-exclude-rootdse': True,
     })
 
+    # functions decoding a single raw value to the given attribute type,
+    # any other type is called with the raw value
+    _DECODERS = {
+        bytes: _decode_bytes,
+        unicode: _decode_unicode,
+        datetime.datetime: _decode_datetime,
+        DNSName: _decode_dnsname,
+        DN: _decode_dn,
+        Principal: _decode_principal,
+    }
+
     time_limit = -1.0   # unlimited
     size_limit = 0      # unlimited
 
@@ -724,6 +777,7 @@ class LDAPClient(object):
         self.log = log_mgr.get_logger(self)
         self._has_schema = False
         self._schema = None
+        self._reset_attribute_types(None)
 
         self._conn = self._connect()
 
@@ -757,8 +811,26 @@ class LDAPClient(object):
             object.__setattr__(self, '_schema', schema)
             object.__setattr__(self, '_has_schema', True)
 
+            if schema is not self._attribute_types_schema:
+                self._reset_attribute_types(schema)
+
         return self._schema
 
+    def _reset_attribute_types(self, schema):
+        '''
+        Forget the attribute types and decoders looked up in the schema.
+
+        The lookups are kept across schema flushes for as long as the schema
+        cache returns the same schema, so that each attribute is looked up
+        only once per schema.
+        '''
+        # bypass ldap2's locking
+        object.__setattr__(self, '_attribute_types_schema', schema)
+        # lowercase attribute name -> Python type
+        object.__setattr__(self, '_attribute_types', {})
+        # lowercase attribute name -> function decoding a single value
+        object.__setattr__(self, '_decoders', {})
+
     def _flush_schema(self):
         '''
         Force this instance to forget it's cached schema and reacquire
@@ -796,6 +868,21 @@ class LDAPClient(object):
             if isinstance(name_or_oid, unicode):
                 name_or_oid = name_or_oid.encode('utf-8')
 
+        # make sure the cached lookups belong to the current schema
+        if not self._has_schema and self._attribute_types:
+            self._get_schema()
+
+        key = name_or_oid.lower()
+        try:
+            return self._attribute_types[key]
+        except KeyError:
+            pass
+
+        attr_type = self._lookup_attribute_type(name_or_oid)
+        self._attribute_types[key] = attr_type
+        return attr_type
+
+    def _lookup_attribute_type(self, name_or_oid):
         # Is this a special case attribute?
         if name_or_oid in self._SYNTAX_OVERRIDE:
             return self._SYNTAX_OVERRIDE[name_or_oid]
@@ -874,31 +961,47 @@ class LDAPClient(object):
         else:
             raise TypeError("attempt to pass unsupported type to ldap, value=%s type=%s" %(val, type(val)))
 
+    def _get_decoder(self, attr):
+        """
+        Return a function decoding a single LDAP value (str) of attribute
+        attr to its Python type.
+        """
+        if six.PY2 and isinstance(attr, unicode):
+            attr = attr.encode('utf-8')
+
+        key = attr.lower()
+        try:
+            return self._decoders[key]
+        except KeyError:
+            pass
+
+        target_type = self.get_attribute_type(attr)
+        decoder = self._DECODERS.get(target_type, target_type)
+        self._decoders[key] = decoder
+        return decoder
+
     def decode(self, val, attr):
         """
         Decode attribute value from LDAP representation (str).
         """
         if isinstance(val, bytes):
-            target_type = self.get_attribute_type(attr)
+            decoder = self._get_decoder(attr)
             try:
-                if target_type is bytes:
-                    return val
-                elif target_type is unicode:
-                    return val.decode('utf-8')
-                elif target_type is datetime.datetime:
-                    return datetime.datetime.strptime(
-                        val.decode('utf-8'), LDAP_GENERALIZED_TIME_FORMAT)
-                elif target_type is DNSName:
-                    return DNSName.from_text(val.decode('utf-8'))
-                elif target_type in (DN, Principal):
-                    return target_type(val.decode('utf-8'))
-                else:
-                    return target_type(val)
+                return decoder(val)
             except Exception:
+                target_type = self.get_attribute_type(attr)
                 msg = 'unable to convert the attribute %r value %r to type %s' % (attr, val, target_type)
                 self.log.error(msg)
                 raise ValueError(msg)
         elif isinstance(val, list):
+            if all(isinstance(m, bytes) for m in val):
+                # decode all values with a single decoder lookup
+                decoder = self._get_decoder(attr)
+                try:
+                    return [decoder(m) for m in val]
+                except Exception:
+                    # find the offending value and report it
+                    pass
             return [self.decode(m, attr) for m in val]
         elif isinstance(val, tuple):
             return tuple(self.decode(m, attr) for m in val)
@@ -924,30 +1027,37 @@ class LDAPClient(object):
         '''
 
         ipa_result = []
-        for dn_tuple in result:
-            original_dn = dn_tuple[0]
-            original_attrs = dn_tuple[1]
+        for original_dn, original_attrs in result:
+            ipa_entry = self._convert_entry(original_dn, original_attrs)
+            if ipa_entry is not None:
+                ipa_result.append(ipa_entry)
 
-            # original_dn is None if referral instead of an entry was
-            # returned from the LDAP server, we need to skip this item
-            if original_dn is None:
-                log_msg = 'Referral entry ignored: {ref}'\
-                          .format(ref=str(original_attrs))
-                self.log.debug(log_msg)
+        if _debug_log_ldap:
+            self.log.debug('ldap.result: %s', ipa_result)
+        return ipa_result
 
-                continue
+    def _convert_entry(self, original_dn, original_attrs):
+        '''
+        Convert a single python-ldap result item to an LDAPEntry object.
 
-            ipa_entry = LDAPEntry(self, DN(original_dn))
+        Returns None if the item is a referral rather than an entry.
+        '''
+        # original_dn is None if referral instead of an entry was
+        # returned from the LDAP server, we need to skip this item
+        if original_dn is None:
+            log_msg = 'Referral entry ignored: {ref}'\
+                      .format(ref=str(original_attrs))
+            self.log.debug(log_msg)
 
-            for attr, original_values in original_attrs.items():
-                ipa_entry.raw[attr] = original_values
-            ipa_entry.reset_modlist()
+            return None
 
-            ipa_result.append(ipa_entry)
+        ipa_entry = LDAPEntry(self, DN(original_dn))
 
-        if _debug_log_ldap:
-            self.log.debug('ldap.result: %s', ipa_result)
-        return ipa_result
+        for attr, original_values in original_attrs.items():
+            ipa_entry.raw[attr] = original_values
+        ipa_entry.reset_modlist()
+
+        return ipa_entry
 
     @contextlib.contextmanager
     def error_handler(self, arg_desc=None):
@@ -1328,7 +1438,8 @@ class LDAPClient(object):
 
     def find_entries(self, filter=None, attrs_list=None, base_dn=None,
                      scope=ldap.SCOPE_SUBTREE, time_limit=None,
-                     size_limit=None, paged_search=False):
+                     size_limit=None, paged_search=False, sort_by=None,
+                     offset=None, limit=None):
         """
         Return a list of entries and indication of whether the results were
         truncated ([(dn, entry_attrs)], truncated) matching specified search
@@ -1343,17 +1454,74 @@ class LDAPClient(object):
         size_limit -- size (number of entries returned) limit
             (default unlimited)
         paged_search -- search using paged results control
+        sort_by -- list of attributes the server sorts the entries by, using
+            the server side sort control; prefix an attribute with '-' to
+            sort in descending order
+        offset -- index of the first sorted entry to return, using the
+            virtual list view control (requires sort_by)
+        limit -- maximum number of sorted entries to return from offset,
+            using the virtual list view control (requires sort_by)
 
         :raises: errors.NotFound if result set is empty
                                  or base_dn doesn't exist
         """
+        res = []
+        truncated = False
+
+        for entry in self._search_iter(filter, attrs_list, base_dn, scope,
+                                       time_limit, size_limit, paged_search,
+                                       sort_by, offset, limit):
+            if isinstance(entry, LDAPEntry):
+                res.append(entry)
+            else:
+                truncated = entry
+
+        if not res and not truncated:
+            raise errors.EmptyResult(reason='no matching entry found')
+
+        return (res, truncated)
+
+    def iter_entries(self, filter=None, attrs_list=None, base_dn=None,
+                     scope=ldap.SCOPE_SUBTREE, time_limit=None,
+                     size_limit=None, paged_search=False, sort_by=None,
+                     offset=None, limit=None):
+        """
+        Return a generator of entries matching specified search parameters.
+
+        Unlike find_entries, entries are converted and yielded one by one as
+        they are received from the server, and the next page of a paged
+        search is only requested once the previous page was consumed, so
+        the whole result set is never held in memory. Closing the generator
+        before it is exhausted abandons the search.
+
+        An empty result set yields no entries. The keyword arguments are the
+        same as for find_entries.
+
+        :raises: errors.LimitsExceeded if the result set is truncated by the
+                 server, after all received entries were yielded
+        :raises: errors.NotFound if base_dn doesn't exist
+        """
+        for entry in self._search_iter(filter, attrs_list, base_dn, scope,
+                                       time_limit, size_limit, paged_search,
+                                       sort_by, offset, limit):
+            if not isinstance(entry, LDAPEntry):
+                self.handle_truncated_result(entry)
+            yield entry
+
+    def _search_iter(self, filter, attrs_list, base_dn, scope, time_limit,
+                     size_limit, paged_search, sort_by=None, offset=None,
+                     limit=None):
+        """
+        Perform the search and yield LDAPEntry objects as they arrive.
+
+        If the search hits a server limit, the last item yielded is the
+        truncated flag (see find_entries) instead of an entry.
+        """
         if base_dn is None:
             base_dn = DN()
         assert isinstance(base_dn, DN)
         if not filter:
             filter = '(objectClass=*)'
-        res = []
-        truncated = False
 
         if time_limit is None:
             time_limit = self.time_limit
@@ -1377,6 +1545,18 @@ class LDAPClient(object):
         if page_size == 0:
             paged_search = False
 
+        sort_ctrls = self._make_sort_controls(
+            sort_by, offset, limit, size_limit)
+        vlv = offset is not None or limit is not None
+        if vlv:
+            # the virtual list view cannot be combined with paged results
+            paged_search = False
+        # the page is capped at the size limit, see _make_sort_controls
+        vlv_capped = vlv and 0 < size_limit and (
+            not limit or size_limit < limit)
+
+        stats = perf.get_stats()
+
         # pass arguments to python-ldap
         with self.error_handler():
             if six.PY2:
@@ -1384,23 +1564,58 @@ class LDAPClient(object):
                 attrs_list = self.encode(attrs_list)
 
             while True:
+                sctrls = list(sort_ctrls) or None
                 if paged_search:
-                    sctrls = [SimplePagedResultsControl(0, page_size, cookie)]
+                    sctrls = sort_ctrls + [
+                        SimplePagedResultsControl(0, page_size, cookie)]
 
+                msgid = None
+                page = []
                 try:
-                    id = self.conn.search_ext(
+                    if stats is not None:
+                        start = time.time()
+                    msgid = self.conn.search_ext(
                         str(base_dn), scope, filter, attrs_list,
                         serverctrls=sctrls, timeout=time_limit,
                         sizelimit=size_limit
                     )
                     while True:
-                        result = self.conn.result3(id, 0)
+                        result = self.conn.result3(msgid, 0)
                         objtype, res_list, _res_id, res_ctrls = result
+                        if stats is not None:
+                            self._count_result(stats, start, res_list)
                         if objtype == ldap.RES_SEARCH_RESULT:
+                            msgid = None
                             break
-                        res_list = self._convert_result(res_list)
-                        if res_list:
-                            res.append(res_list[0])
+                        for original_dn, original_attrs in res_list:
+                            entry = self._convert_entry(original_dn,
+                                                        original_attrs)
+                            if entry is None:
+                                continue
+                            if _debug_log_ldap:
+                                self.log.debug('ldap.result: %s', entry)
+                            if vlv:
+                                # the page is only valid once the response
+                                # control was checked
+                                page.append(entry)
+                            else:
+                                yield entry
+                        if stats is not None:
+                            start = time.time()
+
+                    if vlv:
+                        page, content_count = self._check_vlv_page(
+                            page, offset, res_ctrls)
+                        for entry in page:
+                            yield entry
+                        # a capped page left out the rest of the requested
+                        # entries if there are entries after it
+                        if (vlv_capped and
+                                (offset or 0) + len(page) < content_count):
+                            yield TRUNCATED_SIZE_LIMIT
+
+                    if stats is not None:
+                        stats.counters['ldap_searches'] += 1
 
                     if paged_search:
                         # Get cookie for the next page
@@ -1410,43 +1625,131 @@ class LDAPClient(object):
                                 break
                         else:
                             cookie = ''
+                except GeneratorExit:
+                    # the consumer is not interested in the rest of the
+                    # results, stop the server from sending them
+                    if msgid is not None:
+                        try:
+                            self.conn.abandon(msgid)
+                        except ldap.LDAPError as e:
+                            self.log.warning("Error abandoning search: %s", e)
+                    if paged_search and cookie:
+                        self._cancel_paged_search(
+                            base_dn, scope, filter, attrs_list, time_limit,
+                            size_limit, cookie)
+                    raise
                 except ldap.ADMINLIMIT_EXCEEDED:
-                    truncated = TRUNCATED_ADMIN_LIMIT
+                    for entry in page:
+                        yield entry
+                    yield TRUNCATED_ADMIN_LIMIT
                     break
                 except ldap.SIZELIMIT_EXCEEDED:
-                    truncated = TRUNCATED_SIZE_LIMIT
+                    for entry in page:
+                        yield entry
+                    yield TRUNCATED_SIZE_LIMIT
                     break
                 except ldap.TIMELIMIT_EXCEEDED:
-                    truncated = TRUNCATED_TIME_LIMIT
+                    for entry in page:
+                        yield entry
+                    yield TRUNCATED_TIME_LIMIT
                     break
                 except ldap.LDAPError as e:
                     # If paged search is in progress, try to cancel it
                     if paged_search and cookie:
-                        sctrls = [SimplePagedResultsControl(0, 0, cookie)]
-                        try:
-                            self.conn.search_ext_s(
-                                str(base_dn), scope, filter, attrs_list,
-                                serverctrls=sctrls, timeout=time_limit,
-                                sizelimit=size_limit)
-                        except ldap.LDAPError as e:
-                            self.log.warning(
-                                "Error cancelling paged search: %s", e)
+                        self._cancel_paged_search(
+                            base_dn, scope, filter, attrs_list, time_limit,
+                            size_limit, cookie)
                         cookie = ''
 
                     try:
                         raise e
                     except (ldap.ADMINLIMIT_EXCEEDED, ldap.TIMELIMIT_EXCEEDED,
                             ldap.SIZELIMIT_EXCEEDED):
-                        truncated = True
+                        yield True
                         break
 
                 if not paged_search or not cookie:
                     break
 
-        if not res and not truncated:
-            raise errors.EmptyResult(reason='no matching entry found')
+    @staticmethod
+    def _make_sort_controls(sort_by, offset, limit, size_limit):
+        """
+        Return the server side sort and virtual list view request controls
+        for a search, see find_entries.
+        """
+        ctrls = []
+        if sort_by:
+            ctrls.append(SSSRequestControl(
+                criticality=True, ordering_rules=list(sort_by)))
+        if offset is None and limit is None:
+            return ctrls
+
+        if not sort_by:
+            raise ValueError("virtual list view requires sort_by")
+        if offset is None:
+            offset = 0
+        if not limit or 0 < size_limit < limit:
+            # a page larger than the size limit would make the server fail
+            # the whole search
+            limit = size_limit
+        if limit <= 0:
+            # up to the end of the list
+            limit = 2 ** 31 - 1
+        # VLV offsets are 1-based, a content count of 0 tells the server to
+        # use the offset as is
+        ctrls.append(VLVRequestControl(
+            criticality=True, before_count=0, after_count=limit - 1,
+            offset=offset + 1, content_count=0))
+        return ctrls
 
-        return (res, truncated)
+    @staticmethod
+    def _check_vlv_page(page, offset, res_ctrls):
+        """
+        Return the entries of a virtual list view page received in response
+        to a search from *offset* and the number of entries in the list.
+        """
+        for ctrl in res_ctrls:
+            if isinstance(ctrl, VLVResponseControl):
+                break
+        else:
+            raise errors.DatabaseError(
+                desc=u"Virtual list view not supported", info=u'')
+        if ctrl.result:
+            raise errors.DatabaseError(
+                desc=u"Virtual list view failed",
+                info=u"result code %d" % ctrl.result)
+        # an offset past the end of the list selects its last entry
+        if offset and offset >= ctrl.content_count:
+            return [], ctrl.content_count
+        return page, ctrl.content_count
+
+    @staticmethod
+    def _count_result(stats, start, res_list):
+        """
+        Add the time since *start* and the size of search results
+        *res_list* to the performance counters of the request.
+        """
+        counters = stats.counters
+        counters['ldap_seconds'] += time.time() - start
+        for dn, attrs in res_list:
+            if dn is None:
+                # search reference
+                continue
+            counters['ldap_entries'] += 1
+            counters['ldap_bytes'] += sum(
+                len(v) for values in attrs.values() for v in values)
+
+    def _cancel_paged_search(self, base_dn, scope, filter, attrs_list,
+                             time_limit, size_limit, cookie):
+        sctrls = [SimplePagedResultsControl(0, 0, cookie)]
+        try:
+            self.conn.search_ext_s(
+                str(base_dn), scope, filter, attrs_list,
+                serverctrls=sctrls, timeout=time_limit,
+                sizelimit=size_limit)
+        except ldap.LDAPError as e:
+            self.log.warning(
+                "Error cancelling paged search: %s", e)
 
     def find_entry_by_attr(self, attr, value, object_class, attrs_list=None,
                            base_dn=None):
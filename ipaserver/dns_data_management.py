@@ -6,7 +6,6 @@ from __future__ import absolute_import
 
 import six
 
-from collections import defaultdict
 from dns import (
     rdata,
     rdataclass,
@@ -14,11 +13,13 @@ from dns import (
     zone,
 )
 from dns.exception import DNSException
+from dns.node import Node
 
 from time import sleep, time
 
 from ipalib import errors
 from ipalib.dns import record_name_format
+from ipapython.dn import DN
 from ipapython.dnsutil import DNSName, resolve_rrsets
 from ipapython.ipa_log_manager import root_logger
 
@@ -52,6 +53,8 @@ IPA_DEFAULT_NTP_SRV_REC = (
     (DNSName("_ntp._udp"), 123),
 )
 
+CNAME_TEMPLATE_ATTR = 'idnsTemplateAttribute;cnamerecord'
+
 
 class IPADomainIsNotManagedByIPAError(Exception):
     pass
@@ -254,53 +257,163 @@ class IPASystemRecords(object):
 
         return zone_obj
 
-    def __prepare_records_update_dict(self, node):
-        update_dict = defaultdict(list)
-        for rdataset in node:
-            for rdata in rdataset:
-                option_name = (record_name_format % rdatatype.to_text(
-                    rdata.rdtype).lower())
-                update_dict[option_name].append(unicode(rdata.to_text()))
-        return update_dict
-
-    def __update_dns_records(
-            self, record_name, nodes, set_cname_template=True
-    ):
-        update_dict = self.__prepare_records_update_dict(nodes)
-        cname_template = {
-            'addattr': [u'objectclass=idnsTemplateObject'],
-            'setattr': [
-                u'idnsTemplateAttribute;cnamerecord=%s'
-                u'.\{substitutionvariable_ipalocation\}._locations' %
-                record_name.relativize(self.domain_abs)
-            ]
-        }
+    def __get_cname_template(self, record_name):
+        return (u'%s.\{substitutionvariable_ipalocation\}._locations' %
+                record_name.relativize(self.domain_abs))
+
+    def __check_domain_managed(self):
         try:
-            if set_cname_template:
-                # only srv records should have configured cname templates
-                update_dict.update(cname_template)
-            self.api_instance.Command.dnsrecord_mod(
-                self.domain_abs, record_name,
-                **update_dict
-            )
+            self.api_instance.Command.dnszone_show(self.domain_abs)
         except errors.NotFound:
-            # because internal API magic, addattr and setattr doesn't work with
-            # dnsrecord-add well, use dnsrecord-mod instead later
-            update_dict.pop('addattr', None)
-            update_dict.pop('setattr', None)
+            raise IPADomainIsNotManagedByIPAError()
 
-            self.api_instance.Command.dnsrecord_add(
-                self.domain_abs, record_name, **update_dict)
+    def __get_current_entries(self, zone_obj):
+        """
+        Read entries of all record names in zone_obj with a single search
+        :return: (zone DN, {record_name: LDAPEntry, ...})
+        """
+        ldap = self.api_instance.Backend.ldap2
+        zone_dn = self.api_instance.Object.dnszone.get_dn(self.domain_abs)
+
+        names = [name.relativize(self.domain_abs).ToASCII()
+                 for name in zone_obj.keys()]
+        attrs = set(
+            record_name_format % rdatatype.to_text(rdataset.rdtype).lower()
+            for node in zone_obj.values() for rdataset in node)
+        if not names:
+            return zone_dn, {}
+
+        try:
+            entries, _truncated = ldap.find_entries(
+                filter=ldap.make_filter({'idnsname': names}),
+                attrs_list=['objectclass', 'idnsname',
+                            'idnsTemplateAttribute'] + sorted(attrs),
+                base_dn=zone_dn,
+                scope=ldap.SCOPE_ONELEVEL,
+                time_limit=0,
+                size_limit=0)
+        except errors.NotFound:
+            entries = []
+
+        return zone_dn, {
+            entry.single_value['idnsname'].derelativize(self.domain_abs):
+            entry
+            for entry in entries
+        }
 
-            if set_cname_template:
+    def __diff_node(self, node, entry):
+        """
+        Compare records of node with records stored in entry (or None)
+        :return: (update_dict, added, removed) where update_dict maps
+        record attributes to their new values, and added and removed are
+        dns.node.Node objects with records which are added and removed
+        """
+        update_dict = {}
+        added = Node()
+        removed = Node()
+        for rdataset in node:
+            option_name = (record_name_format % rdatatype.to_text(
+                rdataset.rdtype).lower())
+
+            current = set()
+            invalid = False
+            values = entry.get(option_name, []) if entry is not None else []
+            for value in values:
                 try:
-                    self.api_instance.Command.dnsrecord_mod(
-                        self.domain_abs,
-                        record_name, **cname_template)
-                except errors.EmptyModlist:
-                    pass
-        except errors.EmptyModlist:
-            pass
+                    current.add(rdata.from_text(
+                        rdataclass.IN, rdataset.rdtype, value))
+                except DNSException:
+                    invalid = True
+
+            desired = set(rdataset)
+            if desired == current and not invalid:
+                continue
+
+            param = self.api_instance.Object.dnsrecord.params[option_name]
+            update_dict[option_name] = list(param.normalize(
+                tuple(unicode(rd.to_text()) for rd in rdataset)))
+            for rd in desired - current:
+                added.find_rdataset(
+                    rd.rdclass, rd.rdtype, create=True).add(
+                        rd, ttl=rdataset.ttl)
+            for rd in current - desired:
+                removed.find_rdataset(
+                    rd.rdclass, rd.rdtype, create=True).add(
+                        rd, ttl=rdataset.ttl)
+        return update_dict, added, removed
+
+    def __update_dns_records(self, zone_obj, names_requiring_cname_templates):
+        """
+        Write records of zone_obj which differ from records in LDAP.
+
+        Only record types present in zone_obj are replaced, other records
+        of the same names are kept.
+        """
+        ldap = self.api_instance.Backend.ldap2
+        fail = []
+        success = []
+
+        zone_dn, entries = self.__get_current_entries(zone_obj)
+        for record_name, node in zone_obj.items():
+            entry = entries.get(record_name)
+            update_dict, _added, _removed = self.__diff_node(node, entry)
+
+            # only srv records should have configured cname templates
+            if record_name in names_requiring_cname_templates:
+                cname_template = self.__get_cname_template(record_name)
+                objectclasses = [] if entry is None else [
+                    o.lower() for o in entry.get('objectclass', [])]
+                if 'idnstemplateobject' not in objectclasses:
+                    update_dict['objectclass'] = (
+                        entry.get('objectclass', []) if entry is not None
+                        else [u'top', u'idnsrecord']
+                    ) + [u'idnsTemplateObject']
+                if (entry is None or
+                        entry.get(CNAME_TEMPLATE_ATTR) != [cname_template]):
+                    update_dict[CNAME_TEMPLATE_ATTR] = [cname_template]
+
+            if not update_dict:
+                success.append((record_name, node))
+                continue
+
+            try:
+                if entry is None:
+                    relative_name = record_name.relativize(self.domain_abs)
+                    entry = ldap.make_entry(
+                        DN(('idnsname', relative_name.ToASCII()), zone_dn),
+                        objectclass=[u'top', u'idnsrecord'],
+                        idnsname=[relative_name],
+                    )
+                    entry.update(update_dict)
+                    ldap.add_entry(entry)
+                else:
+                    entry.update(update_dict)
+                    ldap.update_entry(entry)
+            except errors.PublicError as e:
+                fail.append((record_name, node, e))
+            else:
+                success.append((record_name, node))
+        return success, fail
+
+    def diff_records(self, zone_obj):
+        """
+        Compare records generated by get_base_records or
+        get_locations_records with records stored in LDAP
+        :return: [(record_name, added, removed), ...] for record names whose
+        records differ, added and removed are dns.node.Node objects
+        :raise IPADomainIsNotManagedByIPAError: if IPA domain is not managed by
+        IPA DNS
+        """
+        self.__check_domain_managed()
+
+        result = []
+        _zone_dn, entries = self.__get_current_entries(zone_obj)
+        for record_name, node in zone_obj.items():
+            update_dict, added, removed = self.__diff_node(
+                node, entries.get(record_name))
+            if update_dict:
+                result.append((record_name, added, removed))
+        return result
 
     def get_base_records(
             self, servers=None, roles=None, include_master_role=True,
@@ -363,8 +476,6 @@ class IPASystemRecords(object):
         where the first list contains successfully updated records, and the
         second list contains failed updates with particular exceptions
         """
-        fail = []
-        success = []
         names_requiring_cname_templates = set(
             rec[0].derelativize(self.domain_abs) for rec in (
                 IPA_DEFAULT_MASTER_SRV_REC +
@@ -373,17 +484,8 @@ class IPASystemRecords(object):
             )
         )
 
-        base_zone = self.get_base_records()
-        for record_name, node in base_zone.items():
-            set_cname_template = record_name in names_requiring_cname_templates
-            try:
-                self.__update_dns_records(
-                    record_name, node, set_cname_template)
-            except errors.PublicError as e:
-                fail.append((record_name, node, e))
-            else:
-                success.append((record_name, node))
-        return success, fail
+        return self.__update_dns_records(
+            self.get_base_records(), names_requiring_cname_templates)
 
     def update_locations_records(self):
         """
@@ -392,20 +494,8 @@ class IPASystemRecords(object):
         where the first list contains successfully updated records, and the
         second list contains failed updates with particular exceptions
         """
-        fail = []
-        success = []
-
-        location_zone = self.get_locations_records()
-        for record_name, nodes in location_zone.items():
-            try:
-                self.__update_dns_records(
-                    record_name, nodes,
-                    set_cname_template=False)
-            except errors.PublicError as e:
-                fail.append((record_name, nodes, e))
-            else:
-                success.append((record_name, nodes))
-        return success, fail
+        return self.__update_dns_records(
+            self.get_locations_records(), ())
 
     def update_dns_records(self):
         """
@@ -416,10 +506,7 @@ class IPASystemRecords(object):
         :raise IPADomainIsNotManagedByIPAError: if IPA domain is not managed by
         IPA DNS
         """
-        try:
-            self.api_instance.Command.dnszone_show(self.domain_abs)
-        except errors.NotFound:
-            raise IPADomainIsNotManagedByIPAError()
+        self.__check_domain_managed()
 
         return (
             self.update_base_records(),
@@ -477,6 +564,20 @@ class IPASystemRecords(object):
                 )
         return records
 
+    @classmethod
+    def records_list_from_diff(cls, diff):
+        """
+        Format result of diff_records as records prefixed with "-" if they
+        are removed and with "+" if they are added
+        """
+        records = []
+        for name, added, removed in diff:
+            records.extend(
+                u'-%s' % r for r in cls.records_list_from_node(name, removed))
+            records.extend(
+                u'+%s' % r for r in cls.records_list_from_node(name, added))
+        return records
+
     @classmethod
     def records_list_from_zone(cls, zone_obj, sort=True):
         records = []
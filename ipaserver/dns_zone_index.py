@@ -0,0 +1,204 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+In-memory index of DNS zones and delegations stored in LDAP
+"""
+
+from __future__ import absolute_import
+
+from ipapython.dnsutil import DNSName
+from ipaserver.plugins.ldap2 import SyncreplCache
+
+ZONE = 'zone'
+FORWARD_ZONE = 'forwardzone'
+DELEGATION = 'delegation'
+
+
+class _Node(object):
+    __slots__ = ('children', 'entries')
+
+    def __init__(self):
+        # label -> _Node
+        self.children = {}
+        # uuid -> (kind, name, zone, record name)
+        self.entries = {}
+
+
+def _labels(name):
+    """Return lower-cased labels of absolute *name*, from the root down."""
+    return [label.lower() for label in reversed(name.labels) if label]
+
+
+class DNSZoneIndex(SyncreplCache):
+    """
+    In-memory suffix trie of the DNS zones below a DNS container.
+
+    Every node of the trie is a DNS label. Nodes hold the active master
+    zones, the active forward zones and the NS delegations (records with
+    NS values other than in zone apex) of their name, so that the
+    authoritative zone, the deepest delegation and the forward zones
+    below a name are found by walking the labels of the name.
+
+    Only zone entries and record entries with NS values are synchronized,
+    a record which loses its last NS value leaves the search scope and is
+    reported as deleted.
+    """
+
+    attrlist = ['objectClass', 'idnsName', 'idnsZoneActive', 'nsRecord']
+    filterstr = ('(|(objectClass=idnsZone)(objectClass=idnsForwardZone)'
+                 '(&(objectClass=idnsRecord)(nsRecord=*)))')
+
+    def _clear(self):
+        self._root = _Node()
+
+    def _walk(self, name):
+        """Yield (depth, node) for every existing node on the path to name."""
+        node = self._root
+        yield 0, node
+        for depth, label in enumerate(_labels(name), 1):
+            node = node.children.get(label)
+            if node is None:
+                return
+            yield depth, node
+
+    def _find(self, name):
+        """Return the node of absolute name, or None."""
+        node = self._root
+        for label in _labels(name):
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def get_auth_zone(self, name):
+        """
+        Return the active master zone which is authoritative for *name*,
+        or None.
+        """
+        assert isinstance(name, DNSName)
+        with self.lock:
+            result = None
+            for _depth, node in self._walk(name.make_absolute()):
+                for kind, zone_name, _zone, _record in node.entries.values():
+                    if kind == ZONE:
+                        result = zone_name
+            return result
+
+    def get_ns_delegation(self, zone, name):
+        """
+        Return the name of the deepest delegation for *name* in *zone*,
+        relative to the zone, or None.
+
+        NS records in zone apex are not considered delegations.
+        """
+        assert isinstance(zone, DNSName)
+        assert isinstance(name, DNSName)
+        zone = zone.make_absolute()
+        if not name.is_absolute():
+            name = name.derelativize(zone)
+        if not name.is_subdomain(zone) or name == zone:
+            return None
+
+        zone_depth = len(_labels(zone))
+        with self.lock:
+            result = None
+            for depth, node in self._walk(name):
+                if depth <= zone_depth:
+                    continue
+                for kind, _name, record_zone, record in node.entries.values():
+                    if kind == DELEGATION and record_zone == zone:
+                        result = record
+            return result
+
+    def find_forward_zones(self, name, child_zones_only=False):
+        """
+        Return names of the active forward zone *name* and of all active
+        forward zones below it.
+
+        :param child_zones_only: do not include zone *name* itself
+        """
+        assert isinstance(name, DNSName)
+        with self.lock:
+            start = self._find(name.make_absolute())
+            if start is None:
+                return []
+
+            result = []
+            todo = [(start, child_zones_only)]
+            while todo:
+                node, skip = todo.pop()
+                todo.extend((child, False) for child in node.children.values())
+                if skip:
+                    continue
+                result.extend(
+                    zone_name
+                    for kind, zone_name, _zone, _record
+                    in node.entries.values() if kind == FORWARD_ZONE)
+            return result
+
+    def _parse(self, dn, attributes):
+        """Return (kind, absolute name, zone, record name) of entry or None."""
+        if not dn.endswith(self.base_dn) or dn == self.base_dn:
+            return None
+        rdns = dn[:len(dn) - len(self.base_dn)]
+        if any(rdn.attr.lower() != 'idnsname' for rdn in rdns):
+            return None
+
+        attributes = {k.lower(): v for k, v in attributes.items()}
+        objectclasses = {v.decode('utf-8').lower()
+                         for v in attributes.get('objectclass', ())}
+
+        if len(rdns) == 1:
+            active = attributes.get('idnszoneactive', [b''])[0]
+            if active.upper() != b'TRUE':
+                return None
+            if 'idnszone' in objectclasses:
+                kind = ZONE
+            elif 'idnsforwardzone' in objectclasses:
+                kind = FORWARD_ZONE
+            else:
+                return None
+            zone_name = DNSName(rdns[0].value).make_absolute()
+            return kind, zone_name, zone_name, None
+        elif len(rdns) == 2 and attributes.get('nsrecord'):
+            zone = DNSName(rdns[1].value).make_absolute()
+            record = DNSName(rdns[0].value)
+            # only relative names are records of the zone, see
+            # _get_longest_match_ns_delegation_ldap
+            if record.is_absolute() or record.is_empty():
+                return None
+            return DELEGATION, record.derelativize(zone), zone, record
+
+        return None
+
+    def _add(self, uuid, dn, attributes):
+        self._remove(uuid)
+
+        value = self._parse(dn, attributes)
+        if value is None:
+            return
+
+        node = self._root
+        for label in _labels(value[1]):
+            node = node.children.setdefault(label, _Node())
+        node.entries[uuid] = value
+        self._uuids[uuid] = value[1]
+
+    def _remove(self, uuid):
+        name = self._uuids.pop(uuid, None)
+        if name is None:
+            return
+
+        path = [self._root]
+        labels = _labels(name)
+        for label in labels:
+            path.append(path[-1].children[label])
+        del path[-1].entries[uuid]
+
+        # prune nodes which hold nothing
+        for i in range(len(labels), 0, -1):
+            if path[i].entries or path[i].children:
+                break
+            del path[i - 1].children[labels[i - 1]]
@@ -5,9 +5,12 @@
 from datetime import datetime
 import dns.name
 import errno
+import hashlib
 import os
-import shutil
 import stat
+import threading
+
+from six.moves import queue
 
 import ipalib.constants
 from ipapython.dn import DN
@@ -23,6 +26,15 @@ time_bindfmt = '%Y%m%d%H%M%S'
 FILE_PERM = (stat.S_IRUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IWUSR)
 DIR_PERM = (stat.S_IRWXU | stat.S_IRWXG)
 
+# attributes used by dnssec-keyfromlabel, a key is re-installed only if any
+# of them changes
+KEY_METADATA_ATTRS = ('idnsseckeyzone', 'idnsseckeyref', 'idnssecalgorithm',
+                      'idnsseckeypublish', 'idnsseckeyactivate',
+                      'idnsseckeyinactive', 'idnsseckeydelete',
+                      'idnsseckeysep', 'idnsseckeyrevoke')
+# files produced for a single key by install_key()
+KEY_FILE_SUFFIXES = ('.key', '.private', '.uuid', '.dn', '.digest')
+
 class BINDMgr(object):
     """BIND key manager. It does LDAP->BIND key files synchronization.
 
@@ -34,6 +46,8 @@ class BINDMgr(object):
         self.log = ipa_log_manager.log_mgr.get_logger(self)
         self.ldap_keys = {}
         self.modified_zones = set()
+        # zone -> {uuid: (base file name, metadata digest)} of installed keys
+        self.installed_keys = {}
 
     def notify_zone(self, zone):
         cmd = ['rndc', 'sign', zone.to_text()]
@@ -94,6 +108,13 @@ class BINDMgr(object):
             self.log.info('Key metadata %s updated in zone %s' % (attrs['dn'], zone))
             zone_keys[uuid] = attrs
 
+    def key_digest(self, attrs):
+        """Compute digest of key metadata used by install_key()."""
+        data = repr([attrs['dn']] + [
+            (attr, sorted(attrs.get(attr, []))) for attr in KEY_METADATA_ATTRS
+        ])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
     def install_key(self, zone, uuid, attrs, workdir):
         """Run dnssec-keyfromlabel on given LDAP object.
         :returns: base file name of output files, e.g. Kaaa.test.+008+19719"""
@@ -120,6 +141,58 @@ class BINDMgr(object):
             uuid_file.write(uuid)
         with open("%s/%s.dn" % (workdir, basename), 'w') as dn_file:
             dn_file.write(attrs['dn'])
+        with open("%s/%s.digest" % (workdir, basename), 'w') as digest_file:
+            digest_file.write(self.key_digest(attrs))
+        return basename
+
+    def get_installed_keys(self, zone, keys_dir):
+        """Get keys installed in keys_dir, read the directory on first use.
+
+        :returns: dict {uuid: (base file name, metadata digest)}, digest is
+        None for keys installed without one"""
+        installed = self.installed_keys.get(zone)
+        if installed is not None:
+            return installed
+
+        installed = {}
+        for name in os.listdir(keys_dir):
+            if not name.endswith('.uuid'):
+                continue
+            basename = name[:-len('.uuid')]
+            with open(os.path.join(keys_dir, name)) as uuid_file:
+                uuid = uuid_file.read().strip()
+            try:
+                with open(os.path.join(keys_dir, "%s.digest" % basename)) \
+                        as digest_file:
+                    digest = digest_file.read().strip()
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                digest = None
+            installed[uuid] = (basename, digest)
+
+        self.installed_keys[zone] = installed
+        return installed
+
+    def remove_key(self, keys_dir, basename):
+        """Remove all files of a key installed by install_key()."""
+        for suffix in KEY_FILE_SUFFIXES:
+            try:
+                os.unlink(os.path.join(keys_dir, basename + suffix))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def fix_hsm_permissions(self):
+        for prefix, dirs, files in os.walk(paths.DNSSEC_TOKENS_DIR, topdown=True):
+            for name in dirs:
+                fpath = os.path.join(prefix, name)
+                self.log.debug('Fixing directory permissions: %s', fpath)
+                os.chmod(fpath, DIR_PERM | stat.S_ISGID)
+            for name in files:
+                fpath = os.path.join(prefix, name)
+                self.log.debug('Fixing file permissions: %s', fpath)
+                os.chmod(fpath, FILE_PERM)
 
     def get_zone_dir_name(self, zone):
         """Escape zone name to form suitable for file-system.
@@ -152,42 +225,92 @@ class BINDMgr(object):
         return escaped[:-1]
 
     def sync_zone(self, zone):
+        """Install keys of zone which were added or modified since the last
+        synchronization and remove deleted keys.
+
+        Only keys with changed metadata are passed to dnssec-keyfromlabel,
+        BIND is notified only if some key changed."""
         self.log.info('Synchronizing zone %s' % zone)
         zone_path = os.path.join(paths.BIND_LDAP_DNS_ZONE_WORKDIR,
                 self.get_zone_dir_name(zone))
+        keys_dir = os.path.join(zone_path, 'keys')
         try:
-            os.makedirs(zone_path)
+            os.makedirs(keys_dir)
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise e
+        os.chmod(keys_dir, DIR_PERM)
 
-        # fix HSM permissions
-        # TODO: move out
-        for prefix, dirs, files in os.walk(paths.DNSSEC_TOKENS_DIR, topdown=True):
-            for name in dirs:
-                fpath = os.path.join(prefix, name)
-                self.log.debug('Fixing directory permissions: %s', fpath)
-                os.chmod(fpath, DIR_PERM | stat.S_ISGID)
-            for name in files:
-                fpath = os.path.join(prefix, name)
-                self.log.debug('Fixing file permissions: %s', fpath)
-                os.chmod(fpath, FILE_PERM)
-        # TODO: move out
+        installed = self.get_installed_keys(zone, keys_dir)
+        ldap_keys = self.ldap_keys.get(zone, {})
+        modified = False
 
         with TemporaryDirectory(zone_path) as tempdir:
-            for uuid, attrs in self.ldap_keys[zone].items():
-                self.install_key(zone, uuid, attrs, tempdir)
-            # keys were generated in a temporary directory, swap directories
-            target_dir = "%s/keys" % zone_path
-            try:
-                shutil.rmtree(target_dir)
-            except OSError as e:
-                if e.errno != errno.ENOENT:
-                    raise e
-            shutil.move(tempdir, target_dir)
-            os.chmod(target_dir, DIR_PERM)
-
-        self.notify_zone(zone)
+            for uuid, attrs in ldap_keys.items():
+                digest = self.key_digest(attrs)
+                old_basename, old_digest = installed.get(uuid, (None, None))
+                if old_digest == digest:
+                    continue
+
+                # key files are generated in a temporary directory and then
+                # moved over the previous version of the key
+                basename = self.install_key(zone, uuid, attrs, tempdir)
+                if old_basename is not None and old_basename != basename:
+                    self.remove_key(keys_dir, old_basename)
+                for name in os.listdir(tempdir):
+                    os.rename(os.path.join(tempdir, name),
+                              os.path.join(keys_dir, name))
+                installed[uuid] = (basename, digest)
+                modified = True
+
+        for uuid in set(installed) - set(ldap_keys):
+            basename, _digest = installed.pop(uuid)
+            self.log.info('Removing key %s (%s) from zone %s',
+                          basename, uuid, zone)
+            self.remove_key(keys_dir, basename)
+            modified = True
+
+        if modified:
+            self.notify_zone(zone)
+        else:
+            self.log.debug('Keys of zone %s are up to date', zone)
+
+    def sync_zones(self, zones):
+        """Synchronize zones on a pool of at most dnskeysyncd_max_workers
+        threads. Zones are independent, each one has its own key directory.
+
+        The first error is re-raised once all zones were processed."""
+        workers = min(self.api.env.dnskeysyncd_max_workers, len(zones))
+        if workers <= 1:
+            for zone in zones:
+                self.sync_zone(zone)
+            return
+
+        todo = queue.Queue()
+        for zone in zones:
+            todo.put(zone)
+        failures = []
+
+        def worker():
+            while True:
+                try:
+                    zone = todo.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self.sync_zone(zone)
+                except Exception as e:
+                    self.log.exception('Failed to synchronize zone %s', zone)
+                    failures.append(e)
+
+        threads = [threading.Thread(target=worker) for _i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if failures:
+            raise failures[0]
 
     def sync(self, dnssec_zones):
         """Synchronize list of zones in LDAP with BIND.
@@ -202,8 +325,10 @@ class BINDMgr(object):
         self.log.debug('Key metadata in LDAP: %s' % self.ldap_keys)
         self.log.debug('Zones modified but skipped during bindmgr.sync: %s',
                        self.modified_zones - dnssec_zones)
-        for zone in self.modified_zones.intersection(dnssec_zones):
-            self.sync_zone(zone)
+        zones = self.modified_zones.intersection(dnssec_zones)
+        if zones:
+            self.fix_hsm_permissions()
+            self.sync_zones(zones)
 
         self.modified_zones = set()
 
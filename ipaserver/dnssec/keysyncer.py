@@ -4,6 +4,7 @@
 
 import ldap.dn
 import os
+import time
 
 import dns.name
 
@@ -35,6 +36,10 @@ class KeySyncer(SyncReplConsumer):
         self.bindmgr = BINDMgr(self.api)
         self.init_done = False
         self.dnssec_zones = set()
+        # key changes are synchronized to BIND in batches, see schedule_sync
+        self.sync_deadline = None
+        self.hsm_sync_before = False
+        self.hsm_sync_after = False
         SyncReplConsumer.__init__(self, *args, **kwargs)
 
     def _get_objclass(self, attrs):
@@ -121,22 +126,61 @@ class KeySyncer(SyncReplConsumer):
     # i.e. it is not necessary to re-download blobs because of change in DNSSEC
     # metadata - DNSSEC flags or timestamps.
     def key_meta_add(self, uuid, dn, newattrs):
-        self.hsm_replica_sync()
         self.bindmgr.ldap_event('add', uuid, newattrs)
-        self.bindmgr_sync(self.dnssec_zones)
+        # new keys have to be in local HSM before BIND can use them
+        self.schedule_sync(hsm_before=True)
 
     def key_meta_del(self, uuid, dn, oldattrs):
         self.bindmgr.ldap_event('del', uuid, oldattrs)
-        self.bindmgr_sync(self.dnssec_zones)
-        self.hsm_replica_sync()
+        self.schedule_sync(hsm_after=True)
 
     def key_metadata_sync(self, uuid, dn, oldattrs, newattrs):
         self.bindmgr.ldap_event('mod', uuid, newattrs)
-        self.bindmgr_sync(self.dnssec_zones)
+        self.schedule_sync()
 
-    def bindmgr_sync(self, dnssec_zones):
-        if self.init_done:
-            self.bindmgr.sync(dnssec_zones)
+    def schedule_sync(self, hsm_before=False, hsm_after=False):
+        """Schedule synchronization of key changes with BIND.
+
+        Changes are coalesced: the synchronization is done by flush() once
+        dnskeysyncd_batch_delay seconds passed since the first change which
+        is not synchronized yet. Before the initial LDAP dump is done,
+        nothing is scheduled as syncrepl_refreshdone() synchronizes all
+        zones."""
+        if not self.init_done:
+            return
+        self.hsm_sync_before = self.hsm_sync_before or hsm_before
+        self.hsm_sync_after = self.hsm_sync_after or hsm_after
+        if self.sync_deadline is None:
+            self.sync_deadline = (
+                time.time() + self.api.env.dnskeysyncd_batch_delay)
+
+    def get_sync_timeout(self):
+        """Get number of seconds until scheduled synchronization is due,
+        or None if there is nothing to synchronize."""
+        if self.sync_deadline is None:
+            return None
+        # timeout 0 would make syncrepl_poll() return without waiting
+        return max(self.sync_deadline - time.time(), 0.01)
+
+    def flush(self, force=False):
+        """Synchronize scheduled key changes with local HSM and BIND if they
+        are due or if force is True."""
+        if self.sync_deadline is None:
+            return
+        if not force and time.time() < self.sync_deadline:
+            return
+
+        hsm_sync_before = self.hsm_sync_before
+        hsm_sync_after = self.hsm_sync_after
+        self.sync_deadline = None
+        self.hsm_sync_before = False
+        self.hsm_sync_after = False
+
+        if hsm_sync_before:
+            self.hsm_replica_sync()
+        self.bindmgr.sync(self.dnssec_zones)
+        if hsm_sync_after:
+            self.hsm_replica_sync()
 
     # idnsZone wrapper
     def zone_add(self, uuid, dn, newattrs):
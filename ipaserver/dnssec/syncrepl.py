@@ -4,9 +4,13 @@
 #
 """
 This script implements a syncrepl consumer which syncs data from server
-to a local dict.
+to a local dict, optionally backed by a persistent store.
 """
 
+import os
+import pickle
+import sqlite3
+
 # Import the python-ldap modules
 import ldap
 # Import specific classes from python-ldap
@@ -24,6 +28,7 @@ class SyncReplConsumer(ReconnectLDAPObject, SyncreplConsumer):
 
     def __init__(self, *args, **kwargs):
         self.log = ipa_log_manager.log_mgr.get_logger(self)
+        db_path = kwargs.pop('db_path', None)
         # Initialise the LDAP Connection first
         ldap.ldapobject.ReconnectLDAPObject.__init__(self, *args, **kwargs)
         # Now prepare the data store
@@ -31,10 +36,96 @@ class SyncReplConsumer(ReconnectLDAPObject, SyncreplConsumer):
         self.__data['uuids'] = cidict()
         # We need this for later internal use
         self.__presentUUIDs = cidict()
+        self.__db = None
+        if db_path is not None:
+            self.__db = self.__open_db(db_path)
+
+    def __open_db(self, db_path):
+        """Open persistent store of the cookie and entries in db_path.
+
+        A store which cannot be read is replaced by an empty one."""
+        for _i in range(2):
+            db = sqlite3.connect(db_path)
+            try:
+                db.execute('CREATE TABLE IF NOT EXISTS state '
+                           '(name TEXT PRIMARY KEY, value BLOB)')
+                db.execute('CREATE TABLE IF NOT EXISTS entries '
+                           '(uuid TEXT PRIMARY KEY, attributes BLOB)')
+                db.commit()
+                return db
+            except sqlite3.DatabaseError as e:
+                db.close()
+                self.log.warning('Removing unusable store %s: %s',
+                                 db_path, e)
+                os.unlink(db_path)
+        raise RuntimeError('Cannot create store %s' % db_path)
+
+    def __load_db(self, search):
+        """Load the cookie and entries from the persistent store.
+
+        Stored entries are passed to application_add() so that the
+        application rebuilds its state, the refresh then delivers only
+        changes made since the stored cookie was received. Nothing is
+        loaded if the store was written by a different search."""
+        db = self.__db
+        state = {}
+        try:
+            for name, value in db.execute('SELECT name, value FROM state'):
+                state[name] = pickle.loads(bytes(value))
+            entries = [(uuid, cidict(pickle.loads(bytes(attributes))))
+                       for uuid, attributes in
+                       db.execute('SELECT uuid, attributes FROM entries')]
+        except (sqlite3.DatabaseError, pickle.UnpicklingError, EOFError) as e:
+            self.log.warning('Ignoring unusable synchronization state: %s', e)
+            state = {}
+
+        if state.get('search') != search or 'cookie' not in state:
+            self.log.info('Synchronization state is not stored, '
+                          'full refresh is needed')
+            self.reset_db()
+            db.execute('INSERT INTO state VALUES (?, ?)',
+                       ('search', self.__db_value(search)))
+            db.commit()
+            return
+
+        self.log.info('Resuming synchronization with %d stored entries',
+                      len(entries))
+        self.__data['cookie'] = state['cookie']
+        for uuid, attributes in entries:
+            self.__data['uuids'][uuid] = attributes
+        for uuid, attributes in entries:
+            self.application_add(uuid, attributes['dn'], attributes)
+
+    def __db_value(self, value):
+        return sqlite3.Binary(pickle.dumps(value, 2))
+
+    def reset_db(self):
+        """Forget the stored cookie and entries, so that the next start does
+        a full refresh."""
+        if self.__db is None:
+            return
+        self.__db.rollback()
+        self.__db.execute('DELETE FROM state')
+        self.__db.execute('DELETE FROM entries')
+        self.__db.commit()
 
     def close_db(self):
-        # This is useless for dict
-        pass
+        """Close the persistent store.
+
+        Changes received after the last cookie are discarded, they are
+        delivered again by the next refresh."""
+        if self.__db is not None:
+            self.__db.close()
+            self.__db = None
+
+    def syncrepl_search(self, base, scope, mode='refreshOnly', cookie=None,
+                        **search_args):
+        if self.__db is not None:
+            self.__load_db(repr((
+                base, scope, search_args.get('filterstr'),
+                search_args.get('attrlist'))))
+        return SyncreplConsumer.syncrepl_search(
+            self, base, scope, mode=mode, cookie=cookie, **search_args)
 
     def syncrepl_get_cookie(self):
         if 'cookie' in self.__data:
@@ -47,6 +138,11 @@ class SyncReplConsumer(ReconnectLDAPObject, SyncreplConsumer):
     def syncrepl_set_cookie(self, cookie):
         self.log.debug('New cookie is: %s', cookie)
         self.__data['cookie'] = cookie
+        if self.__db is not None:
+            # entries received so far are stored together with the cookie
+            self.__db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                              ('cookie', self.__db_value(cookie)))
+            self.__db.commit()
 
     def syncrepl_entry(self, dn, attributes, uuid):
         attributes = cidict(attributes)
@@ -62,6 +158,9 @@ class SyncReplConsumer(ReconnectLDAPObject, SyncreplConsumer):
         # (including the DN as an attribute for convenience)
         attributes['dn'] = dn
         self.__data['uuids'][uuid] = attributes
+        if self.__db is not None:
+            self.__db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?)',
+                              (uuid, self.__db_value(dict(attributes))))
         # Debugging
         self.log.debug('Detected %s of entry: %s %s', change_type, dn, uuid)
         if change_type == 'modify':
@@ -79,6 +178,9 @@ class SyncReplConsumer(ReconnectLDAPObject, SyncreplConsumer):
             self.log.debug('Detected deletion of entry: %s %s', dn, uuid)
             self.application_del(uuid, dn, attributes)
             del self.__data['uuids'][uuid]
+            if self.__db is not None:
+                self.__db.execute('DELETE FROM entries WHERE uuid = ?',
+                                  (uuid,))
 
     def syncrepl_present(self, uuids, refreshDeletes=False):
         # If we have not been given any UUID values,
@@ -468,4 +468,10 @@ class DNSKeySyncInstance(service.Service):
         except Exception:
             pass
 
+        # remove synchronization state, keys in new installation differ
+        try:
+            os.remove(paths.IPA_DNSKEYSYNCD_DB)
+        except Exception:
+            pass
+
         installutils.remove_keytab(self.keytab)
@@ -527,8 +527,12 @@ class LDAPUpdate(object):
 
         return all_updates
 
-    def create_index_task(self, attribute):
-        """Create a task to update an index for an attribute"""
+    def create_index_task(self, attribute, vlv=False):
+        """Create a task to update an index for an attribute
+
+        If vlv is True, attribute is the name of a virtual list view
+        (browsing) index instead.
+        """
 
         # Sleep a bit to ensure previous operations are complete
         time.sleep(5)
@@ -545,8 +549,11 @@ class LDAPUpdate(object):
             objectClass=['top', 'extensibleObject'],
             cn=[cn],
             nsInstance=['userRoot'],
-            nsIndexAttribute=[attribute],
         )
+        if vlv:
+            e['nsIndexVLVAttribute'] = [attribute]
+        else:
+            e['nsIndexAttribute'] = [attribute]
 
         self.debug("Creating task to index attribute: %s", attribute)
         self.debug("Task id: %s", dn)
@@ -835,6 +842,13 @@ class LDAPUpdate(object):
                                 ('cn', 'config'))) and (added or updated):
             taskid = self.create_index_task(entry.single_value['cn'])
             self.monitor_index_task(taskid)
+        elif entry.dn.endswith(DN(('cn', 'userRoot'), ('cn', 'ldbm database'),
+                                  ('cn', 'plugins'), ('cn', 'config'))) and (
+                'vlvindex' in (o.lower() for o in entry.get('objectclass', []))
+        ) and (added or updated):
+            taskid = self.create_index_task(entry.single_value['cn'],
+                                            vlv=True)
+            self.monitor_index_task(taskid)
         return
 
     def _delete_record(self, updates):
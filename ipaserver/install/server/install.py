@@ -850,6 +850,9 @@ def install(installer):
     service.print_msg("Applying LDAP updates")
     ds.apply_updates()
 
+    # Store the API schema, so that it is not generated by every httpd worker
+    api.Command.schema.update_cache()
+
     # Restart krb after configurations have been changed
     service.print_msg("Restarting the KDC")
     krb.restart()
@@ -1600,6 +1600,15 @@ def disable_httpd_system_trust(http):
             db.add_cert(cert, nickname, trust_flags)
 
 
+def update_api_schema_cache():
+    """
+    Store the API schema, so that it does not have to be generated by every
+    IPA framework process after it is started
+    """
+    root_logger.info('[Updating API schema cache]')
+    api.Command.schema.update_cache()
+
+
 def upgrade_configuration():
     """
     Execute configuration upgrade of the IPA services
@@ -1853,6 +1862,8 @@ def upgrade_configuration():
 
     set_sssd_domain_option('ipa_server_mode', 'True')
 
+    update_api_schema_cache()
+
     sssdconfig = SSSDConfig.SSSDConfig()
     sssdconfig.import_config()
     sssd_enable_service(sssdconfig, 'ifp')
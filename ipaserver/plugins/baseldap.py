@@ -674,29 +674,47 @@ class LDAPObject(Object):
                         new_attr.append(new_value)
                         break
 
-    def get_indirect_members(self, entry_attrs, attrs_list):
+    def get_member_graph(self, attrs_list):
+        """
+        Get the membership graph if indirect membership was requested.
+        """
+        if ('memberindirect' in attrs_list or
+                'memberofindirect' in attrs_list):
+            return self.backend.get_member_graph()
+        return None
+
+    def get_indirect_members(self, entry_attrs, attrs_list, graph=None):
+        if graph is None:
+            graph = self.get_member_graph(attrs_list)
         if 'memberindirect' in attrs_list:
-            self.get_memberindirect(entry_attrs)
+            self.get_memberindirect(entry_attrs, graph)
         if 'memberofindirect' in attrs_list:
-            self.get_memberofindirect(entry_attrs)
+            self.get_memberofindirect(entry_attrs, graph)
 
-    def get_memberindirect(self, group_entry):
+    def get_memberindirect(self, group_entry, graph=None):
         """
         Get indirect members
         """
 
+        if graph is not None:
+            indirect = graph.get_indirect_members(group_entry.dn)
+            indirect.difference_update(
+                DN(m.decode('utf-8'))
+                for m in group_entry.raw.get('member', []))
+            if indirect:
+                group_entry.raw['memberindirect'] = [
+                    str(dn).encode('utf-8') for dn in indirect]
+            return
+
         mo_filter = self.backend.make_filter({'memberof': group_entry.dn})
         filter = self.backend.combine_filters(
             ('(member=*)', mo_filter), self.backend.MATCH_ALL)
-        try:
-            result = self.backend.get_entries(
-                self.api.env.basedn,
-                filter=filter,
-                attrs_list=['member'],
-                size_limit=-1, # paged search will get everything anyway
-                paged_search=True)
-        except errors.NotFound:
-            result = []
+        result = self.backend.iter_entries(
+            filter,
+            ['member'],
+            self.api.env.basedn,
+            size_limit=-1, # paged search will get everything anyway
+            paged_search=True)
 
         indirect = set()
         for entry in result:
@@ -706,23 +724,26 @@ class LDAPObject(Object):
         if indirect:
             group_entry.raw['memberindirect'] = list(indirect)
 
-    def get_memberofindirect(self, entry):
+    def get_memberofindirect(self, entry, graph=None):
 
         dn = entry.dn
-        filter = self.backend.make_filter(
-            {'member': dn, 'memberuser': dn, 'memberhost': dn})
-        try:
-            result = self.backend.get_entries(
-                self.api.env.basedn,
-                filter=filter,
-                attrs_list=[''])
-        except errors.NotFound:
-            result = []
+        if graph is not None:
+            result = graph.get_direct_memberof(dn)
+        else:
+            filter = self.backend.make_filter(
+                {'member': dn, 'memberuser': dn, 'memberhost': dn})
+            try:
+                result = [e.dn for e in self.backend.get_entries(
+                    self.api.env.basedn,
+                    filter=filter,
+                    attrs_list=[''])]
+            except errors.NotFound:
+                result = []
 
         direct = set()
         indirect = set(entry.raw.get('memberof', []))
-        for group_entry in result:
-            dn = str(group_entry.dn).encode('utf-8')
+        for group_dn in result:
+            dn = str(group_dn).encode('utf-8')
             if dn in indirect:
                 indirect.remove(dn)
                 direct.add(dn)
@@ -1287,6 +1308,7 @@ class LDAPRetrieve(LDAPQuery):
     """
     has_output = output.standard_entry
     has_output_params = global_output_params
+    cache_response = True
 
     takes_options = (
         Flag('rights',
@@ -1681,20 +1703,19 @@ class LDAPAddMember(LDAPModMember):
         completed = 0
         for (attr, objs) in member_dns.items():
             for ldap_obj_name in objs:
-                for m_dn in member_dns[attr][ldap_obj_name]:
-                    assert isinstance(m_dn, DN)
-                    if not m_dn:
-                        continue
-                    try:
-                        ldap.add_entry_to_group(m_dn, dn, attr, allow_same=self.allow_same)
-                    except errors.PublicError as e:
-                        ldap_obj = self.api.Object[ldap_obj_name]
-                        failed[attr][ldap_obj_name].append((
-                            ldap_obj.get_primary_key_from_dn(m_dn),
-                            unicode(e),)
-                        )
-                    else:
-                        completed += 1
+                m_dns = [m_dn for m_dn in member_dns[attr][ldap_obj_name]
+                         if m_dn]
+                if not m_dns:
+                    continue
+                ldap_obj = self.api.Object[ldap_obj_name]
+                errs = ldap.add_entries_to_group(
+                    m_dns, dn, attr, allow_same=self.allow_same)
+                for m_dn, e in errs:
+                    failed[attr][ldap_obj_name].append((
+                        ldap_obj.get_primary_key_from_dn(m_dn),
+                        unicode(e),)
+                    )
+                completed += len(m_dns) - len(errs)
 
         if options.get('all', False):
             attrs_list = ['*'] + self.obj.default_attributes
@@ -1779,20 +1800,17 @@ class LDAPRemoveMember(LDAPModMember):
         completed = 0
         for (attr, objs) in member_dns.items():
             for ldap_obj_name, m_dns in objs.items():
-                for m_dn in m_dns:
-                    assert isinstance(m_dn, DN)
-                    if not m_dn:
-                        continue
-                    try:
-                        ldap.remove_entry_from_group(m_dn, dn, attr)
-                    except errors.PublicError as e:
-                        ldap_obj = self.api.Object[ldap_obj_name]
-                        failed[attr][ldap_obj_name].append((
-                            ldap_obj.get_primary_key_from_dn(m_dn),
-                            unicode(e),)
-                        )
-                    else:
-                        completed += 1
+                m_dns = [m_dn for m_dn in m_dns if m_dn]
+                if not m_dns:
+                    continue
+                ldap_obj = self.api.Object[ldap_obj_name]
+                errs = ldap.remove_entries_from_group(m_dns, dn, attr)
+                for m_dn, e in errs:
+                    failed[attr][ldap_obj_name].append((
+                        ldap_obj.get_primary_key_from_dn(m_dn),
+                        unicode(e),)
+                    )
+                completed += len(m_dns) - len(errs)
 
         if options.get('all', False):
             attrs_list = ['*'] + self.obj.default_attributes
@@ -1862,6 +1880,7 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
     # as a key attribute
     # Set the following attribute to False to turn sorting off
     sort_result_entries = True
+    cache_response = True
 
     takes_options = (
         Int('timelimit?',
@@ -1880,6 +1899,36 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
         ),
     )
 
+    # Options to have the LDAP server sort the entries and return only a
+    # page of them, see get_options()
+    page_options = (
+        Str('sort_by*',
+            label=_('Sort by'),
+            doc=_('Attributes to sort entries by, prefix an attribute with '
+                  '"-" to sort in descending order'),
+            flags=['no_display'],
+            pattern=r'^-?[a-zA-Z][a-zA-Z0-9-]*$',
+            pattern_errmsg='may only be an attribute name, optionally '
+                           'prefixed with "-"',
+            autofill=False,
+        ),
+        Int('offset?',
+            label=_('Offset'),
+            doc=_('Index of the first sorted entry returned (0 is the '
+                  'first entry)'),
+            flags=['no_display'],
+            minvalue=0,
+            autofill=False,
+        ),
+        Int('limit?',
+            label=_('Limit'),
+            doc=_('Maximum number of sorted entries returned from offset'),
+            flags=['no_display'],
+            minvalue=1,
+            autofill=False,
+        ),
+    )
+
     def get_args(self):
         for key in self.obj.get_ancestor_primary_keys():
             yield key
@@ -1916,12 +1965,14 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
             )
 
     def get_options(self):
+        names = set()
         for option in super(LDAPSearch, self).get_options():
             if option.name == 'no_members':
                 # no_members are always true for find commands, do not
                 # show option in CLI but keep API compatibility
                 option = option.clone(
                     default=True, flags=option.flags | {"no_option"})
+            names.update((option.name, option.cli_name))
             yield option
         if self.obj.primary_key and \
                 'no_output' not in self.obj.primary_key.flags:
@@ -1929,6 +1980,10 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
         for attr in self.member_attributes:
             for option in self.get_member_options(attr):
                 yield option
+        for option in self.page_options:
+            # e.g. otptoken-find has an --offset option of its own
+            if option.name not in names and option.cli_name not in names:
+                yield option
 
     def get_attr_filter(self, ldap, **options):
         """
@@ -2044,11 +2099,23 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
                 self, ldap, filter, attrs_list, base_dn, scope, *args, **options)
             assert isinstance(base_dn, DN)
 
+        sort_by = options.get('sort_by')
+        offset = options.get('offset')
+        limit = options.get('limit')
+        if offset is not None or limit is not None:
+            if not sort_by and self.obj.primary_key:
+                sort_by = [self.obj.primary_key.name]
+            if not sort_by:
+                raise errors.RequirementError(name='sort_by')
+
         try:
             (entries, truncated) = self._exc_wrapper(args, options, ldap.find_entries)(
                 filter, attrs_list, base_dn, scope,
                 time_limit=options.get('timelimit', None),
-                size_limit=options.get('sizelimit', None)
+                size_limit=options.get('sizelimit', None),
+                sort_by=sort_by,
+                offset=offset,
+                limit=limit,
             )
         except errors.EmptyResult:
             (entries, truncated) = ([], False)
@@ -2058,7 +2125,8 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
         for callback in self.get_callbacks('post'):
             truncated = callback(self, ldap, entries, truncated, *args, **options)
 
-        if self.sort_result_entries:
+        # entries sorted by the server are kept in their order
+        if self.sort_result_entries and not sort_by:
             if self.obj.primary_key:
                 def sort_key(x):
                     return self.obj.primary_key.sort_key(
@@ -2066,8 +2134,9 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
                 entries.sort(key=sort_key)
 
         if not options.get('raw', False):
+            graph = self.obj.get_member_graph(attrs_list)
             for entry in entries:
-                self.obj.get_indirect_members(entry, attrs_list)
+                self.obj.get_indirect_members(entry, attrs_list, graph)
                 self.obj.convert_attribute_members(entry, *args, **options)
 
         for (i, e) in enumerate(entries):
@@ -45,23 +45,38 @@ And then a nested response for each IPA command method sent in the request
 
 """
 
+import os
+import threading
+
 import six
+from six.moves import queue
 
-from ipalib import api, errors
+from ipalib import errors
 from ipalib import Command
 from ipalib.frontend import Local
-from ipalib.parameters import Str, Dict
+from ipalib.parameters import Str, Dict, Flag
 from ipalib.output import Output
 from ipalib.text import _
-from ipalib.request import context
+from ipalib.request import context, destroy_context
 from ipalib.plugable import Registry
 from ipapython.version import API_VERSION
+from ipaserver.plugins.baseldap import LDAPRetrieve, LDAPSearch
 
 if six.PY3:
     unicode = str
 
 register = Registry()
 
+# LDAPRetrieve based commands which modify the directory and thus must never
+# run concurrently with other commands
+_NON_PARALLEL_COMMANDS = frozenset([
+    'trust_fetch_domains',
+])
+
+# per-request attributes which are copied to the context of worker threads
+_INHERITED_CONTEXT_ATTRS = ('principal', 'ccache_name', 'client_ip')
+
+
 @register()
 class batch(Command):
     NO_CLI = True
@@ -72,6 +87,14 @@ class batch(Command):
         ),
     )
 
+    takes_options = (
+        Flag('parallel?',
+            doc=_('Execute independent read-only methods concurrently'),
+            default=False,
+            autofill=True,
+        ),
+    )
+
     take_options = (
         Str('version',
             cli_name='version',
@@ -88,69 +111,188 @@ class batch(Command):
         Output('results', (list, tuple), doc='')
     )
 
-    def execute(self, methods=None, **options):
-        results = []
-        for arg in (methods or []):
-            params = dict()
-            name = None
+    def _get_command(self, arg):
+        """
+        Return the command plugin called by batch item *arg*, or None if
+        the item is invalid. Errors are reported by `_execute_method`.
+        """
+        try:
+            name = arg['method']
+            command = self.api.Command[name]
+        except (KeyError, TypeError):
+            return None
+        if isinstance(command, Local):
+            return None
+        return command
+
+    def _can_run_parallel(self, command):
+        """
+        Return True if *command* only reads from LDAP and may be executed
+        concurrently with other such commands.
+        """
+        return (command is not None and
+                isinstance(command, (LDAPRetrieve, LDAPSearch)) and
+                command.name not in _NON_PARALLEL_COMMANDS)
+
+    def _execute_method(self, arg, command, version):
+        params = dict()
+        name = None
+        try:
+            if 'method' not in arg:
+                raise errors.RequirementError(name='method')
+            if 'params' not in arg:
+                raise errors.RequirementError(name='params')
+            name = arg['method']
+            if command is None:
+                raise errors.CommandError(name=name)
+
+            # If params are not formated as a tuple(list, dict)
+            # the following lines will raise an exception
+            # that triggers an internal server error
+            # Raise a ConversionError instead to report the issue
+            # to the client
             try:
-                if 'method' not in arg:
-                    raise errors.RequirementError(name='method')
-                if 'params' not in arg:
-                    raise errors.RequirementError(name='params')
-                name = arg['method']
-                if (name not in self.api.Command or
-                        isinstance(self.api.Command[name], Local)):
-                    raise errors.CommandError(name=name)
-
-                # If params are not formated as a tuple(list, dict)
-                # the following lines will raise an exception
-                # that triggers an internal server error
-                # Raise a ConversionError instead to report the issue
-                # to the client
-                try:
-                    a, kw = arg['params']
-                    newkw = dict((str(k), v) for k, v in kw.items())
-                    params = api.Command[name].args_options_2_params(
-                        *a, **newkw)
-                except (AttributeError, ValueError, TypeError):
-                    raise errors.ConversionError(
-                        name='params',
-                        error=_(u'must contain a tuple (list, dict)'))
-                newkw.setdefault('version', options['version'])
-
-                result = api.Command[name](*a, **newkw)
+                a, kw = arg['params']
+                newkw = dict((str(k), v) for k, v in kw.items())
+                params = command.args_options_2_params(*a, **newkw)
+            except (AttributeError, ValueError, TypeError):
+                raise errors.ConversionError(
+                    name='params',
+                    error=_(u'must contain a tuple (list, dict)'))
+            newkw.setdefault('version', version)
+
+            result = command(*a, **newkw)
+            self.info(
+                '%s: batch: %s(%s): SUCCESS',
+                getattr(context, 'principal', 'UNKNOWN'),
+                name,
+                ', '.join(command._repr_iter(**params))
+            )
+            result['error']=None
+        except Exception as e:
+            if isinstance(e, errors.RequirementError) or \
+                isinstance(e, errors.CommandError):
+                self.info(
+                    '%s: batch: %s',
+                    context.principal,  # pylint: disable=no-member
+                    e.__class__.__name__
+                )
+            else:
                 self.info(
-                    '%s: batch: %s(%s): SUCCESS',
-                    getattr(context, 'principal', 'UNKNOWN'),
-                    name,
-                    ', '.join(api.Command[name]._repr_iter(**params))
+                    '%s: batch: %s(%s): %s',
+                    context.principal, name,  # pylint: disable=no-member
+                    ', '.join(command._repr_iter(**params)),
+                    e.__class__.__name__
                 )
-                result['error']=None
+            if isinstance(e, errors.PublicError):
+                reported_error = e
+            else:
+                reported_error = errors.InternalError()
+            result = dict(
+                error=reported_error.strerror,
+                error_code=reported_error.errno,
+                error_name=unicode(type(reported_error).__name__),
+                error_kw=reported_error.kw,
+            )
+        return result
+
+    def _worker(self, items, results, version, ccache, inherited):
+        """
+        Execute batch items from queue *items* in a worker thread.
+
+        The worker has its own request context and LDAP connection, bound
+        with the Kerberos credentials of the batch caller.
+        """
+        for attr, value in inherited.items():
+            setattr(context, attr, value)
+        try:
+            try:
+                self.api.Backend.ldap2.connect(ccache=ccache,
+                                               size_limit=None,
+                                               time_limit=None)
+                connect_error = None
             except Exception as e:
-                if isinstance(e, errors.RequirementError) or \
-                    isinstance(e, errors.CommandError):
-                    self.info(
-                        '%s: batch: %s',
-                        context.principal,  # pylint: disable=no-member
-                        e.__class__.__name__
-                    )
+                self.error('batch: worker failed to connect: %s', e)
+                if isinstance(e, errors.PublicError):
+                    connect_error = e
                 else:
-                    self.info(
-                        '%s: batch: %s(%s): %s',
-                        context.principal, name,  # pylint: disable=no-member
-                        ', '.join(api.Command[name]._repr_iter(**params)),
-                        e.__class__.__name__
+                    connect_error = errors.InternalError()
+
+            while True:
+                try:
+                    i, arg, command = items.get_nowait()
+                except queue.Empty:
+                    break
+                if connect_error is not None:
+                    results[i] = dict(
+                        error=connect_error.strerror,
+                        error_code=connect_error.errno,
+                        error_name=unicode(type(connect_error).__name__),
+                        error_kw=connect_error.kw,
                     )
-                if isinstance(e, errors.PublicError):
-                    reported_error = e
                 else:
-                    reported_error = errors.InternalError()
-                result = dict(
-                    error=reported_error.strerror,
-                    error_code=reported_error.errno,
-                    error_name=unicode(type(reported_error).__name__),
-                    error_kw=reported_error.kw,
-                )
-            results.append(result)
+                    results[i] = self._execute_method(arg, command, version)
+        finally:
+            destroy_context()
+
+    def _execute_parallel(self, batch_items, results, version):
+        """
+        Execute *batch_items*, a list of (index, arg, command) tuples of
+        independent read-only methods, on a bounded pool of worker threads.
+        """
+        if len(batch_items) == 1:
+            i, arg, command = batch_items[0]
+            results[i] = self._execute_method(arg, command, version)
+            return
+
+        workers = min(self.api.env.batch_max_workers, len(batch_items))
+        items = queue.Queue()
+        for item in batch_items:
+            items.put(item)
+
+        ccache = os.environ.get('KRB5CCNAME')
+        inherited = dict(
+            (attr, getattr(context, attr))
+            for attr in _INHERITED_CONTEXT_ATTRS if hasattr(context, attr)
+        )
+
+        threads = [
+            threading.Thread(
+                target=self._worker,
+                args=(items, results, version, ccache, inherited))
+            for _i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def execute(self, methods=None, **options):
+        methods = methods or []
+        version = options['version']
+        results = [None] * len(methods)
+
+        # Parallel execution needs Kerberos credentials to bind the LDAP
+        # connections of the worker threads
+        parallel = (options.get('parallel') and
+                    self.api.env.in_server and
+                    self.api.env.batch_max_workers > 1 and
+                    hasattr(context, 'principal'))
+
+        # Consecutive read-only methods are executed concurrently, any other
+        # method waits for all preceding methods to finish and is executed
+        # alone, so the outcome is the same as for sequential execution.
+        pending = []
+        for i, arg in enumerate(methods):
+            command = self._get_command(arg)
+            if parallel and self._can_run_parallel(command):
+                pending.append((i, arg, command))
+                continue
+            if pending:
+                self._execute_parallel(pending, results, version)
+                pending = []
+            results[i] = self._execute_method(arg, command, version)
+        if pending:
+            self._execute_parallel(pending, results, version)
+
         return dict(count=len(results) , results=results)
@@ -192,6 +192,8 @@ class ca_find(LDAPSearch):
     msg_summary = ngettext(
         '%(count)d CA matched', '%(count)d CAs matched', 0
     )
+    # certificates are read from the CA
+    cache_response = False
 
     def execute(self, *keys, **options):
         ca_enabled_check(self.api)
@@ -212,6 +214,8 @@ _chain_flag = Flag(
 @register()
 class ca_show(LDAPRetrieve):
     __doc__ = _("Display the properties of a CA.")
+    # certificates are read from the CA
+    cache_response = False
 
     takes_options = LDAPRetrieve.takes_options + (
         _chain_flag,
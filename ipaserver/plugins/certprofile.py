@@ -198,6 +198,8 @@ class certprofile_find(LDAPSearch):
 @register()
 class certprofile_show(LDAPRetrieve):
     __doc__ = _("Display the properties of a Certificate Profile.")
+    # the profile configuration is read from the CA
+    cache_response = False
 
     takes_options = LDAPRetrieve.takes_options + (
         Str('out?',
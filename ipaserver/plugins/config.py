@@ -536,6 +536,7 @@ class config_mod(LDAPUpdate):
             keys, options, exc, call_func, *call_args, **call_kwargs)
 
     def post_callback(self, ldap, dn, entry_attrs, *keys, **options):
+        ldap.invalidate_entry_cache(dn)
         self.obj.show_servroles_attributes(
             entry_attrs, "CA server", "IPA master", "NTP server", **options)
         return dn
@@ -30,6 +30,7 @@ import dns.name
 import dns.exception
 import dns.rdatatype
 import dns.resolver
+import dns.zone
 import six
 
 from ipalib.dns import (extra_name_format,
@@ -80,6 +81,8 @@ from ipapython.ipautil import CheckedIPAddress
 from ipapython.dnsutil import check_zone_overlap
 from ipapython.dnsutil import DNSName
 from ipapython.dnsutil import related_to_auto_empty_zone
+from ipaserver.dns_zone_index import DNSZoneIndex
+from ipaserver.plugins.ldap2 import SyncreplCachePool
 from ipaserver.dns_data_management import (
     IPASystemRecords,
     IPADomainIsNotManagedByIPAError,
@@ -243,6 +246,12 @@ EXAMPLES:
 """) + _("""
  Delete zone example.com with all resource records:
    ipa dnszone-del example.com
+""") + _("""
+ Import resource records from a zone file into the existing zone example.com:
+   ipa dnszone-import example.com --zonefile=/var/named/example.com.db
+""") + _("""
+ Export zone example.com to a zone file:
+   ipa dnszone-export example.com --out=example.com.db
 """) + _("""
  If a global forwarder is configured, all queries for which this server is not
  authoritative (e.g. sub.example.com) will be routed to the global forwarder.
@@ -1746,6 +1755,11 @@ def _get_auth_zone_ldap(api, name):
     zone: authoritative zone, or None if authoritative zone is not in LDAP
     """
     assert isinstance(name, DNSName)
+
+    zone_index = api.Object.dnszone.get_zone_index()
+    if zone_index is not None:
+        return zone_index.get_auth_zone(name), False
+
     ldap = api.Backend.ldap2
 
     # Create all possible parent zone names
@@ -1810,6 +1824,14 @@ def _get_longest_match_ns_delegation_ldap(api, zone, name):
     assert isinstance(zone, DNSName)
     assert isinstance(name, DNSName)
 
+    zone_index = api.Object.dnszone.get_zone_index()
+    if (zone_index is not None and
+            zone_index.get_ns_delegation(zone, name) is None):
+        # a record which loses its last NS value may not be reported to
+        # the index, so only the absence of a delegation is trusted; most
+        # names are not delegated
+        return None, False
+
     ldap = api.Backend.ldap2
 
     # get zone DN
@@ -1869,6 +1891,11 @@ def _find_subtree_forward_zones_ldap(api, name, child_zones_only=False):
     :return: (list of zonenames,  truncated), list is empty if no zone found
     """
     assert isinstance(name, DNSName)
+
+    zone_index = api.Object.dnszone.get_zone_index()
+    if zone_index is not None:
+        return zone_index.find_forward_zones(name, child_zones_only), False
+
     ldap = api.Backend.ldap2
 
     # prepare for filter "*.<name>."
@@ -2658,6 +2685,33 @@ class dnszone(DNSZoneBase):
         },
     }
 
+    def __init__(self, api):
+        super(dnszone, self).__init__(api)
+        if api.env.in_server and api.env.dns_zone_index_size > 0:
+            self._zone_indexes = SyncreplCachePool(
+                lambda: DNSZoneIndex(
+                    DN(api.env.container_dns, api.env.basedn)),
+                max_size=api.env.dns_zone_index_size,
+                name="DNS zone index")
+        else:
+            self._zone_indexes = None
+
+    def get_zone_index(self):
+        """
+        Return the `DNSZoneIndex` of the bound principal, or None.
+
+        The index replaces the subtree searches for the authoritative zone
+        of a name, for NS delegations and for forward zones below a name,
+        which scan all record entries of the DNS container. It is refreshed
+        on every call, which costs a single round trip when no zone or
+        delegation has changed. Indexes of up to dns_zone_index_size
+        principals are kept, see `SyncreplCachePool`. None is also returned
+        outside of the server.
+        """
+        if self._zone_indexes is None:
+            return None
+        return self._zone_indexes.get(self.backend.conn, self.log)
+
     def _rr_zone_postprocess(self, record, **options):
         #Decode IDN ACE form to Unicode, raw records are passed directly from LDAP
         if options.get('raw', False):
@@ -2987,6 +3041,307 @@ class dnszone_remove_permission(DNSZoneBase_remove_permission):
     __doc__ = _('Remove a permission for per-zone access delegation.')
 
 
+class _ZoneFileNodes(dict):
+    """
+    Nodes of a zone file being parsed by dnspython.
+
+    Instead of keeping the whole zone in memory, the nodes are handed over
+    to ``flush`` every ``batch_size`` owner names. The parser only adds
+    records to the node it looked up last, so the nodes handed over are
+    complete. If an owner name appears again later in the file, its records
+    end up in a later batch.
+    """
+    def __init__(self, flush, batch_size):
+        super(_ZoneFileNodes, self).__init__()
+        self.__flush = flush
+        self.__batch_size = batch_size
+
+    def __setitem__(self, name, node):
+        if len(self) >= self.__batch_size:
+            self.flush()
+        super(_ZoneFileNodes, self).__setitem__(name, node)
+
+    def flush(self):
+        if self:
+            nodes = list(self.items())
+            self.clear()
+            self.__flush(nodes)
+
+
+@register()
+class dnszone_import(LDAPQuery):
+    __doc__ = _("""
+Import resource records from a zone file (RFC 1035) into a DNS zone.
+
+The zone must exist. Records are added to the records already in the zone.
+SOA records and NS records of the zone apex are skipped, they are managed
+by IPA. Records are written as they are parsed; if the zone file contains
+an error, the records which precede it are imported.
+""")
+
+    has_output = output.standard_entry
+    msg_summary = _('Imported zone file into DNS zone "%(value)s"')
+
+    # number of owner names written after one search for existing entries
+    batch_size = 1000
+
+    takes_options = (
+        Str('zonefile',
+            label=_('Zone file'),
+            doc=_('Zone file in the RFC 1035 master file format'),
+            noextrawhitespace=False,
+        ),
+    )
+
+    has_output_params = (
+        Int('names_added',
+            label=_('Names added'),
+        ),
+        Int('names_updated',
+            label=_('Names updated'),
+        ),
+        Int('records_imported',
+            label=_('Records imported'),
+        ),
+        Str('records_skipped*',
+            label=_('Records skipped'),
+        ),
+    )
+
+    def execute(self, *keys, **options):
+        ldap = self.obj.backend
+        zone = keys[-1]
+        zone_dn = self.obj.get_dn(*keys, **options)
+        try:
+            zone_entry = ldap.get_entry(zone_dn, ['objectclass'])
+        except errors.NotFound:
+            self.obj.handle_not_found(*keys)
+        if not _check_entry_objectclass(zone_entry, self.obj.object_class):
+            self.obj.handle_not_found(*keys)
+
+        result = dict(
+            names_added=0,
+            names_updated=0,
+            records_imported=0,
+            records_skipped=[],
+        )
+
+        def flush(nodes):
+            self._import_nodes(ldap, zone, zone_dn, nodes, result)
+            self.log.info(
+                "Importing zone %s: %d names added, %d names updated",
+                zone, result['names_added'], result['names_updated'])
+
+        nodes = _ZoneFileNodes(flush, self.batch_size)
+
+        def zone_factory(origin, rdclass, relativize=True):
+            zone_obj = dns.zone.Zone(origin, rdclass, relativize=relativize)
+            zone_obj.nodes = nodes
+            return zone_obj
+
+        zonefile = options['zonefile']
+        if six.PY2:
+            zonefile = zonefile.encode('utf-8')
+        try:
+            # $INCLUDE would read files of the server
+            dns.zone.from_text(zonefile, origin=zone, relativize=True,
+                               zone_factory=zone_factory,
+                               allow_include=False, check_origin=False)
+        except dns.exception.DNSException as e:
+            raise errors.ValidationError(
+                name='zonefile', error=unicode(e) or type(e).__name__)
+        finally:
+            nodes.flush()
+
+        return dict(result=result, value=pkey_to_value(zone, options))
+
+    def _get_node_attrs(self, name, node, result):
+        """
+        Return LDAP attributes of the records of a node and their minimum
+        TTL.
+        """
+        dnsrecord = self.api.Object.dnsrecord
+        attrs = {}
+        ttl = None
+        for rdataset in node.rdatasets:
+            rrtype = dns.rdatatype.to_text(rdataset.rdtype)
+            attr = record_name_format % rrtype.lower()
+            param = dnsrecord.params.get(attr)
+            if (not isinstance(param, DNSRecord) or
+                    rdataset.rdtype == dns.rdatatype.SOA or
+                    (rdataset.rdtype == _NS and name.is_empty())):
+                result['records_skipped'].append(
+                    u'%s %s' % (name.ToASCII(), rrtype))
+                continue
+            # store the values in the form dnsrecord-add would
+            attrs[attr] = list(param.normalize(
+                tuple(unicode(rd.to_text()) for rd in rdataset)))
+            if ttl is None or rdataset.ttl < ttl:
+                ttl = rdataset.ttl
+        return attrs, ttl
+
+    def _import_nodes(self, ldap, zone, zone_dn, nodes, result):
+        """
+        Write the records of zone file nodes to LDAP, adding entries for
+        new names and merging records into entries of existing names.
+        """
+        dnsrecord = self.api.Object.dnsrecord
+        records = {}
+        for name, node in nodes:
+            name = DNSName(name)
+            attrs, ttl = self._get_node_attrs(name, node, result)
+            if attrs:
+                records[name.ToASCII().lower()] = (name, attrs, ttl)
+        if not records:
+            return
+
+        # one search for the entries of all names in the batch
+        existing = {}
+        apex = DNSName.empty.ToASCII()
+        if apex in records:
+            existing[apex] = ldap.get_entry(
+                zone_dn, ['objectclass'] + _record_attributes)
+        names = [n for n in records if n != apex]
+        if names:
+            try:
+                entries = ldap.get_entries(
+                    zone_dn, ldap.SCOPE_ONELEVEL,
+                    ldap.make_filter_from_attr('idnsname', names,
+                                               rules=ldap.MATCH_ANY),
+                    ['idnsname'] + _record_attributes,
+                    size_limit=0)
+            except errors.EmptyResult:
+                entries = []
+            for entry in entries:
+                name = entry.single_value['idnsname']
+                if name.is_absolute() and name.is_subdomain(zone):
+                    name = name.relativize(zone)
+                existing[name.ToASCII().lower()] = entry
+
+        for key, (name, attrs, ttl) in records.items():
+            entry = existing.get(key)
+            count = 0
+            if entry is None:
+                entry = ldap.make_entry(
+                    DN(('idnsname', name.ToASCII()), zone_dn),
+                    objectclass=dnsrecord.object_class,
+                    idnsname=[name],
+                    dnsttl=[ttl],
+                )
+                for attr, values in attrs.items():
+                    entry[attr] = values
+                    count += len(values)
+            else:
+                for attr, values in attrs.items():
+                    old = entry.get(attr, [])
+                    # values stored in a different textual form are not
+                    # imported again
+                    current = set(
+                        dnsrecord.params[attr].normalize(tuple(old)) or ())
+                    new = [v for v in values if v not in current]
+                    if new:
+                        entry[attr] = old + new
+                        count += len(new)
+                if not count:
+                    continue
+
+            rrattrs = dict((attr, entry[attr]) for attr in _record_attributes
+                           if entry.get(attr))
+            try:
+                dnsrecord.check_record_type_collisions((zone, name), rrattrs)
+                if key in existing:
+                    ldap.update_entry(entry)
+                else:
+                    ldap.add_entry(entry)
+            except (errors.ValidationError, errors.DuplicateEntry) as e:
+                result['records_skipped'].append(
+                    u'%s: %s' % (name.ToASCII(), e))
+                continue
+
+            if key in existing:
+                result['names_updated'] += 1
+            else:
+                result['names_added'] += 1
+            result['records_imported'] += count
+
+
+@register()
+class dnszone_export(LDAPQuery):
+    __doc__ = _('Export a DNS zone as a zone file (RFC 1035).')
+
+    has_output = (
+        output.summary,
+        output.Output('result', unicode, _('Zone file')),
+        output.value,
+    )
+
+    def execute(self, *keys, **options):
+        ldap = self.obj.backend
+        zone = keys[-1]
+        zone_dn = self.obj.get_dn(*keys, **options)
+        try:
+            zone_entry = ldap.get_entry(zone_dn, ['*'])
+        except errors.NotFound:
+            self.obj.handle_not_found(*keys)
+        if not _check_entry_objectclass(zone_entry, self.obj.object_class):
+            self.obj.handle_not_found(*keys)
+
+        return dict(
+            result=u''.join(self._iter_zone_file(ldap, zone, zone_entry)),
+            value=pkey_to_value(zone, options),
+        )
+
+    def _iter_zone_file(self, ldap, zone, zone_entry):
+        """
+        Yield the lines of the zone file, the records of the zone are read
+        from LDAP as they are written.
+        """
+        yield u'$ORIGIN %s\n' % zone.ToASCII()
+        if zone_entry.get('dnsdefaultttl'):
+            yield u'$TTL %s\n' % zone_entry.single_value['dnsdefaultttl']
+
+        mname = zone_entry.get('idnssoamname')
+        if mname:
+            mname = mname[0].ToASCII()
+        else:
+            mname = u'%s.' % self.api.env.host
+        yield u'@ IN SOA %s %s %s %s %s %s %s\n' % (
+            mname,
+            zone_entry.single_value['idnssoarname'].ToASCII(),
+            zone_entry.single_value['idnssoaserial'],
+            zone_entry.single_value['idnssoarefresh'],
+            zone_entry.single_value['idnssoaretry'],
+            zone_entry.single_value['idnssoaexpire'],
+            zone_entry.single_value['idnssoaminimum'],
+        )
+        for line in self._iter_entry_records(u'@', zone_entry):
+            yield line
+
+        for entry in ldap.iter_entries(
+                '(objectclass=idnsrecord)',
+                ['idnsname', 'dnsttl'] + _record_attributes,
+                base_dn=zone_entry.dn, scope=ldap.SCOPE_ONELEVEL,
+                size_limit=0, paged_search=True):
+            name = entry.single_value['idnsname'].ToASCII()
+            for line in self._iter_entry_records(name, entry):
+                yield line
+
+    @staticmethod
+    def _iter_entry_records(name, entry):
+        ttl = entry.get('dnsttl')
+        if ttl:
+            prefix = u'%s %s IN' % (name, ttl[0])
+        else:
+            prefix = u'%s IN' % name
+        for attr in _record_attributes:
+            values = entry.get(attr)
+            if not values:
+                continue
+            rrtype = get_record_rrtype(attr)
+            for value in values:
+                yield u'%s %s %s\n' % (prefix, rrtype, value)
+
+
 @register()
 class dnsrecord(LDAPObject):
     """
@@ -4486,7 +4841,15 @@ class dns_system_records(Object):
         Str(
             'location_records*',
             label=_('IPA location records')
-        )
+        ),
+        Str(
+            'ipa_records_diff*',
+            label=_('IPA DNS records changes')
+        ),
+        Str(
+            'location_records_diff*',
+            label=_('IPA location records changes')
+        ),
     )
 
 
@@ -4511,7 +4874,8 @@ class dns_update_system_records(Method):
         Flag(
             'dry_run',
             label=_('Dry run'),
-            doc=_('Do not update records only return expected records')
+            doc=_('Do not update records only return expected records '
+                  'and their differences from current records')
         )
     )
 
@@ -4541,10 +4905,29 @@ class dns_update_system_records(Method):
         system_records = IPASystemRecords(self.api)
 
         if options.get('dry_run'):
+            base_zone = system_records.get_base_records()
+            location_zone = system_records.get_locations_records()
             result['result']['ipa_records'] = output_to_list(
-                system_records.get_base_records().items())
+                base_zone.items())
             result['result']['location_records'] = output_to_list(
-                system_records.get_locations_records().items())
+                location_zone.items())
+            try:
+                base_diff = system_records.diff_records(base_zone)
+                location_diff = system_records.diff_records(location_zone)
+            except IPADomainIsNotManagedByIPAError:
+                result['value'] = False
+                self.add_message(
+                    messages.DNSUpdateNotIPAManagedZone(
+                        zone=self.api.env.domain)
+                )
+            else:
+                if base_diff:
+                    result['result']['ipa_records_diff'] = (
+                        IPASystemRecords.records_list_from_diff(base_diff))
+                if location_diff:
+                    result['result']['location_records_diff'] = (
+                        IPASystemRecords.records_list_from_diff(
+                            location_diff))
         else:
             try:
                 (
@@ -825,6 +825,8 @@ class baseidoverride_find(LDAPSearch):
                            '%(count)d ID overrides matched', 0)
 
     takes_options = LDAPSearch.takes_options + (fallback_to_ldap_option,)
+    # anchors of AD objects are resolved by SSSD, not read from LDAP
+    cache_response = False
 
     def post_callback(self, ldap, entries, truncated, *args, **options):
         for entry in entries:
@@ -836,6 +838,8 @@ class baseidoverride_show(LDAPRetrieve):
     __doc__ = _('Display information about an ID override.')
 
     takes_options = LDAPRetrieve.takes_options + (fallback_to_ldap_option,)
+    # anchors of AD objects are resolved by SSSD, not read from LDAP
+    cache_response = False
 
     def post_callback(self, ldap, dn, entry_attrs, *keys, **options):
         self.obj.convert_anchor_to_human_readable_form(entry_attrs, **options)
@@ -27,9 +27,13 @@ Backend plugin for LDAP.
 # binding encodes them into the appropriate representation. This applies to
 # everything except the CrudBackend methods, where dn is part of the entry dict.
 
+import collections
 import os
+import threading
+import time
 
 import ldap as _ldap
+from ldap.syncrepl import SyncreplConsumer
 
 from ipalib import krb_utils
 from ipaplatform.paths import paths
@@ -61,12 +65,480 @@ register = Registry()
 _missing = object()
 
 
+class LDAPConnectionPool(object):
+    """
+    Per-process pool of bound LDAP connections.
+
+    Connections are stored under a key describing the identity they are
+    bound as (LDAP URI and Kerberos principal), so a connection is only ever
+    handed out again to the same principal which bound it.
+
+    Idle connections are evicted once they were not used for *max_idle*
+    seconds. No more than *max_size* idle connections are kept; the least
+    recently used one is unbound when the limit is exceeded. A connection
+    which was idle for more than *check_interval* seconds is verified with
+    a WHOAMI extended operation before it is handed out.
+    """
+
+    def __init__(self, max_size=8, max_idle=300, check_interval=10):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        # key -> list of (conn, time of checkin), most recent last
+        self._idle = {}
+        # id(conn) -> (key, conn)
+        self._in_use = {}
+
+    def __len__(self):
+        """Return the number of idle connections in the pool."""
+        with self._lock:
+            return sum(len(conns) for conns in self._idle.values())
+
+    def _evict(self, now):
+        """
+        Remove expired and surplus idle connections from the pool.
+
+        Must be called with the lock held. Returns the list of connections
+        which should be unbound.
+        """
+        evicted = []
+        candidates = []
+        for key, conns in list(self._idle.items()):
+            alive = []
+            for conn, last_used in conns:
+                if now - last_used > self.max_idle:
+                    evicted.append(conn)
+                else:
+                    alive.append((conn, last_used))
+                    candidates.append((last_used, key, conn))
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+
+        surplus = len(candidates) - self.max_size
+        if surplus > 0:
+            candidates.sort(key=lambda c: c[0])
+            for _last_used, key, conn in candidates[:surplus]:
+                conns = [c for c in self._idle[key] if c[0] is not conn]
+                if conns:
+                    self._idle[key] = conns
+                else:
+                    del self._idle[key]
+                evicted.append(conn)
+
+        return evicted
+
+    def _unbind(self, conns):
+        for conn in conns:
+            try:
+                conn.unbind_s()
+            except _ldap.LDAPError:
+                pass
+
+    def _is_healthy(self, conn):
+        try:
+            conn.whoami_s()
+        except _ldap.LDAPError:
+            return False
+        return True
+
+    def checkout(self, key):
+        """
+        Return an idle connection bound for *key*, or None.
+
+        The returned connection is considered in use until it is passed to
+        `checkin` or `discard`.
+        """
+        while True:
+            now = time.time()
+            with self._lock:
+                evicted = self._evict(now)
+                conns = self._idle.get(key)
+                if conns:
+                    conn, last_used = conns.pop()
+                    if not conns:
+                        del self._idle[key]
+                else:
+                    conn = None
+            self._unbind(evicted)
+
+            if conn is None:
+                return None
+
+            if (now - last_used > self.check_interval and
+                    not self._is_healthy(conn)):
+                self._unbind([conn])
+                continue
+
+            with self._lock:
+                self._in_use[id(conn)] = (key, conn)
+            return conn
+
+    def register(self, key, conn):
+        """
+        Mark freshly bound connection *conn* as in use for *key*.
+
+        The connection will be kept in the pool when it is checked in.
+        """
+        with self._lock:
+            self._in_use[id(conn)] = (key, conn)
+
+    def checkin(self, conn):
+        """
+        Return connection *conn* to the pool.
+
+        Returns True if the connection was taken by the pool and False if
+        it is not managed by the pool and the caller should unbind it.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._in_use.pop(id(conn), None)
+            if item is None or item[1] is not conn:
+                return False
+            if self.max_size <= 0:
+                return False
+            self._idle.setdefault(item[0], []).append((conn, now))
+            evicted = self._evict(now)
+        self._unbind(evicted)
+        return True
+
+    def discard(self, conn):
+        """Forget about connection *conn* without returning it to the pool."""
+        with self._lock:
+            self._in_use.pop(id(conn), None)
+
+    def clear(self):
+        """Unbind all idle connections."""
+        with self._lock:
+            conns = [c for cs in self._idle.values() for c, _t in cs]
+            self._idle.clear()
+        self._unbind(conns)
+
+
+class LDAPEntryCache(object):
+    """
+    Per-process cache of rarely changing singleton entries.
+
+    Raw attributes of entries are stored under a key which includes the
+    principal which read them, so an entry is only ever handed out again
+    to a principal which is allowed to read it.
+
+    A cached entry is used as is for *ttl* seconds. After that, it has to
+    be revalidated by the caller by comparing its entryUSN with the one on
+    the server before it is marked fresh again. No more than *max_size*
+    entries are kept; the least recently used one is dropped when the
+    limit is exceeded.
+    """
+
+    def __init__(self, ttl=60, max_size=64):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        # key -> (expiration time, dn, raw attributes, entryUSN)
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """
+        Return (fresh, dn, raw attributes, entryUSN) cached for *key*, or
+        None.
+
+        fresh is False if the entry has to be revalidated before use.
+        """
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is None:
+                return None
+            self._entries[key] = item
+        expires, dn, raw, usn = item
+        return (time.time() < expires, dn, raw, usn)
+
+    def set(self, key, dn, raw, usn):
+        """
+        Cache raw attributes *raw* of entry *dn* with entryUSN *usn* for
+        *key*.
+        """
+        item = (time.time() + self.ttl, dn, raw, usn)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = item
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def touch(self, key):
+        """Mark the entry cached for *key* as fresh again."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries[key] = (time.time() + self.ttl,) + item[1:]
+
+    def invalidate(self, dn=None):
+        """Drop entry *dn* for all principals, or all entries."""
+        with self._lock:
+            if dn is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if key[1] == dn:
+                    del self._entries[key]
+
+
+class SyncreplCache(SyncreplConsumer):
+    """
+    Base class of in-memory data built from the entries below a base DN.
+
+    The data is kept current with the Content Synchronization (syncrepl)
+    plugin: `refresh` performs a refreshOnly sync of the entries matching
+    `filterstr` which, after the initial load, only transfers entries
+    changed since the previous refresh.
+
+    Subclasses maintain their data in `_add` and `_remove`, which are called
+    with the UUID of a changed entry, and reset it in `_clear`. `_add` must
+    record every entry it keeps in ``self._uuids``.
+    """
+
+    filterstr = '(objectClass=*)'
+    attrlist = None
+
+    def __init__(self, base_dn):
+        self.base_dn = base_dn
+        self.lock = threading.RLock()
+        self._conn = None
+        self.clear()
+
+    def clear(self):
+        """Forget all entries; the next refresh reloads all of them."""
+        with self.lock:
+            self._cookie = None
+            # uuid -> key of the entry in the subclass data
+            self._uuids = {}
+            self._present = set()
+            self._clear()
+
+    def __len__(self):
+        with self.lock:
+            return len(self._uuids)
+
+    def refresh(self, conn):
+        """
+        Apply changes since the previous refresh using connection *conn*.
+
+        On error all entries are forgotten and the exception is re-raised.
+        """
+        with self.lock:
+            self._conn = conn
+            try:
+                msgid = self.syncrepl_search(
+                    str(self.base_dn), _ldap.SCOPE_SUBTREE,
+                    mode='refreshOnly',
+                    filterstr=self.filterstr,
+                    attrlist=self.attrlist)
+                while self.syncrepl_poll(msgid=msgid, all=1):
+                    pass
+            except _ldap.LDAPError:
+                self.clear()
+                raise
+            finally:
+                self._conn = None
+
+    def _clear(self):
+        raise NotImplementedError()
+
+    def _add(self, uuid, dn, attributes):
+        raise NotImplementedError()
+
+    def _remove(self, uuid):
+        raise NotImplementedError()
+
+    # SyncreplConsumer interface
+
+    def search_ext(self, *args, **kwargs):
+        return self._conn.search_ext(*args, **kwargs)
+
+    def result4(self, *args, **kwargs):
+        return self._conn.result4(*args, **kwargs)
+
+    def syncrepl_get_cookie(self):
+        return self._cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self._cookie = cookie
+
+    def syncrepl_entry(self, dn, attributes, uuid):
+        self._add(uuid, DN(dn), attributes)
+
+    def syncrepl_delete(self, uuids):
+        for uuid in uuids:
+            self._remove(uuid)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        if uuids is None:
+            if refreshDeletes is False:
+                self.syncrepl_delete(
+                    [u for u in list(self._uuids) if u not in self._present])
+            self._present = set()
+        else:
+            self._present.update(uuids)
+
+
+
+class SyncreplCachePool(object):
+    """
+    Per-process set of `SyncreplCache` instances, one per principal.
+
+    Caches are kept per principal so that they only hold entries the
+    principal is allowed to read. No more than *max_size* of them are kept;
+    the least recently used one is dropped when the limit is exceeded, and
+    is loaded again by a full refresh when its principal asks next time.
+    """
+
+    def __init__(self, factory, max_size, name):
+        self.factory = factory
+        self.max_size = max_size
+        self.name = name
+        self.enabled = True
+
+        self._lock = threading.Lock()
+        # principal -> cache
+        self._caches = collections.OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._caches)
+
+    def get(self, conn, log):
+        """
+        Return the cache of the bound principal refreshed using connection
+        *conn*, or None.
+
+        None is returned for connections not bound by GSSAPI and when the
+        cache cannot be synchronized.
+        """
+        if not self.enabled:
+            return None
+
+        principal = getattr(context, 'principal', None)
+        if principal is None:
+            return None
+
+        with self._lock:
+            cache = self._caches.pop(principal, None)
+            if cache is None:
+                cache = self.factory()
+            self._caches[principal] = cache
+            while len(self._caches) > self.max_size:
+                self._caches.popitem(last=False)
+
+        try:
+            cache.refresh(conn)
+        except _ldap.UNAVAILABLE_CRITICAL_EXTENSION:
+            # syncrepl is not enabled on the server, stop trying
+            log.info("Content synchronization is not available, %s "
+                     "disabled", self.name)
+            self.enabled = False
+            return None
+        except _ldap.LDAPError as e:
+            log.debug("Failed to refresh %s: %s", self.name, e)
+            return None
+
+        return cache
+
+class MemberGraph(SyncreplCache):
+    """
+    In-memory graph of the membership attributes below a base DN.
+
+    The graph holds the member, memberUser and memberHost values of every
+    entry which has any of them, i.e. the same edges the memberOf plugin
+    follows, and answers indirect membership queries without searching
+    the directory.
+    """
+
+    member_attrs = ('member', 'memberuser', 'memberhost')
+    filterstr = '(|(member=*)(memberuser=*)(memberhost=*))'
+    attrlist = list(member_attrs)
+
+    def _clear(self):
+        # dn -> frozenset of DNs in member
+        self._members = {}
+        # dn -> frozenset of DNs in member, memberUser and memberHost
+        self._links = {}
+        # dn -> set of DNs linking to it
+        self._parents = {}
+
+    def get_direct_memberof(self, dn):
+        """Return DNs of entries which directly link to *dn*."""
+        with self.lock:
+            return set(self._parents.get(dn, ()))
+
+    def get_indirect_members(self, dn):
+        """
+        Return DNs of the members of entries which are nested in *dn*.
+
+        This matches the member values of all entries which have *dn* in
+        their memberOf attribute. Direct members of *dn* are included
+        only if they are also members of a nested entry.
+        """
+        with self.lock:
+            seen = set()
+            todo = list(self._links.get(dn, ()))
+            while todo:
+                member = todo.pop()
+                if member in seen:
+                    continue
+                seen.add(member)
+                todo.extend(self._links.get(member, ()))
+
+            result = set()
+            for member in seen:
+                result.update(self._members.get(member, ()))
+            return result
+
+    def _add(self, uuid, dn, attributes):
+        self._remove(uuid)
+
+        links = set()
+        for name, values in attributes.items():
+            if name.lower() not in self.member_attrs:
+                continue
+            dns = frozenset(DN(v.decode('utf-8')) for v in values)
+            if name.lower() == 'member':
+                self._members[dn] = dns
+            links.update(dns)
+
+        self._uuids[uuid] = dn
+        self._links[dn] = frozenset(links)
+        for member in links:
+            self._parents.setdefault(member, set()).add(dn)
+
+    def _remove(self, uuid):
+        dn = self._uuids.pop(uuid, None)
+        if dn is None:
+            return
+        self._members.pop(dn, None)
+        for member in self._links.pop(dn, ()):
+            parents = self._parents.get(member)
+            if parents is not None:
+                parents.discard(dn)
+                if not parents:
+                    del self._parents[member]
+
+
 @register()
 class ldap2(CrudBackend, LDAPClient):
     """
     LDAP Backend Take 2.
     """
 
+    # maximum number of member values changed by a single modify
+    member_chunk_size = 1000
+
     def __init__(self, api):
         force_schema_updates = api.env.context in ('installer', 'updates')
 
@@ -77,6 +549,28 @@ class ldap2(CrudBackend, LDAPClient):
         self._time_limit = float(LDAPClient.time_limit)
         self._size_limit = int(LDAPClient.size_limit)
 
+        if api.env.in_server and api.env.ldap_pool_size > 0:
+            self._pool = LDAPConnectionPool(
+                max_size=api.env.ldap_pool_size,
+                max_idle=api.env.ldap_pool_max_idle,
+                check_interval=api.env.ldap_pool_check_interval)
+        else:
+            self._pool = None
+
+        if api.env.in_server and api.env.ldap_entry_cache_ttl > 0:
+            self._entry_cache = LDAPEntryCache(
+                ttl=api.env.ldap_entry_cache_ttl)
+        else:
+            self._entry_cache = None
+
+        if api.env.in_server and api.env.member_graph_size > 0:
+            self._member_graphs = SyncreplCachePool(
+                lambda: MemberGraph(api.env.basedn),
+                max_size=api.env.member_graph_size,
+                name="membership graph")
+        else:
+            self._member_graphs = None
+
     @property
     def ldap_uri(self):
         return self.api.env.ldap_uri
@@ -149,6 +643,10 @@ class ldap2(CrudBackend, LDAPClient):
                 - _missing - keeps previously configured settings
                              (unlimited set by default in constructor)
 
+        When running in the server, GSSAPI bound connections are taken from
+        and returned to a per-process connection pool (see
+        `LDAPConnectionPool`), which avoids a SASL bind for every request.
+
         Extends backend.Connectible.create_connection.
         """
         if bind_dn is None:
@@ -205,17 +703,34 @@ class ldap2(CrudBackend, LDAPClient):
 
             principal = krb_utils.get_principal(ccache_name=ccache)
 
+            # connections with controls set at bind time are not shared
+            pool_key = None
+            if (self._pool is not None and serverctrls is None and
+                    clientctrls is None):
+                pool_key = (self.ldap_uri, principal)
+                pooled_conn = self._pool.checkout(pool_key)
+                if pooled_conn is not None:
+                    self._flush_schema()
+                    setattr(context, 'principal', principal)
+                    return pooled_conn
+
             client.gssapi_bind(server_controls=serverctrls,
                                client_controls=clientctrls)
             setattr(context, 'principal', principal)
 
+            if pool_key is not None:
+                self._pool.register(pool_key, conn)
+
         return conn
 
     def destroy_connection(self):
         """Disconnect from LDAP server."""
         try:
             if self.conn is not None:
-                self.unbind()
+                if self._pool is not None and self._pool.checkin(self.conn):
+                    self._flush_schema()
+                else:
+                    self.unbind()
         except errors.PublicError:
             # ignore when trying to unbind multiple times
             pass
@@ -223,6 +738,91 @@ class ldap2(CrudBackend, LDAPClient):
         object.__delattr__(self, 'time_limit')
         object.__delattr__(self, 'size_limit')
 
+    def get_member_graph(self):
+        """
+        Return the `MemberGraph` of the bound principal, or None.
+
+        The graph is refreshed on every call, which costs a single round
+        trip when nothing has changed. Graphs of up to member_graph_size
+        principals are kept, see `SyncreplCachePool`. None is also returned
+        outside of the server.
+        """
+        if self._member_graphs is None:
+            return None
+        return self._member_graphs.get(self.conn, self.log)
+
+    def _get_singleton_entry(self, dn, attrs_list=None):
+        """
+        Get entry dn, using the per-process entry cache if possible.
+
+        Entries are only cached for connections bound by GSSAPI. A cached
+        entry older than ldap_entry_cache_ttl seconds is only used after
+        checking that its entryUSN has not changed.
+
+        :raises: errors.NotFound if the entry doesn't exist
+        """
+        principal = getattr(context, 'principal', None)
+        if self._entry_cache is None or principal is None:
+            return self._find_singleton_entry(dn, attrs_list)
+
+        key = (principal, dn)
+        cached = self._entry_cache.get(key)
+        if cached is not None:
+            fresh, entry_dn, raw, usn = cached
+            if not fresh and usn is not None:
+                entry = self._find_singleton_entry(dn, ['entryusn'])
+                if entry.raw.get('entryusn') == usn:
+                    self._entry_cache.touch(key)
+                    fresh = True
+            if fresh:
+                return self._convert_entry(
+                    entry_dn, dict((k, list(v)) for k, v in raw.items()))
+
+        entry = self._find_singleton_entry(dn, ['*', 'entryusn'])
+        usn = entry.raw.get('entryusn')
+        raw = dict((k, list(v)) for k, v in entry.raw.items()
+                   if k.lower() != 'entryusn')
+        self._entry_cache.set(key, str(entry.dn), raw, usn)
+        return self._convert_entry(
+            str(entry.dn), dict((k, list(v)) for k, v in raw.items()))
+
+    def _find_singleton_entry(self, dn, attrs_list):
+        # use find_entries here lest we hit an infinite recursion when
+        # ldap2.get_entries tries to determine default time/size limits
+        (entries, truncated) = self.find_entries(
+            None, attrs_list, base_dn=dn, scope=self.SCOPE_BASE,
+            time_limit=2, size_limit=10
+        )
+        self.handle_truncated_result(truncated)
+        return entries[0]
+
+    def get_last_usn(self):
+        """
+        Return the last USN of the directory server, or None if it is not
+        available.
+
+        With the global entryUSN mode of the USN plugin, the last USN is
+        increased by every change of any entry in the directory.
+        """
+        try:
+            entry = self._find_singleton_entry(DN(''), ['lastusn'])
+        except errors.NotFound:
+            return None
+        values = entry.raw.get('lastusn')
+        if not values:
+            return None
+        return values[0].decode('utf-8')
+
+    def invalidate_entry_cache(self, dn=None):
+        """
+        Drop entry dn, or all entries, from the per-process entry cache.
+        """
+        if self._entry_cache is not None:
+            self._entry_cache.invalidate(dn)
+        config_entry = getattr(context, 'config_entry', None)
+        if config_entry is not None and (dn is None or config_entry.dn == dn):
+            del context.config_entry
+
     def get_ipa_config(self, attrs_list=None):
         """Returns the IPA configuration entry (dn, entry_attrs)."""
 
@@ -237,14 +837,7 @@ class ldap2(CrudBackend, LDAPClient):
             # Not in our context yet
             pass
         try:
-            # use find_entries here lest we hit an infinite recursion when
-            # ldap2.get_entries tries to determine default time/size limits
-            (entries, truncated) = self.find_entries(
-                None, attrs_list, base_dn=dn, scope=self.SCOPE_BASE,
-                time_limit=2, size_limit=10
-            )
-            self.handle_truncated_result(truncated)
-            config_entry = entries[0]
+            config_entry = self._get_singleton_entry(dn, attrs_list)
         except errors.NotFound:
             config_entry = self.make_entry(dn)
 
@@ -265,17 +858,14 @@ class ldap2(CrudBackend, LDAPClient):
                     ('cn', 'etc'), self.api.env.basedn)
 
         try:
-            with self.error_handler():
-                upg_entries = self.conn.search_s(str(upg_dn), _ldap.SCOPE_BASE,
-                                                 attrlist=['*'])
-                upg_entries = self._convert_result(upg_entries)
+            upg_entry = self._get_singleton_entry(upg_dn, ['*'])
         except errors.NotFound:
-            upg_entries = None
-        if not upg_entries or 'originfilter' not in upg_entries[0]:
+            upg_entry = None
+        if upg_entry is None or 'originfilter' not in upg_entry:
             raise errors.ACIError(info=_(
                 'Could not read UPG Definition originfilter. '
                 'Check your permissions.'))
-        org_filter = upg_entries[0].single_value['originfilter']
+        org_filter = upg_entry.single_value['originfilter']
         return '(objectclass=disable)' not in org_filter
 
     def get_effective_rights(self, dn, attrs_list):
@@ -448,6 +1038,153 @@ class ldap2(CrudBackend, LDAPClient):
         except errors.MidairCollision:
             raise errors.NotGroupMember()
 
+    def _get_existing_entries(self, dns):
+        """
+        Look up entries designated by dns.
+
+        Entries are searched for by their RDN in their parent container,
+        using a single search per container and chunk of member_chunk_size
+        entries. Returns a dict mapping each dn found to its entry, and
+        a list of (dn, error) tuples for the rest.
+        """
+        found = {}
+        children = collections.OrderedDict()
+        for dn in dns:
+            if len(dn) > 1 and len(dn[0]) == 1:
+                children.setdefault(dn[1:], []).append(dn)
+
+        for parent_dn, child_dns in children.items():
+            for i in range(0, len(child_dns), self.member_chunk_size):
+                chunk = child_dns[i:i + self.member_chunk_size]
+                filter = self.combine_filters(
+                    [self.make_filter_from_attr(dn[0].attr, dn[0].value)
+                     for dn in chunk],
+                    self.MATCH_ANY)
+                try:
+                    for entry in self.iter_entries(
+                            filter, [''], parent_dn, self.SCOPE_ONELEVEL,
+                            size_limit=0):
+                        found[entry.dn] = entry
+                except (errors.NotFound, errors.LimitsExceeded):
+                    pass
+
+        result = {}
+        failed = []
+        for dn in dns:
+            entry = found.get(dn)
+            if entry is None:
+                # not found by the search, get the error to report
+                try:
+                    entry = self.get_entry(dn, [''])
+                except errors.PublicError as e:
+                    failed.append((dn, e))
+                    continue
+            result[dn] = entry
+        return result, failed
+
+    def _modify_group_members(self, op, members, group_dn, member_attr,
+                              fallback):
+        """
+        Add or remove members in chunks of member_chunk_size values with a
+        single modify each. members is a list of (dn, value) tuples, dn
+        being the DN passed in by the caller and value the DN written to
+        member_attr. When a modify fails, each member of the chunk is
+        processed again by calling fallback(value) to find out which failed.
+
+        Returns a list of (dn, error) tuples for the failed members.
+        """
+        failed = []
+        for i in range(0, len(members), self.member_chunk_size):
+            chunk = members[i:i + self.member_chunk_size]
+            try:
+                with self.error_handler():
+                    self.conn.modify_s(
+                        str(group_dn),
+                        [(op, member_attr,
+                          self.encode([value for _dn, value in chunk]))])
+            except errors.PublicError:
+                for dn, value in chunk:
+                    try:
+                        fallback(value)
+                    except errors.PublicError as e:
+                        failed.append((dn, e))
+        return failed
+
+    def add_entries_to_group(self, dns, group_dn, member_attr='member',
+                             allow_same=False):
+        """
+        Add entries designated by dns to group group_dn in the member
+        attribute member_attr.
+
+        This is the bulk variant of add_entry_to_group: the entries are
+        checked for existence with batched searches and added with a single
+        modify per chunk of member_chunk_size entries.
+
+        Returns a list of (dn, error) tuples for entries which could not be
+        added, error being the exception add_entry_to_group would raise.
+        """
+        assert all(isinstance(dn, DN) for dn in dns)
+        assert isinstance(group_dn, DN)
+
+        self.log.debug(
+            "add_entries_to_group: %d entries group_dn=%s member_attr=%s",
+            len(dns), group_dn, member_attr)
+
+        entries, failed = self._get_existing_entries(dns)
+
+        members = []
+        for dn in dns:
+            entry = entries.get(dn)
+            if entry is None:
+                continue
+            if entry.dn == group_dn and not allow_same:
+                failed.append((dn, errors.SameGroupError()))
+                continue
+            members.append(dn)
+
+        def add_member(dn):
+            try:
+                with self.error_handler():
+                    self.conn.modify_s(
+                        str(group_dn),
+                        [(_ldap.MOD_ADD, member_attr, self.encode([dn]))])
+            except errors.DatabaseError:
+                raise errors.AlreadyGroupMember()
+
+        # the member values use the DN of the entry as stored by the server
+        failed.extend(self._modify_group_members(
+            _ldap.MOD_ADD, [(dn, entries[dn].dn) for dn in members], group_dn,
+            member_attr, add_member))
+
+        # report failures in the order the entries were passed in
+        order = {}
+        for i, dn in enumerate(dns):
+            order.setdefault(dn, i)
+        failed.sort(key=lambda f: order[f[0]])
+        return failed
+
+    def remove_entries_from_group(self, dns, group_dn, member_attr='member'):
+        """
+        Remove entries designated by dns from group group_dn.
+
+        This is the bulk variant of remove_entry_from_group, which removes
+        the entries with a single modify per chunk of member_chunk_size
+        entries.
+
+        Returns a list of (dn, error) tuples for entries which could not be
+        removed.
+        """
+        assert all(isinstance(dn, DN) for dn in dns)
+        assert isinstance(group_dn, DN)
+
+        self.log.debug(
+            "remove_entries_from_group: %d entries group_dn=%s "
+            "member_attr=%s", len(dns), group_dn, member_attr)
+
+        return self._modify_group_members(
+            _ldap.MOD_DELETE, [(dn, dn) for dn in dns], group_dn, member_attr,
+            lambda dn: self.remove_entry_from_group(dn, group_dn, member_attr))
+
     def set_entry_active(self, dn, active):
         """Mark entry active/inactive."""
 
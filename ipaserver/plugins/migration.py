@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
 import re
 from ldap import MOD_ADD
 from ldap import SCOPE_BASE, SCOPE_ONELEVEL, SCOPE_SUBTREE
@@ -738,13 +739,23 @@ migration process might be incomplete\n''')
             migrated[ldap_obj_name] = []
             failed[ldap_obj_name] = {}
 
+            # entries are streamed from the remote server one by one, so
+            # that the whole container is never held in memory
+            entries = ds_ldap.iter_entries(
+                search_filter, ['*'], search_bases[ldap_obj_name],
+                scope,
+                time_limit=0, size_limit=-1
+            )
             try:
-                entries, truncated = ds_ldap.find_entries(
-                    search_filter, ['*'], search_bases[ldap_obj_name],
-                    scope,
-                    time_limit=0, size_limit=-1
+                entries = itertools.chain([next(entries)], entries)
+            except errors.LimitsExceeded:
+                entries = []
+                self.log.error(
+                    '%s: %s' % (
+                        ldap_obj.name, self.truncated_err_msg
+                    )
                 )
-            except errors.NotFound:
+            except (StopIteration, errors.NotFound):
                 if not options.get('continue',False):
                     raise errors.NotFound(
                         reason=_('%(container)s LDAP search did not return any result '
@@ -755,14 +766,8 @@ migration process might be incomplete\n''')
                                     'objectclass': ', '.join(oc_list)}
                     )
                 else:
-                    truncated = False
                     entries = []
-            if truncated:
-                self.log.error(
-                    '%s: %s' % (
-                        ldap_obj.name, self.truncated_err_msg
-                    )
-                )
+            entries = self._iter_untruncated(ldap_obj, entries)
 
             blacklists = {}
             for blacklist in ('oc_blacklist', 'attr_blacklist'):
@@ -867,6 +872,21 @@ migration process might be incomplete\n''')
 
         return (migrated, failed)
 
+    def _iter_untruncated(self, ldap_obj, entries):
+        """
+        Yield entries from search result generator *entries*, logging an
+        error instead of raising if the search result was truncated.
+        """
+        try:
+            for entry_attrs in entries:
+                yield entry_attrs
+        except errors.LimitsExceeded:
+            self.log.error(
+                '%s: %s' % (
+                    ldap_obj.name, self.truncated_err_msg
+                )
+            )
+
     def execute(self, ldapuri, bindpw, **options):
         ldap = self.api.Backend.ldap2
         self.normalize_options(options)
@@ -2,9 +2,13 @@
 # Copyright (C) 2016  FreeIPA Contributors see COPYING for license
 #
 
+import contextlib
+import gzip
 import importlib
 import itertools
+import os
 import sys
+import tempfile
 
 import six
 import hashlib
@@ -16,7 +20,10 @@ from ipalib.frontend import Command, Local, Method, Object
 from ipalib.output import Entry, ListOfEntries, ListOfPrimaryKeys, PrimaryKey
 from ipalib.parameters import Bool, Dict, Flag, Str
 from ipalib.plugable import Registry
+from ipalib.request import context
+from ipalib.rpc import json_decode_binary, json_encode_binary
 from ipalib.text import _
+from ipaplatform.paths import paths
 from ipapython.version import API_VERSION
 
 # Schema TTL sent to clients in response to schema call.
@@ -46,6 +53,28 @@ if six.PY3:
 register = Registry()
 
 
+def _is_translation_key(name):
+    return name == 'languages' or isinstance(name, tuple)
+
+
+@contextlib.contextmanager
+def _c_locale():
+    """
+    Makes messages translated in the current thread use the C locale
+    """
+    saved = dict((k, v) for k, v in context.__dict__.items()
+                 if _is_translation_key(k))
+    for k in saved:
+        del context.__dict__[k]
+    context.languages = ['C']
+    try:
+        yield
+    finally:
+        for k in [k for k in context.__dict__ if _is_translation_key(k)]:
+            del context.__dict__[k]
+        context.__dict__.update(saved)
+
+
 class BaseMetaObject(Object):
     takes_params = (
         Str(
@@ -777,7 +806,106 @@ class schema(Command):
 
         return unicode(fingerprint.hexdigest()[:8])
 
+    def _get_cache_key(self):
+        """
+        Returns key identifying schema stored in the schema cache file
+
+        The key changes whenever a module defining any command or object
+        changes. It does not depend on the locale, as the schema is always
+        generated in the C locale.
+        """
+        key = hashlib.sha1()
+        key.update(API_VERSION.encode('utf-8'))
+
+        modules = set(plugin.__module__ for plugin in
+                      itertools.chain(self.api.Command, self.api.Object))
+        for name in sorted(modules):
+            filename = getattr(sys.modules.get(name), '__file__', None)
+            try:
+                st = os.stat(filename)
+            except (OSError, TypeError):
+                st_info = 'missing'
+            else:
+                st_info = '%d:%d' % (st.st_size, st.st_mtime)
+            key.update(('%s:%s;' % (name, st_info)).encode('utf-8'))
+
+        return unicode(key.hexdigest())
+
+    def _use_cache_file(self):
+        return not self.api.env.in_tree
+
+    def _load_cache(self, key):
+        """
+        Returns schema from the schema cache file if it matches key
+        """
+        try:
+            with gzip.open(paths.IPA_API_SCHEMA_CACHE, 'rb') as f:
+                data = json_decode_binary(f.read())
+        except (IOError, OSError, ValueError) as e:
+            self.debug("Failed to read API schema cache: %s", e)
+            return None
+
+        if not isinstance(data, dict) or data.get('key') != key:
+            return None
+        return data['schema']
+
+    def _store_cache(self, key, schema):
+        """
+        Stores schema to the schema cache file
+        """
+        data = json_encode_binary(dict(key=key, schema=schema), API_VERSION)
+        dirname = os.path.dirname(paths.IPA_API_SCHEMA_CACHE)
+        try:
+            fd, tmpname = tempfile.mkstemp(dir=dirname)
+        except (IOError, OSError) as e:
+            self.debug("Failed to store API schema cache: %s", e)
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                    gz.write(data.encode('utf-8'))
+            os.chmod(tmpname, 0o644)
+            os.rename(tmpname, paths.IPA_API_SCHEMA_CACHE)
+        except (IOError, OSError) as e:
+            self.debug("Failed to store API schema cache: %s", e)
+            os.unlink(tmpname)
+
+    def update_cache(self):
+        """
+        Generates schema and stores it to the schema cache file, unless the
+        stored schema is up to date
+        """
+        key = self._get_cache_key()
+        if self._load_cache(key) is None:
+            self._store_cache(key, self._generate_schema())
+
+    def _get_schema(self, **kwargs):
+        """
+        Returns the schema, either generated or from the schema cache file
+        """
+        if not self._use_cache_file():
+            return self._generate_schema(**kwargs)
+
+        key = self._get_cache_key()
+        schema = self._load_cache(key)
+        if schema is None:
+            schema = self._generate_schema(**kwargs)
+            self._store_cache(key, schema)
+        return schema
+
     def _generate_schema(self, **kwargs):
+        """
+        Generates the schema
+
+        Labels and docs are not translated, so that the schema and its
+        fingerprint do not depend on the language of the request which
+        happened to generate it.
+        """
+        with _c_locale():
+            return self._do_generate_schema(**kwargs)
+
+    def _do_generate_schema(self, **kwargs):
         commands = list(self.api.Object.command.search(**kwargs))
         for command in commands:
             name = command['name']
@@ -806,7 +934,7 @@ class schema(Command):
         try:
             schema = self.api._schema
         except AttributeError:
-            schema = self._generate_schema(**kwargs)
+            schema = self._get_schema(**kwargs)
             setattr(self.api, '_schema', schema)
 
         schema['ttl'] = SCHEMA_TTL
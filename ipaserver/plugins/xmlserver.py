@@ -31,7 +31,7 @@ if api.env.context in ('server', 'lite'):
     from ipaserver.rpcserver import (
         wsgi_dispatch, xmlserver, jsonserver_kerb, jsonserver_session,
         login_kerberos, login_x509, login_password, change_password,
-        sync_token, xmlserver_session)
+        sync_token, xmlserver_session, metrics)
     register()(wsgi_dispatch)
     register()(xmlserver)
     register()(jsonserver_kerb)
@@ -42,3 +42,4 @@ if api.env.context in ('server', 'lite'):
     register()(change_password)
     register()(sync_token)
     register()(xmlserver_session)
+    register()(metrics)
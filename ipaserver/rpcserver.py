@@ -24,8 +24,13 @@ Also see the `ipalib.rpc` module.
 """
 
 from xml.sax.saxutils import escape
+import collections
+import hashlib
+import json
 import os
+import threading
 import traceback
+import zlib
 
 import gssapi
 import requests
@@ -39,7 +44,7 @@ from six.moves.urllib.parse import parse_qs
 from six.moves.xmlrpc_client import Fault
 # pylint: enable=import-error
 
-from ipalib import plugable, errors
+from ipalib import plugable, errors, perf
 from ipalib.capabilities import VERSION_WITHOUT_CAPABILITIES
 from ipalib.frontend import Local
 from ipalib.install.kinit import kinit_armor, kinit_password
@@ -49,7 +54,7 @@ from ipalib.errors import (PublicError, InternalError, JSONError,
     ExecutionError, PasswordExpired, KrbPrincipalExpired, UserLocked)
 from ipalib.request import context, destroy_context
 from ipalib.rpc import (xml_dumps, xml_loads,
-    json_encode_binary, json_decode_binary)
+    json_encode_binary_iter, json_decode_binary)
 from ipapython.dn import DN
 from ipaserver.plugins.ldap2 import ldap2
 from ipalib.backend import Backend
@@ -68,7 +73,10 @@ if six.PY3:
     unicode = str
 
 HTTP_STATUS_SUCCESS = '200 Success'
+HTTP_STATUS_NOT_MODIFIED = '304 Not Modified'
 HTTP_STATUS_SERVER_ERROR = '500 Internal Server Error'
+# suffix mod_deflate adds to the entity tags of compressed responses
+DEFLATE_ETAG_SUFFIX = '-gzip"'
 
 _not_found_template = """<html>
 <head>
@@ -295,6 +303,143 @@ class wsgi_dispatch(Executioner, HTTP_Status):
 
 
 
+def get_content_encoding(environ):
+    """
+    Return the content encoding of a response to request *environ*, gzip
+    or deflate if the client accepts it, or None.
+    """
+    accepted = {}
+    for item in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _sep, params = item.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _sep, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    for coding in ('gzip', 'deflate'):
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress_chunks(chunks, coding):
+    """
+    Compress iterable of bytes *chunks* with content encoding *coding*.
+    """
+    if coding == 'gzip':
+        wbits = 16 + zlib.MAX_WBITS
+    else:
+        wbits = zlib.MAX_WBITS
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, wbits)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ResponseCache(object):
+    """
+    Per-process cache of results of read-only commands.
+
+    A result is stored under a key identifying the request (principal,
+    command, arguments, options and language) together with the last USN
+    of the directory server read before the command was executed. It is
+    only handed out again while the last USN is the same, i.e. while no
+    entry in the directory changed. This covers changes of the entries the
+    command read as well as membership and ACI changes.
+
+    The first request of a key only marks the key as requested, see
+    `remember`, so that the last USN is not read for requests which are
+    never repeated.
+
+    No more than *max_size* results and marked keys are kept; the least
+    recently used one is dropped when the limit is exceeded.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        # key -> (last USN, result), (None, None) for marked keys
+        self._results = collections.OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def get(self, key, usn):
+        """
+        Return the result cached for *key* at last USN *usn*, or None.
+        """
+        with self._lock:
+            item = self._results.pop(key, None)
+            if item is None or item[0] != usn:
+                return None
+            self._results[key] = item
+        return item[1]
+
+    def set(self, key, usn, result):
+        """Cache *result* for *key* computed at last USN *usn*."""
+        with self._lock:
+            self._results.pop(key, None)
+            self._results[key] = (usn, result)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def remember(self, key):
+        """
+        Return True if *key* was requested before, otherwise mark it as
+        requested and return False.
+        """
+        with self._lock:
+            if key in self._results:
+                return True
+            self._results[key] = (None, None)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+def get_etag(key, usn):
+    """
+    Return the entity tag of the response to request *key* at last USN
+    *usn*.
+
+    The tag does not depend on the result, so any server process can tell
+    whether a client's copy is still current without executing the command.
+    """
+    data = json.dumps([VERSION, key, usn])
+    return '"%s"' % hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def match_etag(environ, etag):
+    """
+    Return True if the If-None-Match header of request *environ* matches
+    *etag*.
+    """
+    header = environ.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    # mod_deflate appends -gzip to the tags of the responses it compresses
+    tags = [t[:-len(DEFLATE_ETAG_SUFFIX)] + '"'
+            if t.endswith(DEFLATE_ETAG_SUFFIX) else t for t in tags]
+    # "*" matches any current representation, but the server cannot tell
+    # whether the client has one of this request
+    return etag in tags
+
+
 class WSGIExecutioner(Executioner):
     """
     Base class for execution backends with a WSGI application interface.
@@ -303,11 +448,17 @@ class WSGIExecutioner(Executioner):
     headers = None
     content_type = None
     key = ''
+    # Compress responses if the client accepts gzip or deflate encoding
+    compress_response = False
 
     _system_commands = {}
+    _response_cache = None
 
     def _on_finalize(self):
         self.url = self.env.mount_ipa + self.key
+        if self.api.env.in_server and self.api.env.response_cache_size > 0:
+            self._response_cache = ResponseCache(
+                max_size=self.api.env.response_cache_size)
         super(WSGIExecutioner, self)._on_finalize()
         if 'wsgi_dispatch' in self.api.Backend:
             self.api.Backend.wsgi_dispatch.mount(self, self.key)
@@ -327,6 +478,49 @@ class WSGIExecutioner(Executioner):
 
         return command
 
+    def _execute_command(self, command, args, options, environ):
+        """
+        Execute *command*, or serve its result from the response cache.
+
+        Responses of commands with ``cache_response`` set get an ETag. If
+        the client already has the current response, as told by the
+        If-None-Match header, the command is not executed at all and an
+        empty 304 Not Modified response is sent.
+
+        Caching costs a search of the last USN in the root DSE, which is
+        only done for requests with an If-None-Match header and for repeated
+        requests. The first request of a key is executed as is.
+        """
+        cache = self._response_cache
+        if cache is None or not command.cache_response:
+            return command(*args, **options)
+
+        key = json.dumps(
+            [getattr(context, 'principal', None), command.full_name,
+             os.environ['LANG'], args, options],
+            sort_keys=True, default=repr)
+        if (not environ.get('HTTP_IF_NONE_MATCH') and
+                not cache.remember(key)):
+            return command(*args, **options)
+
+        ldap = self.api.Backend.ldap2
+        usn = ldap.get_last_usn() if ldap.isconnected() else None
+        if usn is None:
+            return command(*args, **options)
+
+        etag = get_etag(key, usn)
+        if match_etag(environ, etag):
+            context.response_etag = etag
+            context.response_not_modified = True
+            return None
+
+        result = cache.get(key, usn)
+        if result is None:
+            result = command(*args, **options)
+            cache.set(key, usn, result)
+        context.response_etag = etag
+        return result
+
     def wsgi_execute(self, environ):
         result = None
         error = None
@@ -342,6 +536,7 @@ class WSGIExecutioner(Executioner):
             return self.marshal(result, RefererError(referer='missing'), _id)
         if not environ['HTTP_REFERER'].startswith('https://%s/ipa' % self.api.env.host) and not self.env.in_tree:
             return self.marshal(result, RefererError(referer=environ['HTTP_REFERER']), _id)
+        stats = perf.start_request() if self.api.env.perf_metrics else None
         try:
             if ('HTTP_ACCEPT_LANGUAGE' in environ):
                 lang_reg_w_q = environ['HTTP_ACCEPT_LANGUAGE'].split(',')[0]
@@ -357,14 +552,16 @@ class WSGIExecutioner(Executioner):
                 and environ['REQUEST_METHOD'] == 'POST'
             ):
                 data = read_input(environ)
-                (name, args, options, _id) = self.unmarshal(data)
+                with perf.timed('unmarshal'):
+                    (name, args, options, _id) = self.unmarshal(data)
             else:
                 (name, args, options, _id) = self.simple_unmarshal(environ)
             if name in self._system_commands:
                 result = self._system_commands[name](self, *args, **options)
             else:
                 command = self._get_command(name)
-                result = command(*args, **options)
+                result = self._execute_command(
+                    command, args, options, environ)
         except PublicError as e:
             if self.api.env.debug:
                 self.debug('WSGI wsgi_execute PublicError: %s', traceback.format_exc())
@@ -406,7 +603,21 @@ class WSGIExecutioner(Executioner):
                       type(error).__name__)
 
         version = options.get('version', VERSION_WITHOUT_CAPABILITIES)
-        return self.marshal(result, error, _id, version)
+        with perf.timed('marshal'):
+            response = self.marshal_chunks(result, error, _id, version)
+
+        if stats is not None:
+            if command is not None:
+                command_name = command.name
+            elif name in self._system_commands:
+                command_name = name
+            else:
+                command_name = 'unknown'
+            perf.finish_request(command_name, stats)
+            self.info('[%s] perf: command=%s %s', type(self).__name__,
+                      command_name, stats.format())
+
+        return response
 
     def simple_unmarshal(self, environ):
         name = environ['PATH_INFO'].strip('/')
@@ -437,8 +648,25 @@ class WSGIExecutioner(Executioner):
         if logout_cookie is not None:
             headers.append(('IPASESSION', logout_cookie))
 
+        if isinstance(response, bytes):
+            response = [response]
+
+        etag = getattr(context, 'response_etag', None)
+        if etag is not None and status == HTTP_STATUS_SUCCESS:
+            headers = headers + [('ETag', etag)]
+            if getattr(context, 'response_not_modified', False):
+                status = HTTP_STATUS_NOT_MODIFIED
+                response = []
+
+        if self.compress_response and status == HTTP_STATUS_SUCCESS:
+            coding = get_content_encoding(environ)
+            headers = headers + [('Vary', 'Accept-Encoding')]
+            if coding is not None:
+                headers.append(('Content-Encoding', coding))
+                response = compress_chunks(response, coding)
+
         start_response(status, headers)
-        return [response]
+        return response
 
     def unmarshal(self, data):
         raise NotImplementedError('%s.unmarshal()' % type(self).__name__)
@@ -447,6 +675,13 @@ class WSGIExecutioner(Executioner):
                 version=VERSION_WITHOUT_CAPABILITIES):
         raise NotImplementedError('%s.marshal()' % type(self).__name__)
 
+    def marshal_chunks(self, result, error, _id=None,
+                       version=VERSION_WITHOUT_CAPABILITIES):
+        """
+        Return the marshaled response as an iterable of bytes.
+        """
+        return [self.marshal(result, error, _id, version)]
+
 
 class jsonserver(WSGIExecutioner, HTTP_Status):
     """
@@ -458,6 +693,7 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
     """
 
     content_type = 'application/json'
+    compress_response = True
 
     def __call__(self, environ, start_response):
         '''
@@ -470,6 +706,10 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
 
     def marshal(self, result, error, _id=None,
                 version=VERSION_WITHOUT_CAPABILITIES):
+        return b''.join(self.marshal_chunks(result, error, _id, version))
+
+    def marshal_chunks(self, result, error, _id=None,
+                       version=VERSION_WITHOUT_CAPABILITIES):
         if error:
             assert isinstance(error, PublicError)
             error = dict(
@@ -486,10 +726,9 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
             principal=unicode(principal),
             version=unicode(VERSION),
         )
-        dump = json_encode_binary(
+        return json_encode_binary_iter(
             response, version, pretty_print=self.api.env.debug
         )
-        return dump.encode('utf-8')
 
     def unmarshal(self, data):
         try:
@@ -862,6 +1101,35 @@ class login_x509(KerberosLogin):
         return super(login_x509, self).__call__(environ, start_response)
 
 
+class metrics(Backend, HTTP_Status):
+    """
+    Performance metrics of the RPC requests served by this process in the
+    Prometheus text format, mounted only when ``perf_metrics`` is enabled.
+    """
+
+    content_type = 'text/plain'
+    key = '/metrics'
+
+    def _on_finalize(self):
+        super(metrics, self)._on_finalize()
+        if self.api.env.perf_metrics:
+            self.api.Backend.wsgi_dispatch.mount(self, self.key)
+
+    def __call__(self, environ, start_response):
+        self.debug('WSGI metrics.__call__:')
+
+        if environ.get('REQUEST_METHOD', '').upper() != 'GET':
+            return self.bad_request(environ, start_response,
+                                    "HTTP request method must be GET")
+
+        response = perf.metrics.render().encode('utf-8')
+        start_response(HTTP_STATUS_SUCCESS, [
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Content-Length', str(len(response))),
+        ])
+        return [response]
+
+
 class login_password(Backend, KerberosSession):
 
     content_type = 'text/plain'
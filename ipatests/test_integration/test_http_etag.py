@@ -0,0 +1,70 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test that entity tags of JSON-RPC responses pass through httpd
+"""
+
+import json
+import re
+
+from ipatests.test_integration.base import IntegrationTest
+from ipatests.pytest_plugins.integration import tasks
+from ipaplatform.paths import paths
+
+
+class TestHttpETag(IntegrationTest):
+    topology = 'line'
+
+    @classmethod
+    def install(cls, mh):
+        super(TestHttpETag, cls).install(mh)
+        tasks.kinit_admin(cls.master)
+
+    def request(self, path, *headers):
+        """
+        Send user_show admin to *path* and return the status code and the
+        ETag header of the response
+        """
+        url = 'https://{}{}'.format(self.master.hostname, path)
+        body = json.dumps({'method': 'user_show', 'params': [['admin'], {}]})
+        args = [
+            'curl', '-s', '-o', '/dev/null', '-D', '-', '--compressed',
+            '--negotiate', '-u', ':', '--cacert', paths.IPA_CA_CRT,
+            '-H', 'Referer: https://{}/ipa'.format(self.master.hostname),
+            '-H', 'Content-Type: application/json',
+            '-d', body,
+        ]
+        for header in headers:
+            args.extend(['-H', header])
+        result = self.master.run_command(args + [url])
+        # headers of the Negotiate 401 response precede the final ones
+        response = result.stdout_text.split('HTTP/')[-1]
+        status = int(response.split()[1])
+        etag = re.search(r'^ETag:\s*(\S+)\s*$', response,
+                         re.IGNORECASE | re.MULTILINE)
+        return status, etag.group(1) if etag else None
+
+    def check_conditional_request(self, path):
+        # the first request of a kind is not tagged, a repeated one is
+        self.request(path)
+        status, etag = self.request(path)
+        assert status == 200
+        assert etag is not None
+
+        status, _etag = self.request(path, 'If-None-Match: {}'.format(etag))
+        assert status == 304
+
+    def test_session_json(self):
+        self.check_conditional_request('/ipa/session/json')
+
+    def test_json(self):
+        self.check_conditional_request('/ipa/json')
+
+    def test_static_files(self):
+        result = self.master.run_command([
+            'curl', '-s', '-o', '/dev/null', '-D', '-',
+            '--cacert', paths.IPA_CA_CRT,
+            'https://{}/ipa/ui/index.html'.format(self.master.hostname)])
+        assert 'etag:' not in result.stdout_text.lower()
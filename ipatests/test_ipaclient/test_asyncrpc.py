@@ -0,0 +1,125 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the asyncio interface of `ipaclient/asyncrpc.py`.
+"""
+
+import threading
+import time
+
+import pytest
+import six
+
+from ipalib import errors
+from ipalib.request import context
+
+if six.PY3:
+    import asyncio
+    from ipaclient.asyncrpc import AsyncClient
+
+pytestmark = [
+    pytest.mark.tier0,
+    pytest.mark.skipif(six.PY2, reason="asyncio requires Python 3"),
+]
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self._ServerProxy__transport = FakeTransport()
+
+
+class FakeBackend(object):
+    """Thread-local connections like `ipalib.backend.Connectible`"""
+    def __init__(self):
+        self.connections = []
+
+    def connect(self, ccache=None):
+        context.fake_rpcclient = FakeConnection()
+        self.connections.append(context.fake_rpcclient)
+
+    def isconnected(self):
+        return hasattr(context, 'fake_rpcclient')
+
+    @property
+    def conn(self):
+        return context.fake_rpcclient
+
+
+class FakeEnv(object):
+    rpc_max_concurrency = 2
+
+
+class FakeAPI(object):
+    def __init__(self):
+        self.env = FakeEnv()
+        self.Backend = type('Backend', (), {})()
+        self.Backend.rpcclient = FakeBackend()
+        self.Command = {'user_show': self.user_show}
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def user_show(self, uid, **options):
+        assert self.Backend.rpcclient.isconnected()
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.01)
+            if uid == u'missing':
+                raise errors.NotFound(reason=u'user not found')
+            return dict(result=dict(uid=[uid]), options=options)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def test_call():
+    api = FakeAPI()
+    with AsyncClient(api) as client:
+        result = run(client.call('user_show', u'admin', all=True))
+    assert result == dict(result=dict(uid=[u'admin']), options=dict(all=True))
+
+
+def test_concurrency_limit():
+    api = FakeAPI()
+    uids = [u'user%d' % i for i in range(20)]
+    with AsyncClient(api, max_concurrency=4) as client:
+        results = run(asyncio.gather(
+            *(client.call('user_show', uid) for uid in uids)))
+    assert [r['result']['uid'][0] for r in results] == uids
+    assert 1 < api.max_running <= 4
+    assert len(api.Backend.rpcclient.connections) <= 4
+
+
+def test_error():
+    api = FakeAPI()
+    with AsyncClient(api) as client:
+        with pytest.raises(errors.NotFound):
+            run(client.call('user_show', u'missing'))
+        assert run(client.call('user_show', u'admin'))['result']
+
+
+def test_close():
+    api = FakeAPI()
+    client = AsyncClient(api)
+    run(client.call('user_show', u'admin'))
+    client.close()
+    for conn in api.Backend.rpcclient.connections:
+        assert conn._ServerProxy__transport.closed
+    with pytest.raises(RuntimeError):
+        client.call('user_show', u'admin')
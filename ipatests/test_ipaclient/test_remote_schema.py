@@ -0,0 +1,163 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the client-side schema cache of `ipaclient/remote_plugins/schema.py`.
+"""
+
+import json
+import os
+
+import pytest
+
+from ipaclient.remote_plugins import schema
+
+pytestmark = pytest.mark.tier0
+
+FINGERPRINT = u'0123456789abcdef'
+
+
+class FakeClient(object):
+    def __init__(self, count=10):
+        self.count = count
+        self.calls = 0
+
+    def isconnected(self):
+        return True
+
+    def forward(self, name, **kwargs):
+        self.calls += 1
+        commands = [
+            {u'name': u'cmd%d' % i,
+             u'full_name': u'cmd%d/1' % i,
+             u'doc': u'Command %d.\n\nMore text.' % i,
+             u'topic_topic': u'topic/1',
+             u'params': [{u'name': u'param%d' % j, u'type': u'str'}
+                         for j in range(10)]}
+            for i in range(self.count)
+        ]
+        return {'result': {
+            'fingerprint': FINGERPRINT,
+            'ttl': 3600,
+            'version': u'2.229',
+            'commands': commands,
+            'classes': [{u'name': u'obj', u'full_name': u'obj/1'}],
+            'topics': [{u'name': u'topic', u'full_name': u'topic/1',
+                        u'doc': u'A topic.'}],
+        }}
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(schema.Schema, '_DIR', str(tmpdir))
+    return str(tmpdir)
+
+
+def rewrite_index(filename, update):
+    """Rewrite the index of a schema cache file"""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    _magic, index_size = schema._HEADER.unpack_from(data)
+    start = schema._HEADER.size + index_size
+    index = json.loads(data[schema._HEADER.size:start].decode('utf-8'))
+    update(index)
+    index = json.dumps(index).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(schema._HEADER.pack(schema._MAGIC, len(index)))
+        f.write(index)
+        f.write(data[start:])
+
+
+def test_roundtrip(cache_dir):
+    client = FakeClient()
+    fetched = schema.Schema(client)
+    assert client.calls == 1
+    assert os.path.exists(os.path.join(cache_dir, FINGERPRINT))
+
+    cached = schema.Schema(client, FINGERPRINT)
+    assert client.calls == 1
+    assert sorted(cached['commands']) == sorted(fetched['commands'])
+    assert cached['commands'][u'cmd3/1'] == fetched['commands'][u'cmd3/1']
+    assert cached['classes'][u'obj/1'] == {u'name': u'obj',
+                                           u'full_name': u'obj/1'}
+    assert cached['topics'].get_help(u'topic/1') == {
+        u'name': u'topic', u'summary': u'A topic.'}
+    assert cached['commands'].get_help(u'cmd3/1')['summary'] == u'Command 3.'
+
+
+def test_lazy_decode(cache_dir):
+    client = FakeClient()
+    schema.Schema(client)
+    cached = schema.Schema(client, FINGERPRINT)
+
+    assert isinstance(cached._dict['commands'][u'cmd1/1'], list)
+    assert cached['commands'][u'cmd1/1'][u'name'] == u'cmd1'
+    assert isinstance(cached._dict['commands'][u'cmd1/1'], dict)
+    assert isinstance(cached._dict['commands'][u'cmd2/1'], list)
+
+
+def test_invalid_cache(cache_dir):
+    client = FakeClient()
+    with open(os.path.join(cache_dir, FINGERPRINT), 'wb') as f:
+        f.write(b'PK\x03\x04 not a schema cache')
+
+    cached = schema.Schema(client, FINGERPRINT)
+    assert client.calls == 1
+    assert cached['commands'][u'cmd1/1'][u'name'] == u'cmd1'
+
+
+def test_decode_requested_members(cache_dir, monkeypatch):
+    client = FakeClient(count=1000)
+    schema.Schema(client)
+
+    decoded = []
+    loads = json.loads
+
+    def counting_loads(s, *args, **kwargs):
+        decoded.append(s)
+        return loads(s, *args, **kwargs)
+
+    monkeypatch.setattr(schema.json, 'loads', counting_loads)
+
+    cached = schema.Schema(client, FINGERPRINT)
+    # only the index is decoded on open
+    assert len(decoded) == 1
+    assert cached['commands'][u'cmd1/1'][u'name'] == u'cmd1'
+    assert cached['commands'][u'cmd1/1'][u'doc'].startswith(u'Command 1.')
+    assert len(decoded) == 2
+    assert [member for member, value in cached._dict['commands'].items()
+            if not isinstance(value, list)] == [u'cmd1/1']
+    assert isinstance(cached._help, bytes)
+
+
+@pytest.mark.parametrize('damage', [
+    # overlapping members
+    lambda index: index['commands'][u'cmd1/1'].__setitem__(1, 1000),
+    # member outside of the file
+    lambda index: index['commands'][u'cmd1/1'].__setitem__(0, 10 ** 9),
+    # member with an invalid location
+    lambda index: index['commands'].__setitem__(u'cmd1/1', u'cmd1'),
+    # missing help
+    lambda index: index.pop('_help'),
+])
+def test_damaged_index(cache_dir, damage):
+    client = FakeClient()
+    schema.Schema(client)
+    rewrite_index(os.path.join(cache_dir, FINGERPRINT), damage)
+
+    cached = schema.Schema(client, FINGERPRINT)
+    assert client.calls == 2
+    assert cached['commands'][u'cmd1/1'][u'name'] == u'cmd1'
+
+
+def test_truncated_cache(cache_dir):
+    client = FakeClient()
+    schema.Schema(client)
+    filename = os.path.join(cache_dir, FINGERPRINT)
+    with open(filename, 'rb+') as f:
+        f.truncate(os.path.getsize(filename) - 1)
+
+    cached = schema.Schema(client, FINGERPRINT)
+    assert client.calls == 2
+    assert cached['commands'][u'cmd1/1'][u'name'] == u'cmd1'
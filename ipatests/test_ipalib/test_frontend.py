@@ -466,6 +466,32 @@ class test_Command(ClassChecker):
         assert 'option2' in e
         assert e['option2'] == u'some value'
 
+    def test_default_deps(self):
+        """
+        Test the default_from dependencies computed in
+        `ipalib.frontend.Command._on_finalize`.
+        """
+        class my_cmd(self.cls):
+            takes_options = (
+                Str('option0'),
+                Str('option1', default_from=lambda option0: option0),
+                Str('option2', default_from=lambda option1: option1),
+                Str('option3?'),
+            )
+
+        api, _home = create_test_api()
+        api.finalize()
+        o = my_cmd(api)
+        o.finalize()
+        assert o._default_deps == dict(
+            option1=frozenset(['option0']),
+            option2=frozenset(['option0', 'option1']),
+        )
+        assert 'option2' in o._default_params
+        assert 'option3' not in o._default_params
+        assert 'option3' not in o._required_params
+        assert o.get_default_of('option2', option0=u'value') == u'value'
+
     def test_validate(self):
         """
         Test the `ipalib.frontend.Command.validate` method.
@@ -791,6 +817,39 @@ class test_Command(ClassChecker):
             'nested', 'Subclass', 'world', 4, dict, tuple, nope
         )
 
+    def test_validate_output_limit(self):
+        """
+        Test `ipalib.frontend.Command.validate_output` with a limit.
+        """
+        class api(object):
+            @staticmethod
+            def is_production_mode():
+                return False
+
+        class example(self.cls):
+            has_output = (
+                output.Output('hello', int),
+                output.ListOfEntries('world'),
+            )
+        inst = example(api)
+        inst.finalize()
+        okay = dict(foo='bar')
+        nope = ('aye', 'bee')
+
+        value = dict(hello=18, world=[okay, okay, okay, nope])
+        inst.validate_output(value, limit=3)
+        e = raises(TypeError, inst.validate_output, value, limit=4)
+        assert str(e) == output.emsg % (
+            'example', 'ListOfEntries', 'world', 3, dict, tuple, nope
+        )
+
+        # The type of the output itself is always checked
+        wrong = dict(hello=18, world=okay)
+        e = raises(TypeError, inst.validate_output, wrong, limit=0)
+        assert str(e) == '%s:\n  output[%r]: need %r; got %r: %r' % (
+            'example.validate_output()', 'world', (list, tuple), dict, okay
+        )
+
     def test_get_output_params(self):
         """
         Test the `ipalib.frontend.Command.get_output_params` method.
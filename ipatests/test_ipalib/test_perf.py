@@ -0,0 +1,71 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the `ipalib.perf` module.
+"""
+
+import pytest
+
+from ipalib import perf
+
+pytestmark = pytest.mark.tier0
+
+
+def test_inactive():
+    assert perf.get_stats() is None
+    with perf.timed('execute'):
+        perf.count('ldap_searches')
+    assert perf.get_stats() is None
+
+
+def test_request():
+    stats = perf.start_request()
+    try:
+        assert perf.get_stats() is stats
+        with perf.timed('execute'):
+            perf.count('ldap_searches')
+            perf.count('ldap_entries', 3)
+            with perf.timed('validate'):
+                pass
+        with perf.timed('execute'):
+            perf.count('ldap_searches')
+    finally:
+        perf.finish_request(u'user_show', stats)
+
+    assert perf.get_stats() is None
+    assert list(stats.timings) == ['execute']
+    assert stats.counters == dict(ldap_searches=2, ldap_entries=3)
+    assert stats.duration >= stats.timings['execute']
+
+    fields = stats.format().split()
+    assert fields[0].startswith('duration=')
+    assert fields[1].startswith('execute=')
+    assert fields[2:] == ['ldap_entries=3', 'ldap_searches=2']
+
+
+def test_metrics():
+    metrics = perf.Metrics()
+    for duration in (0.001, 0.2, 20):
+        stats = perf.RequestStats()
+        stats.duration = duration
+        stats.add_time('execute', duration)
+        stats.counters['ldap_searches'] = 1
+        metrics.observe(u'user_show', stats)
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE ipa_request_duration_seconds histogram' in lines
+    assert ('ipa_request_duration_seconds_bucket'
+            '{command="user_show",le="0.005"} 1') in lines
+    assert ('ipa_request_duration_seconds_bucket'
+            '{command="user_show",le="0.25"} 2') in lines
+    assert ('ipa_request_duration_seconds_bucket'
+            '{command="user_show",le="+Inf"} 3') in lines
+    assert 'ipa_request_duration_seconds_count{command="user_show"} 3' in lines
+    assert ('ipa_request_phase_seconds_total'
+            '{command="user_show",phase="execute"} 20.201000') in lines
+    assert 'ipa_ldap_searches_total{command="user_show"} 3' in lines
+
+    metrics.clear()
+    assert 'user_show' not in metrics.render()
@@ -24,7 +24,9 @@ Test the `ipalib.plugable` module.
 # FIXME: Pylint errors
 # pylint: disable=no-member
 
+import importlib
 import os
+import sys
 import textwrap
 
 from ipalib import plugable, errors, create_api
@@ -307,3 +309,58 @@ class test_API(ClassChecker):
                 os.environ['IPA_CONFDIR'] = ipa_confdir
             else:
                 os.environ.pop('IPA_CONFDIR')
+
+    def test_lazy_plugins(self, tmpdir, monkeypatch):
+        """
+        Test loading plugin modules on first use from a plugin manifest.
+        """
+        cache_dir = tmpdir.mkdir('cache')
+        monkeypatch.setattr(plugable.PluginManifest, '_DIR', str(cache_dir))
+        monkeypatch.syspath_prepend(str(tmpdir))
+
+        package_dir = tmpdir.mkdir('lazypkg')
+        package_dir.join('__init__.py').write('')
+        plugins_dir = package_dir.mkdir('plugins')
+        plugins_dir.join('__init__.py').write('')
+        for name in ('one', 'two'):
+            plugins_dir.join('%s.py' % name).write(textwrap.dedent("""
+                from ipalib import Command, Registry
+                register = Registry()
+
+                @register()
+                class lazy_%s(Command):
+                    pass
+                """ % name))
+
+        modules = ('lazypkg.plugins.one', 'lazypkg.plugins.two')
+
+        def load():
+            api = create_api(mode='unit_test')
+            api.bootstrap(context='cli', plugins_on_demand=True)
+            api.add_package(importlib.import_module('lazypkg.plugins'))
+            api.finalize()
+            return api
+
+        # the first load imports all modules and generates the manifest
+        api = load()
+        assert all(name in sys.modules for name in modules)
+        assert cache_dir.join('lazypkg.plugins').check()
+        assert api.Command.lazy_one.name == 'lazy_one'
+
+        for name in modules:
+            monkeypatch.delitem(sys.modules, name)
+
+        # the next load imports modules on first use
+        api = load()
+        assert not any(name in sys.modules for name in modules)
+        assert 'lazy_one' in api.Command
+        assert 'lazy_two' in api.Command
+        assert len(api.Command) == 2
+
+        plugin = api.Command.get_plugin('lazy_one')
+        assert plugin is sys.modules['lazypkg.plugins.one'].lazy_one
+        assert isinstance(api.Command.lazy_one, plugin)
+        assert 'lazypkg.plugins.two' not in sys.modules
+
+        assert [p.name for p in api.Command] == ['lazy_one', 'lazy_two']
+        assert 'lazypkg.plugins.two' in sys.modules
@@ -22,16 +22,20 @@ Test the `ipalib.rpc` module.
 """
 from __future__ import print_function
 
+import socket
+import zlib
+
 import nose
 import pytest
 import six
 # pylint: disable=import-error
-from six.moves.xmlrpc_client import Binary, Fault, dumps, loads
+from six.moves.xmlrpc_client import Binary, Fault, ProtocolError, dumps, loads
 # pylint: enable=import-error
 
 from ipatests.util import raises, assert_equal, PluginTester, DummyClass
 from ipatests.data import binary_bytes, utf8_bytes, unicode_str
 from ipalib.frontend import Command
+from ipalib.parameters import Str
 from ipalib.request import context, Connection
 from ipalib import rpc, errors, api, request
 from ipapython.version import API_VERSION
@@ -198,6 +202,122 @@ def test_xml_loads():
         assert type(e.faultString) is unicode
 
 
+def test_json_encode_binary_iter():
+    """
+    Test the `ipalib.rpc.json_encode_binary_iter` function.
+    """
+    values = [
+        None,
+        u'text',
+        dict(),
+        list(),
+        dict(result=dict(count=2, result=[
+            dict(uid=(u'admin',), cert=(binary_bytes,)),
+            dict(uid=(u'jdoe',), cert=(utf8_bytes,)),
+        ]), error=None, id=0),
+        {1: u'non-string key'},
+    ]
+    for value in values:
+        chunks = list(rpc.json_encode_binary_iter(
+            value, API_VERSION, chunk_size=16))
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        assert b''.join(chunks).decode('utf-8') == rpc.json_encode_binary(
+            value, API_VERSION)
+
+
+class FakeResponse(object):
+    def __init__(self, data, encoding):
+        self.data = data
+        self.encoding = encoding
+
+    def getheader(self, name, default=None):
+        if name == 'Content-Encoding':
+            return self.encoding
+        return default
+
+    def read(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+@pytest.mark.parametrize("encoding,wbits", [
+    ('gzip', 16 + zlib.MAX_WBITS),
+    ('deflate', zlib.MAX_WBITS),
+])
+def test_parse_compressed_response(encoding, wbits):
+    body = b'{"result": "' + b'x' * 200000 + b'"}'
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                  zlib.DEFLATED, wbits)
+    data = compressor.compress(body) + compressor.flush()
+
+    transport = rpc.MultiProtocolTransport(protocol='json')
+    transport.verbose = False
+    assert transport.parse_response(FakeResponse(data, encoding)) == body
+
+
+class ConditionalTransport(object):
+    """Transport answering 304 when the request carries the current ETag"""
+    etag = None
+    if_none_match = None
+
+    def __init__(self):
+        self.requests = []
+
+    response = b'{"result": {"result": "value"}, "error": null, "id": 0}'
+
+    def request(self, host, handler, request_body, verbose=False):
+        self.requests.append(self.if_none_match)
+        self.body = request_body
+        if self.if_none_match == '"1"':
+            raise ProtocolError(host + handler, 304, 'Not Modified', {})
+        self.etag = '"1"'
+        return self.response
+
+
+def test_json_conditional_request():
+    transport = ConditionalTransport()
+    proxy = rpc.JSONServerProxy(
+        'https://ipa.example.test/ipa/json', transport, 'UTF-8', 0, True)
+    options = dict(version=API_VERSION)
+
+    assert proxy.user_show([u'admin'], options) == dict(result=u'value')
+    assert proxy.user_show([u'admin'], options) == dict(result=u'value')
+    assert transport.requests == [None, '"1"']
+
+    # other requests are not conditional
+    proxy.user_show([u'jdoe'], options)
+    assert transport.requests[-1] is None
+    assert transport.if_none_match is None
+
+
+def test_json_conditional_request_size(monkeypatch):
+    transport = ConditionalTransport()
+    proxy = rpc.JSONServerProxy(
+        'https://ipa.example.test/ipa/json', transport, 'UTF-8', 0, True)
+    options = dict(version=API_VERSION)
+    proxy.user_show([u'admin'], options)
+    # request and response of a single call
+    size = len(transport.body) + len(transport.response)
+
+    # responses are dropped least recently used first to keep the total
+    # size under the limit
+    monkeypatch.setattr(proxy, 'max_responses_size', size * 2)
+    proxy.user_show([u'jdoe'], options)
+    proxy.user_show([u'admin'], options)
+    proxy.user_show([u'bob'], options)
+    del transport.requests[:]
+    proxy.user_show([u'bob'], options)
+    proxy.user_show([u'admin'], options)
+    proxy.user_show([u'jdoe'], options)
+    assert transport.requests == ['"1"', '"1"', None]
+
+    # a response larger than the limit is not kept at all
+    monkeypatch.setattr(proxy, 'max_responses_size', size - 1)
+    proxy.user_show([u'alice'], options)
+    proxy.user_show([u'alice'], options)
+    assert transport.requests[-1] is None
+
+
 class test_xmlclient(PluginTester):
     """
     Test the `ipalib.rpc.xmlclient` plugin.
@@ -257,6 +377,110 @@ class test_xmlclient(PluginTester):
         assert context.xmlclient.conn._calledall() is True
 
 
+class FakeBatchConnection(object):
+    def __init__(self):
+        self.requests = []
+
+    def batch(self, args, kw):
+        self.requests.append([m['method'] for m in args])
+        results = []
+        for method in args:
+            uid = method['params'][0][0]
+            if uid == u'missing':
+                results.append(dict(
+                    error=u'missing: user not found',
+                    error_code=errors.NotFound.errno,
+                    error_name=u'NotFound',
+                    error_kw=dict(reason=u'missing: user not found'),
+                ))
+            else:
+                results.append(dict(result=uid, error=None))
+        return dict(count=len(results), results=results)
+
+
+class test_batched(PluginTester):
+    """
+    Test the `ipalib.rpc.RPCClient.batched` method.
+    """
+    class rpcclient(rpc.jsonclient):
+        pass
+    _plugin = rpcclient
+
+    def setup(self):
+        class user_show(Command):
+            takes_args = (Str('uid'),)
+
+        self.o, self.api, _home = self.instance(
+            'Backend', user_show, in_server=False)
+        self.conn = FakeBatchConnection()
+        setattr(context, self.o.id, Connection(self.conn, lambda: None))
+
+    def test_batched(self):
+        with self.o.batched(max_items=2):
+            results = [self.api.Command.user_show(uid)
+                       for uid in (u'a', u'b', u'missing')]
+            assert self.conn.requests == [['user_show/1', 'user_show/1']]
+            assert results[0].done()
+            assert not results[2].done()
+
+        assert len(self.conn.requests) == 2
+        assert results[0].result() == dict(result=u'a')
+        assert results[1].result() == dict(result=u'b')
+        e = raises(errors.NotFound, results[2].result)
+        assert_equal(e.reason, u'missing: user not found')
+
+    def test_flush_on_result(self):
+        with self.o.batched():
+            result = self.api.Command.user_show(u'a')
+            assert self.conn.requests == []
+            assert result.result() == dict(result=u'a')
+            assert self.conn.requests == [['user_show/1']]
+        assert self.conn.requests == [['user_show/1']]
+
+    def test_abort(self):
+        with pytest.raises(ValueError):
+            with self.o.batched():
+                result = self.api.Command.user_show(u'a')
+                raise ValueError()
+        assert self.conn.requests == []
+        raises(RuntimeError, result.result)
+        assert not hasattr(context, 'rpc_batch')
+
+
+class test_rank_servers(PluginTester):
+    """
+    Test the `ipalib.rpc.RPCClient.rank_servers` method.
+    """
+    _plugin = rpc.jsonclient
+
+    def test_rank_servers(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(rpc.RPCClient, '_RANKING_DIR', str(tmpdir))
+        o, _api, _home = self.instance('Backend', in_server=False,
+                                       realm=u'EXAMPLE.COM')
+
+        listening = socket.socket()
+        listening.bind(('127.0.0.1', 0))
+        listening.listen(1)
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        try:
+            up = 'http://127.0.0.1:%d/ipa/json' % listening.getsockname()[1]
+            down = 'http://127.0.0.1:%d/ipa/json' % closed.getsockname()[1]
+            closed.close()
+
+            assert o.rank_servers([down, up]) == [up, down]
+            assert tmpdir.join(u'EXAMPLE.COM').check()
+        finally:
+            listening.close()
+
+        # the stored ranking is used while it is valid for the same servers
+        assert o.rank_servers([up, down]) == [up, down]
+        assert o.rank_servers([down]) == [down]
+
+        o.forget_server_ranking()
+        assert not tmpdir.join(u'EXAMPLE.COM').check()
+
+
 @pytest.mark.skip_ipaclient_unittest
 class test_xml_introspection(object):
     @classmethod
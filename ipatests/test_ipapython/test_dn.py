@@ -1,4 +1,6 @@
 import contextlib
+import copy
+import pickle
 import unittest
 import pytest
 
@@ -1184,6 +1186,31 @@ class TestDN(unittest.TestCase):
         self.assertFalse(dn3_a in s)
         self.assertFalse(dn3_b in s)
 
+    def test_immutable(self):
+        dn = DN(self.dn3)
+        with self.assertRaises(AttributeError):
+            dn.foo = 'bar'  # pylint: disable=assigning-non-slot
+
+        self.assertIs(copy.copy(dn), dn)
+        self.assertIs(copy.deepcopy(dn), dn)
+
+        dn_copy = pickle.loads(pickle.dumps(dn))
+        self.assertEqual(dn_copy, dn)
+        self.assertEqual(hash(dn_copy), hash(dn))
+        self.assertEqual(str(dn_copy), str(dn))
+
+    def test_suffix(self):
+        suffix = DN(self.container_dn, self.base_dn)
+        dn = DN(str(DN(self.rdn1, self.container_dn, self.base_dn)).upper())
+
+        self.assertTrue(dn.endswith(suffix))
+        self.assertTrue(dn.endswith(self.base_dn))
+        self.assertFalse(dn.endswith(self.dn3))
+        self.assertEqual(dn[1:], suffix)
+        self.assertEqual(hash(dn[1:]), hash(suffix))
+        self.assertTrue(suffix in dn)
+        self.assertEqual(dn.find(self.base_dn), len(dn) - len(self.base_dn))
+
     def test_x500_text(self):
         # null DN x500 ordering and LDAP ordering are the same
         nulldn = DN()
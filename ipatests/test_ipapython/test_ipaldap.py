@@ -0,0 +1,275 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the attribute value decoding of `ipapython/ipaldap.py`.
+"""
+
+import time
+
+import ldap
+import pytest
+import six
+from ldap.controls.sss import SSSRequestControl
+from ldap.controls.vlv import VLVRequestControl, VLVResponseControl
+
+from ipalib import errors, perf
+from ipapython.dn import DN
+from ipapython.dnsutil import DNSName
+from ipapython.ipaldap import (
+    LDAPClient, LDAPEntry, TRUNCATED_SIZE_LIMIT)
+from ipapython.kerberos import Principal
+
+if six.PY3:
+    unicode = str
+
+pytestmark = pytest.mark.tier0
+
+
+@pytest.fixture
+def conn():
+    return LDAPClient('ldap://localhost', no_schema=True)
+
+
+def reference_decode(conn, values, attr):
+    """Decode values with a schema lookup for every value"""
+    result = []
+    for value in values:
+        target_type = conn._lookup_attribute_type(attr)
+        if target_type is bytes:
+            result.append(value)
+        elif target_type is unicode:
+            result.append(value.decode('utf-8'))
+        else:
+            result.append(target_type(value.decode('utf-8')))
+    return result
+
+
+@pytest.mark.parametrize("attr,value,expected", [
+    ('cn', b'test', u'test'),
+    ('CN', b'test', u'test'),
+    ('memberindirect', b'uid=admin,cn=users', DN('uid=admin,cn=users')),
+    ('idnsname', b'example.com.', DNSName(u'example.com.')),
+    ('krbprincipalname', b'admin@EXAMPLE.COM',
+     Principal(u'admin@EXAMPLE.COM')),
+])
+def test_decode(conn, attr, value, expected):
+    assert conn.decode(value, attr) == expected
+    assert conn.decode([value, value], attr) == [expected, expected]
+    assert conn.decode((value,), attr) == (expected,)
+    assert conn.get_attribute_type(attr) is type(expected)
+
+
+def test_decode_invalid(conn):
+    with pytest.raises(ValueError) as e:
+        conn.decode(b'not a dn', 'memberindirect')
+    assert 'unable to convert the attribute' in str(e.value)
+
+    with pytest.raises(ValueError):
+        conn.decode([b'uid=admin', b'not a dn'], 'memberindirect')
+
+
+def test_decode_mixed_list(conn):
+    assert conn.decode([b'uid=admin', None], 'member') == [
+        DN('uid=admin'), None]
+
+
+def test_entry_sync(conn):
+    entry = LDAPEntry(conn, DN('uid=admin'))
+    entry.raw['member'] = [b'uid=admin', b'uid=other']
+    entry.raw['cn'] = [b'admin', b'admin']
+
+    assert entry['member'] == [DN('uid=admin'), DN('uid=other')]
+    assert entry['cn'] == [u'admin']
+
+
+def test_decode_lookups(conn, monkeypatch):
+    attrs = ['cn', 'memberindirect', 'idnsname', 'description']
+    values = {
+        'cn': [b'group%d' % i for i in range(100)],
+        'memberindirect': [b'uid=user%d,cn=users' % i for i in range(100)],
+        'idnsname': [b'host%d' % i for i in range(100)],
+        'description': [b'text %d' % i for i in range(100)],
+    }
+    expected = {
+        attr: reference_decode(conn, values[attr], attr) for attr in attrs}
+
+    lookups = []
+    lookup_attribute_type = conn._lookup_attribute_type
+
+    def counting_lookup(name_or_oid):
+        lookups.append(name_or_oid)
+        return lookup_attribute_type(name_or_oid)
+
+    monkeypatch.setattr(conn, '_lookup_attribute_type', counting_lookup)
+
+    for _i in range(3):
+        for attr in attrs:
+            assert conn.decode(values[attr], attr) == expected[attr]
+            assert conn.decode(values[attr][0], attr.upper()) == \
+                expected[attr][0]
+    # the attribute type is looked up once per attribute
+    assert len(lookups) == len(attrs)
+
+
+def test_count_result():
+    stats = perf.RequestStats()
+    res_list = [
+        ('uid=admin,cn=users', {'cn': [b'admin'], 'mail': [b'a@b', b'c@d']}),
+        (None, ['ldap://other.example.com/cn=users']),
+    ]
+    LDAPClient._count_result(stats, time.time(), res_list)
+    assert stats.counters['ldap_entries'] == 1
+    assert stats.counters['ldap_bytes'] == 11
+    assert stats.counters['ldap_seconds'] >= 0
+
+
+def test_sort_controls():
+    assert LDAPClient._make_sort_controls(None, None, None, 0) == []
+
+    ctrls = LDAPClient._make_sort_controls(['sn', '-uid'], None, None, 0)
+    assert len(ctrls) == 1
+    assert isinstance(ctrls[0], SSSRequestControl)
+    assert ctrls[0].ordering_rules == ['sn', '-uid']
+
+    ctrls = LDAPClient._make_sort_controls(['uid'], 20, 10, 100)
+    assert isinstance(ctrls[1], VLVRequestControl)
+    assert ctrls[1].offset == 21
+    assert ctrls[1].before_count == 0
+    assert ctrls[1].after_count == 9
+
+    # without a limit, a page is as large as the size limit
+    ctrls = LDAPClient._make_sort_controls(['uid'], 20, None, 100)
+    assert ctrls[1].after_count == 99
+
+    # nor larger
+    ctrls = LDAPClient._make_sort_controls(['uid'], 20, 200, 100)
+    assert ctrls[1].after_count == 99
+
+    with pytest.raises(ValueError):
+        LDAPClient._make_sort_controls(None, 20, 10, 0)
+
+
+def test_check_vlv_page():
+    ctrl = VLVResponseControl()
+    ctrl.result = 0
+    ctrl.content_count = 30
+    page = ['entry']
+    assert LDAPClient._check_vlv_page(page, 20, [ctrl]) == (page, 30)
+    assert LDAPClient._check_vlv_page(page, 0, [ctrl]) == (page, 30)
+    # an offset past the end returns no entries instead of the last one
+    assert LDAPClient._check_vlv_page(page, 30, [ctrl]) == ([], 30)
+
+    ctrl.result = 61
+    with pytest.raises(errors.DatabaseError):
+        LDAPClient._check_vlv_page(page, 0, [ctrl])
+    with pytest.raises(errors.DatabaseError):
+        LDAPClient._check_vlv_page(page, 0, [])
+
+
+class FakeSearchConnection(object):
+    """
+    python-ldap connection which returns *entries* of a search one by one,
+    followed by *error* or the search result with response controls *ctrls*
+    """
+    def __init__(self, entries, ctrls=(), error=None):
+        self.entries = entries
+        self.ctrls = list(ctrls)
+        self.error = error
+        self.serverctrls = None
+
+    def search_ext(self, base, scope, filterstr, attrlist, serverctrls=None,
+                   timeout=-1, sizelimit=0):
+        self.serverctrls = serverctrls
+        self.results = iter(self.entries)
+        return 1
+
+    def result3(self, msgid, all=1):
+        for dn, attrs in self.results:
+            return ldap.RES_SEARCH_ENTRY, [(dn, attrs)], msgid, []
+        if self.error is not None:
+            raise self.error({'desc': 'limit exceeded'})
+        return ldap.RES_SEARCH_RESULT, [], msgid, self.ctrls
+
+
+def search(conn, fake, **kwargs):
+    object.__setattr__(conn, '_conn', fake)
+    return list(conn._search_iter(
+        None, ['uid'], DN('cn=users'), ldap.SCOPE_ONELEVEL, None,
+        kwargs.pop('size_limit', 100), False, sort_by=['uid'], **kwargs))
+
+
+def user_entries(count):
+    return [('uid=user%d,cn=users' % i, {'uid': [b'user%d' % i]})
+            for i in range(count)]
+
+
+def test_search_vlv(conn):
+    ctrl = VLVResponseControl()
+    ctrl.result = 0
+    ctrl.content_count = 300
+
+    fake = FakeSearchConnection(user_entries(10), [ctrl])
+    result = search(conn, fake, offset=0, limit=10)
+    assert [e.dn for e in result] == [
+        DN('uid=user%d,cn=users' % i) for i in range(10)]
+    vlv_ctrl = fake.serverctrls[1]
+    assert vlv_ctrl.offset == 1
+    assert vlv_ctrl.after_count == 9
+
+    # the page is capped at the size limit and reported as truncated
+    fake = FakeSearchConnection(user_entries(100), [ctrl])
+    result = search(conn, fake, offset=0, limit=200)
+    assert fake.serverctrls[1].after_count == 99
+    assert len(result) == 101
+    assert all(isinstance(e, LDAPEntry) for e in result[:-1])
+    assert result[-1] is TRUNCATED_SIZE_LIMIT
+
+    # a page which is not full is complete
+    fake = FakeSearchConnection(user_entries(30), [ctrl])
+    result = search(conn, fake, offset=270, limit=200)
+    assert len(result) == 30
+    assert all(isinstance(e, LDAPEntry) for e in result)
+
+    # an offset past the end of the list
+    fake = FakeSearchConnection(user_entries(1), [ctrl])
+    assert search(conn, fake, offset=300, limit=10) == []
+
+
+def test_search_vlv_offset(conn):
+    ctrl = VLVResponseControl()
+    ctrl.result = 0
+    ctrl.content_count = 300
+
+    # without a limit the page is capped at the size limit as well
+    fake = FakeSearchConnection(user_entries(100), [ctrl])
+    result = search(conn, fake, offset=20)
+    assert fake.serverctrls[1].offset == 21
+    assert fake.serverctrls[1].after_count == 99
+    assert len(result) == 101
+    assert all(isinstance(e, LDAPEntry) for e in result[:-1])
+    assert result[-1] is TRUNCATED_SIZE_LIMIT
+
+    # the rest of the list fits in the page
+    fake = FakeSearchConnection(user_entries(50), [ctrl])
+    result = search(conn, fake, offset=250)
+    assert len(result) == 50
+    assert all(isinstance(e, LDAPEntry) for e in result)
+
+    # a full page which ends the list is complete
+    fake = FakeSearchConnection(user_entries(100), [ctrl])
+    result = search(conn, fake, offset=200)
+    assert len(result) == 100
+    assert all(isinstance(e, LDAPEntry) for e in result)
+
+
+def test_search_vlv_size_limit_exceeded(conn):
+    # entries received before the server hit its own size limit are
+    # returned
+    fake = FakeSearchConnection(user_entries(5),
+                                error=ldap.SIZELIMIT_EXCEEDED)
+    result = search(conn, fake, offset=0, limit=10, size_limit=0)
+    assert [e.dn for e in result[:-1]] == [
+        DN('uid=user%d,cn=users' % i) for i in range(5)]
+    assert result[-1] is TRUNCATED_SIZE_LIMIT
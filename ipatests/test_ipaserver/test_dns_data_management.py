@@ -0,0 +1,205 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the diff-based update of IPA system DNS records
+"""
+
+import pytest
+
+from ipalib import errors
+from ipapython.dn import DN
+from ipapython.dnsutil import DNSName
+from ipapython.ipaldap import LDAPClient
+from ipaserver.dns_data_management import (
+    IPASystemRecords,
+    IPADomainIsNotManagedByIPAError,
+    CNAME_TEMPLATE_ATTR,
+)
+
+DNS_DN = DN(('cn', 'dns'), ('dc', 'example'), ('dc', 'com'))
+ZONE_DN = DN(('idnsname', u'example.com.'), DNS_DN)
+SERVER = u'ipa.example.com'
+
+
+def record_dn(name):
+    return DN(('idnsname', name), ZONE_DN)
+
+
+class FakeLDAP(LDAPClient):
+    """
+    ldap2 backend with the record entries of the IPA domain zone in memory
+    """
+    def __init__(self):
+        super(FakeLDAP, self).__init__('ldap://localhost', no_schema=True)
+        object.__setattr__(self, 'entries', {})
+        object.__setattr__(self, 'searches', 0)
+        object.__setattr__(self, 'written', [])
+
+    def store(self, name, **attrs):
+        attrs.setdefault('objectclass', [u'top', u'idnsrecord'])
+        entry = self.make_entry(
+            record_dn(name), idnsname=[DNSName(name)], **attrs)
+        self.entries[entry.dn] = entry
+
+    def find_entries(self, filter=None, attrs_list=None, base_dn=None,
+                     scope=None, time_limit=None, size_limit=None, **kwargs):
+        assert base_dn == ZONE_DN
+        assert scope == self.SCOPE_ONELEVEL
+        object.__setattr__(self, 'searches', self.searches + 1)
+        if not self.entries:
+            raise errors.EmptyResult(reason='no matching entry found')
+        # copies, like entries read from the server
+        return [self.make_entry(e.dn, dict(e))
+                for e in self.entries.values()], False
+
+    def add_entry(self, entry):
+        assert entry.dn not in self.entries
+        self.written.append(('add', entry.dn))
+        self.entries[entry.dn] = entry
+
+    def update_entry(self, entry):
+        assert entry.dn in self.entries
+        self.written.append(('update', entry.dn))
+        self.entries[entry.dn] = entry
+
+
+class FakeParam(object):
+    def normalize(self, value):
+        return value
+
+
+class FakeAPI(object):
+    def __init__(self, managed=True):
+        self.managed = managed
+        self.Backend = type('Backend', (), {})()
+        self.Backend.ldap2 = FakeLDAP()
+        self.env = type('env', (), dict(
+            domain=u'example.com', realm=u'EXAMPLE.COM'))()
+        self.Command = type('Command', (), dict(
+            server_find=self.server_find,
+            location_find=self.location_find,
+            dnszone_show=self.dnszone_show,
+        ))()
+        self.Object = type('Object', (), dict(
+            dnszone=type('dnszone', (), dict(
+                get_dn=staticmethod(lambda zone: ZONE_DN)))(),
+            dnsrecord=type('dnsrecord', (), dict(
+                params=dict((name, FakeParam()) for name in (
+                    'srvrecord', 'txtrecord'))))(),
+        ))()
+
+    def server_find(self, **options):
+        return {'result': [{
+            'cn': [SERVER],
+            'ipaserviceweight': [u'100'],
+            'enabled_role_servrole': [],
+        }]}
+
+    def location_find(self, **options):
+        return {'result': []}
+
+    def dnszone_show(self, zone):
+        if not self.managed:
+            raise errors.NotFound(reason=u'zone not found')
+
+
+def srv(port, weight=100):
+    return u'0 %d %d %s.' % (weight, port, SERVER)
+
+
+@pytest.mark.tier0
+class TestIPASystemRecords(object):
+    @pytest.fixture
+    def api(self):
+        return FakeAPI()
+
+    @pytest.fixture
+    def ldap(self, api):
+        return api.Backend.ldap2
+
+    def test_add(self, api, ldap):
+        system_records = IPASystemRecords(api)
+        (success, failed), _locations = system_records.update_dns_records()
+        assert failed == []
+        assert len(success) == 8
+        assert ldap.searches == 1
+        assert sorted(op for op, _dn in ldap.written) == ['add'] * 8
+
+        entry = ldap.entries[record_dn(u'_ldap._tcp')]
+        assert entry['srvrecord'] == [srv(389)]
+        assert u'idnsTemplateObject' in entry['objectclass']
+        assert entry[CNAME_TEMPLATE_ATTR] == [
+            u'_ldap._tcp.\\{substitutionvariable_ipalocation\\}._locations']
+
+        entry = ldap.entries[record_dn(u'_kerberos')]
+        assert entry['txtrecord'] == [u'"EXAMPLE.COM"']
+        assert entry['objectclass'] == [u'top', u'idnsrecord']
+        assert CNAME_TEMPLATE_ATTR not in entry
+
+    def test_unchanged(self, api, ldap):
+        IPASystemRecords(api).update_dns_records()
+        del ldap.written[:]
+
+        (success, failed), _locations = IPASystemRecords(
+            api).update_dns_records()
+        assert failed == []
+        assert len(success) == 8
+        assert ldap.written == []
+
+    def test_update(self, api, ldap):
+        IPASystemRecords(api).update_dns_records()
+        del ldap.written[:]
+        # a stale record, another type and a record stored in a different
+        # textual form
+        ldap.entries[record_dn(u'_ldap._tcp')]['srvrecord'] = [
+            srv(389, weight=50)]
+        ldap.entries[record_dn(u'_ldap._tcp')]['arecord'] = [u'192.0.2.1']
+        ldap.entries[record_dn(u'_kpasswd._tcp')]['srvrecord'] = [
+            u'0  100  464  ipa.example.com.']
+
+        IPASystemRecords(api).update_dns_records()
+        assert ldap.written == [('update', record_dn(u'_ldap._tcp'))]
+        entry = ldap.entries[record_dn(u'_ldap._tcp')]
+        assert entry['srvrecord'] == [srv(389)]
+        assert entry['arecord'] == [u'192.0.2.1']
+
+    def test_cname_template(self, api, ldap):
+        # an existing entry without the template
+        ldap.store(u'_ldap._tcp', srvrecord=[srv(389)])
+
+        IPASystemRecords(api).update_dns_records()
+        assert ('update', record_dn(u'_ldap._tcp')) in ldap.written
+        entry = ldap.entries[record_dn(u'_ldap._tcp')]
+        assert entry['objectclass'] == [
+            u'top', u'idnsrecord', u'idnsTemplateObject']
+        assert entry[CNAME_TEMPLATE_ATTR] == [
+            u'_ldap._tcp.\\{substitutionvariable_ipalocation\\}._locations']
+
+    def test_diff(self, api, ldap):
+        IPASystemRecords(api).update_dns_records()
+        del ldap.written[:]
+        ldap.entries[record_dn(u'_ldap._tcp')]['srvrecord'] = [
+            srv(389, weight=50)]
+        del ldap.entries[record_dn(u'_kerberos')]
+
+        system_records = IPASystemRecords(api)
+        diff = system_records.diff_records(system_records.get_base_records())
+        assert ldap.written == []
+        assert ldap.searches == 2
+        assert IPASystemRecords.records_list_from_diff(
+            sorted(diff, key=lambda d: d[0])) == [
+            u'+_kerberos.example.com. 86400 IN TXT "EXAMPLE.COM"',
+            u'-_ldap._tcp.example.com. 86400 IN SRV %s' % srv(389, 50),
+            u'+_ldap._tcp.example.com. 86400 IN SRV %s' % srv(389),
+        ]
+
+    def test_not_managed(self):
+        api = FakeAPI(managed=False)
+        system_records = IPASystemRecords(api)
+        with pytest.raises(IPADomainIsNotManagedByIPAError):
+            system_records.diff_records(system_records.get_base_records())
+        with pytest.raises(IPADomainIsNotManagedByIPAError):
+            system_records.update_dns_records()
+        assert api.Backend.ldap2.written == []
@@ -0,0 +1,117 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the in-memory DNS zone index
+"""
+
+import pytest
+
+from ipapython.dn import DN
+from ipapython.dnsutil import DNSName
+from ipaserver.dns_zone_index import DNSZoneIndex
+
+BASE_DN = DN(('cn', 'dns'), ('dc', 'example'), ('dc', 'com'))
+
+
+def zone_dn(zone, record=None):
+    if record is None:
+        return str(DN(('idnsname', zone), BASE_DN))
+    return str(DN(('idnsname', record), ('idnsname', zone), BASE_DN))
+
+
+def zone_attrs(objectclass, active=True):
+    return {
+        'objectClass': [b'top', objectclass.encode('utf-8')],
+        'idnsZoneActive': [b'TRUE' if active else b'FALSE'],
+        'nsRecord': [b'ns1'],
+    }
+
+
+NS = {'objectClass': [b'top', b'idnsRecord'], 'nsRecord': [b'ns1.example.']}
+A = {'objectClass': [b'top', b'idnsRecord']}
+
+
+@pytest.mark.tier0
+class TestDNSZoneIndex(object):
+    @pytest.fixture
+    def index(self):
+        index = DNSZoneIndex(BASE_DN)
+        index.syncrepl_entry(
+            zone_dn('example.com.'), zone_attrs('idnsZone'), 'uuid-z1')
+        index.syncrepl_entry(
+            zone_dn('sub.example.com.'), zone_attrs('idnsZone', False),
+            'uuid-z2')
+        index.syncrepl_entry(
+            zone_dn('fw.example.com.'), zone_attrs('idnsForwardZone'),
+            'uuid-f1')
+        index.syncrepl_entry(
+            zone_dn('a.fw.example.com.'), zone_attrs('idnsForwardZone'),
+            'uuid-f2')
+        index.syncrepl_entry(
+            zone_dn('example.com.', 'fw'), NS, 'uuid-r1')
+        index.syncrepl_entry(
+            zone_dn('example.com.', 'deep.dele'), NS, 'uuid-r2')
+        index.syncrepl_entry(
+            zone_dn('example.com.', 'www'), A, 'uuid-r3')
+        return index
+
+    def test_auth_zone(self, index):
+        assert index.get_auth_zone(DNSName(u'www.Example.COM.')) == \
+            DNSName(u'example.com.')
+        assert index.get_auth_zone(DNSName(u'example.com')) == \
+            DNSName(u'example.com.')
+        # inactive zone
+        assert index.get_auth_zone(DNSName(u'x.sub.example.com.')) == \
+            DNSName(u'example.com.')
+        assert index.get_auth_zone(DNSName(u'example.net.')) is None
+
+    def test_ns_delegation(self, index):
+        zone = DNSName(u'example.com.')
+        assert index.get_ns_delegation(
+            zone, DNSName(u'x.a.fw.example.com.')) == DNSName(u'fw')
+        assert index.get_ns_delegation(
+            zone, DNSName(u'x.deep.dele')) == DNSName(u'deep.dele')
+        assert index.get_ns_delegation(zone, DNSName(u'dele')) is None
+        assert index.get_ns_delegation(zone, DNSName(u'www')) is None
+        # NS records in zone apex are not delegations
+        assert index.get_ns_delegation(zone, zone) is None
+        assert index.get_ns_delegation(
+            DNSName(u'example.net.'), DNSName(u'fw.example.com.')) is None
+
+    def test_forward_zones(self, index):
+        name = DNSName(u'fw.example.com')
+        assert set(index.find_forward_zones(name)) == {
+            DNSName(u'a.fw.example.com.'), DNSName(u'fw.example.com.')}
+        assert index.find_forward_zones(name, child_zones_only=True) == [
+            DNSName(u'a.fw.example.com.')]
+        assert set(index.find_forward_zones(DNSName(u'com.'))) == {
+            DNSName(u'a.fw.example.com.'), DNSName(u'fw.example.com.')}
+        assert index.find_forward_zones(DNSName(u'example.net.')) == []
+
+    def test_changes(self, index):
+        # zone deactivated
+        index.syncrepl_entry(
+            zone_dn('example.com.'), zone_attrs('idnsZone', False),
+            'uuid-z1')
+        assert index.get_auth_zone(DNSName(u'www.example.com.')) is None
+
+        # delegation removed
+        index.syncrepl_entry(zone_dn('example.com.', 'fw'), A, 'uuid-r1')
+        assert index.get_ns_delegation(
+            DNSName(u'example.com.'), DNSName(u'fw')) is None
+
+        index.syncrepl_delete(['uuid-f2'])
+        assert index.find_forward_zones(DNSName(u'fw.example.com.')) == [
+            DNSName(u'fw.example.com.')]
+
+    def test_refresh_deletes(self, index):
+        index.syncrepl_present(['uuid-z1', 'uuid-f1'])
+        index.syncrepl_present(None, refreshDeletes=False)
+        assert len(index) == 2
+        assert index.find_forward_zones(DNSName(u'fw.example.com.')) == [
+            DNSName(u'fw.example.com.')]
+        # nodes which hold nothing are pruned
+        assert index._find(DNSName(u'a.fw.example.com.')) is None
+        assert index._find(DNSName(u'dele.example.com.')) is None
@@ -0,0 +1,311 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for dnszone-import and dnszone-export
+"""
+
+import re
+
+import dns.name
+import dns.rdatatype
+import dns.zone
+import pytest
+import six
+
+from ipalib import errors
+from ipapython.dn import DN
+from ipapython.dnsutil import DNSName
+from ipapython.ipaldap import LDAPClient
+from ipaserver.plugins.dns import (
+    _dns_records,
+    _ZoneFileNodes,
+    dnsrecord,
+    dnszone_export,
+    dnszone_import,
+)
+
+ZONE_FILE = b"""
+$TTL 3600
+@       IN SOA ns1.example.com. hostmaster.example.com. 1 2 3 4 5
+        IN NS ns1
+ns1     IN A 192.0.2.1
+www     IN A 192.0.2.2
+        IN AAAA 2001:db8::2
+mail    IN MX 10 mx.example.net.
+ftp     IN CNAME www
+www     IN TXT "again"
+"""
+
+
+def parse(batch_size):
+    batches = []
+    nodes = _ZoneFileNodes(batches.append, batch_size)
+
+    def zone_factory(origin, rdclass, relativize=True):
+        zone = dns.zone.Zone(origin, rdclass, relativize=relativize)
+        zone.nodes = nodes
+        return zone
+
+    dns.zone.from_text(ZONE_FILE, origin='example.com.', relativize=True,
+                       zone_factory=zone_factory, allow_include=False,
+                       check_origin=False)
+    nodes.flush()
+    return batches
+
+
+def records(batches):
+    result = set()
+    for batch in batches:
+        for name, node in batch:
+            for rdataset in node.rdatasets:
+                for rd in rdataset:
+                    result.add((name.to_text(),
+                                dns.rdatatype.to_text(rdataset.rdtype),
+                                rd.to_text()))
+    return result
+
+
+@pytest.mark.tier0
+class TestZoneFileNodes(object):
+    def test_single_batch(self):
+        batches = parse(1000)
+        assert len(batches) == 1
+        names = [name for name, _node in batches[0]]
+        assert sorted(n.to_text() for n in names) == [
+            '@', 'ftp', 'mail', 'ns1', 'www']
+
+    def test_batches(self):
+        batches = parse(2)
+        assert all(len(batch) <= 2 for batch in batches)
+        assert records(batches) == records(parse(1000))
+
+        # www appears again after other names, its TXT record is handed
+        # over in a later batch than its address records
+        www = dns.name.from_text('www', None)
+        www_batches = [i for i, batch in enumerate(batches)
+                       for name, _node in batch if name == www]
+        assert len(www_batches) == 2
+
+    def test_records(self):
+        assert records(parse(1000)) >= {
+            ('www', 'A', '192.0.2.2'),
+            ('www', 'AAAA', '2001:db8::2'),
+            ('mail', 'MX', '10 mx.example.net.'),
+            ('ftp', 'CNAME', 'www'),
+            ('@', 'NS', 'ns1'),
+        }
+
+
+ZONE = DNSName(u'example.com.')
+ZONE_DN = DN(('idnsname', u'example.com.'), ('cn', 'dns'),
+             ('dc', 'example'), ('dc', 'com'))
+
+
+def record_dn(name):
+    return DN(('idnsname', name), ZONE_DN)
+
+
+class FakeLDAP(LDAPClient):
+    """
+    ldap2 backend with the entries of a DNS zone in memory
+    """
+    def __init__(self):
+        super(FakeLDAP, self).__init__('ldap://localhost', no_schema=True)
+        zone_entry = self.make_entry(
+            ZONE_DN,
+            objectclass=[u'top', u'idnsrecord', u'idnszone'],
+            idnsname=[ZONE],
+            idnssoamname=[DNSName(u'ns1.example.com.')],
+            idnssoarname=[DNSName(u'hostmaster.example.com.')],
+            idnssoaserial=[u'1'],
+            idnssoarefresh=[u'3600'],
+            idnssoaretry=[u'900'],
+            idnssoaexpire=[u'1209600'],
+            idnssoaminimum=[u'3600'],
+            nsrecord=[u'ns1'],
+        )
+        object.__setattr__(self, 'entries', {ZONE_DN: zone_entry})
+        object.__setattr__(self, 'written', [])
+
+    def store(self, name, **attrs):
+        entry = self.make_entry(
+            record_dn(name), objectclass=[u'top', u'idnsrecord'],
+            idnsname=[DNSName(name)], **attrs)
+        self.entries[entry.dn] = entry
+
+    def copy(self, entry):
+        # entries read from the server are copies
+        return self.make_entry(entry.dn, dict(entry))
+
+    def get_entry(self, dn, attrs_list=None, **kwargs):
+        try:
+            return self.copy(self.entries[dn])
+        except KeyError:
+            raise errors.NotFound(reason=u'%s: entry not found' % dn)
+
+    def get_entries(self, base_dn, scope=None, filter=None, attrs_list=None,
+                    **kwargs):
+        assert base_dn == ZONE_DN
+        assert scope == self.SCOPE_ONELEVEL
+        names = set(n.lower() for n in re.findall(r'idnsname=([^)]*)', filter))
+        entries = [self.copy(e) for dn, e in self.entries.items()
+                   if dn != ZONE_DN and dn[0].value.lower() in names]
+        if not entries:
+            raise errors.EmptyResult(reason=u'no matching entry found')
+        return entries
+
+    def iter_entries(self, filter=None, attrs_list=None, base_dn=None,
+                     scope=None, **kwargs):
+        assert base_dn == ZONE_DN
+        for dn in sorted(self.entries, key=str):
+            if dn != ZONE_DN:
+                yield self.copy(self.entries[dn])
+
+    def add_entry(self, entry):
+        assert entry.dn not in self.entries
+        self.written.append(('add', entry.dn))
+        self.entries[entry.dn] = entry
+
+    def update_entry(self, entry):
+        assert entry.dn in self.entries
+        self.written.append(('update', entry.dn))
+        self.entries[entry.dn] = entry
+
+
+class FakeDNSRecord(object):
+    object_class = [u'top', u'idnsrecord']
+    params = dict((param.name, param) for param in _dns_records)
+
+    check_record_type_collisions = six.get_unbound_function(
+        dnsrecord.check_record_type_collisions)
+    is_pkey_zone_record = six.get_unbound_function(
+        dnsrecord.is_pkey_zone_record)
+
+
+class FakeAPI(object):
+    def __init__(self):
+        self.env = type('env', (), dict(host=u'ipa.example.com'))()
+        self.Object = type('Object', (), dict(dnsrecord=FakeDNSRecord()))()
+
+
+def import_zone_file(ldap, zonefile):
+    command = dnszone_import(FakeAPI())
+    result = dict(names_added=0, names_updated=0, records_imported=0,
+                  records_skipped=[])
+    zone = dns.zone.from_text(zonefile, origin=ZONE.ToASCII(),
+                              relativize=True, check_origin=False)
+    command._import_nodes(ldap, ZONE, ZONE_DN, list(zone.nodes.items()),
+                          result)
+    return result
+
+
+@pytest.mark.tier0
+class TestImport(object):
+    @pytest.fixture
+    def ldap(self):
+        return FakeLDAP()
+
+    def test_add(self, ldap):
+        result = import_zone_file(ldap, ZONE_FILE)
+        assert result['names_added'] == 4
+        assert result['names_updated'] == 0
+        assert result['records_imported'] == 6
+        assert sorted(result['records_skipped']) == [u'@ NS', u'@ SOA']
+
+        entry = ldap.entries[record_dn(u'www')]
+        assert entry['objectclass'] == [u'top', u'idnsrecord']
+        assert entry['idnsname'] == [DNSName(u'www')]
+        assert entry['dnsttl'] == [3600]
+        assert entry['arecord'] == [u'192.0.2.2']
+        assert entry['aaaarecord'] == [u'2001:db8::2']
+        assert entry['txtrecord'] == [u'"again"']
+        assert ldap.entries[ZONE_DN]['nsrecord'] == [u'ns1']
+
+    def test_merge(self, ldap):
+        ldap.store(u'www', arecord=[u'192.0.2.3'])
+        # the same record in a different textual form
+        ldap.store(u'mail', mxrecord=[u'10  mx.example.net.'])
+
+        result = import_zone_file(ldap, ZONE_FILE)
+        assert result['names_added'] == 2
+        assert result['names_updated'] == 1
+        assert result['records_imported'] == 5
+        assert ('update', record_dn(u'mail')) not in ldap.written
+        assert sorted(ldap.entries[record_dn(u'www')]['arecord']) == [
+            u'192.0.2.2', u'192.0.2.3']
+        assert ldap.entries[record_dn(u'mail')]['mxrecord'] == [
+            u'10  mx.example.net.']
+
+        # importing again changes nothing
+        del ldap.written[:]
+        result = import_zone_file(ldap, ZONE_FILE)
+        assert result['names_added'] == 0
+        assert result['names_updated'] == 0
+        assert result['records_imported'] == 0
+        assert ldap.written == []
+
+    def test_apex(self, ldap):
+        result = import_zone_file(ldap, b"""
+@       IN SOA ns1.example.com. hostmaster.example.com. 1 2 3 4 5
+@ 3600  IN NS ns2
+@ 3600  IN MX 10 mx.example.net.
+""")
+        assert result['names_updated'] == 1
+        assert sorted(result['records_skipped']) == [u'@ NS', u'@ SOA']
+        entry = ldap.entries[ZONE_DN]
+        assert entry['nsrecord'] == [u'ns1']
+        assert entry['mxrecord'] == [u'10 mx.example.net.']
+
+    def test_unsupported(self, ldap):
+        result = import_zone_file(ldap, b"""
+host    3600 IN A 192.0.2.1
+        3600 IN HINFO "PC" "Linux"
+""")
+        assert result['records_skipped'] == [u'host HINFO']
+        assert result['records_imported'] == 1
+        assert 'hinforecord' not in ldap.entries[record_dn(u'host')]
+
+    def test_collision(self, ldap):
+        ldap.store(u'www', arecord=[u'192.0.2.3'])
+        result = import_zone_file(ldap, b"""
+www     3600 IN CNAME host
+host    3600 IN A 192.0.2.1
+""")
+        [skipped] = result['records_skipped']
+        assert skipped.startswith(u'www: ')
+        assert 'CNAME' in skipped
+        assert result['names_added'] == 1
+        assert result['records_imported'] == 1
+        assert ldap.entries[record_dn(u'www')]['arecord'] == [u'192.0.2.3']
+        assert 'cnamerecord' not in ldap.entries[record_dn(u'www')]
+
+
+@pytest.mark.tier0
+class TestExport(object):
+    def test_export(self):
+        ldap = FakeLDAP()
+        ldap.store(u'www', arecord=[u'192.0.2.2'], txtrecord=[u'"a b"'],
+                   dnsttl=[300])
+        ldap.store(u'mail', mxrecord=[u'10 mx.example.net.'])
+        command = dnszone_export(FakeAPI())
+
+        zonefile = u''.join(command._iter_zone_file(
+            ldap, ZONE, ldap.get_entry(ZONE_DN)))
+        assert zonefile == (
+            u'$ORIGIN example.com.\n'
+            u'@ IN SOA ns1.example.com. hostmaster.example.com. '
+            u'1 3600 900 1209600 3600\n'
+            u'@ IN NS ns1\n'
+            u'mail IN MX 10 mx.example.net.\n'
+            u'www 300 IN A 192.0.2.2\n'
+            u'www 300 IN TXT "a b"\n'
+        )
+
+        # the zone file can be imported into another zone
+        other = FakeLDAP()
+        result = import_zone_file(other, zonefile.encode('utf-8'))
+        assert result['names_added'] == 2
+        assert result['records_imported'] == 3
+        assert other.entries[record_dn(u'www')]['txtrecord'] == [u'"a b"']
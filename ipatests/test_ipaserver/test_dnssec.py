@@ -4,9 +4,15 @@
 """
 Test the `ipaserver/dnssec` package.
 """
+import os
+
 import dns.name
+from ldap.syncrepl import SyncreplConsumer
 
+from ipaplatform.paths import paths
+from ipaserver.dnssec.bindmgr import BINDMgr
 from ipaserver.dnssec.odsmgr import ODSZoneListReader
+from ipaserver.dnssec.syncrepl import SyncReplConsumer
 
 
 ZONELIST_XML = """<?xml version="1.0" encoding="UTF-8"?>
@@ -39,3 +45,119 @@ def test_ods_zonelist_reader():
     assert reader.mapping == {uuid: name}
     assert reader.names == {name}
     assert reader.uuids == {uuid}
+
+
+def make_bindmgr(monkeypatch, installed, notified):
+    mgr = BINDMgr(None)
+
+    def install_key(zone, uuid, attrs, workdir):
+        installed.append(uuid)
+        basename = 'K%s+008+%s' % (zone.to_text(), uuid)
+        for suffix, content in (('.key', ''), ('.private', ''),
+                                ('.uuid', uuid), ('.dn', attrs['dn']),
+                                ('.digest', mgr.key_digest(attrs))):
+            with open(os.path.join(workdir, basename + suffix), 'w') as f:
+                f.write(content)
+        return basename
+
+    monkeypatch.setattr(mgr, 'install_key', install_key)
+    monkeypatch.setattr(mgr, 'notify_zone', notified.append)
+    return mgr
+
+
+def test_bindmgr_incremental_sync(tmpdir, monkeypatch):
+    monkeypatch.setattr(paths, 'BIND_LDAP_DNS_ZONE_WORKDIR', str(tmpdir))
+    zone = dns.name.from_text('ipa.example.')
+    keys_dir = os.path.join(str(tmpdir), 'ipa.example', 'keys')
+    key1 = {'dn': 'cn=key1', 'idnsseckeyref': ['ref1'],
+            'idnsseckeypublish': ['20170101000000Z']}
+    key2 = {'dn': 'cn=key2', 'idnsseckeyref': ['ref2']}
+
+    installed = []
+    notified = []
+    mgr = make_bindmgr(monkeypatch, installed, notified)
+    mgr.ldap_keys[zone] = {'1': key1, '2': key2}
+    mgr.sync_zone(zone)
+    assert sorted(installed) == ['1', '2']
+    assert notified == [zone]
+    assert len(os.listdir(keys_dir)) == 10
+
+    # nothing changed
+    del installed[:], notified[:]
+    mgr.sync_zone(zone)
+    assert installed == []
+    assert notified == []
+
+    # only the modified key is installed again, deleted key is removed
+    mgr.ldap_keys[zone] = {
+        '1': dict(key1, idnsseckeypublish=['20170102000000Z'])}
+    mgr.sync_zone(zone)
+    assert installed == ['1']
+    assert notified == [zone]
+    assert sorted(os.listdir(keys_dir)) == sorted(
+        'Kipa.example.+008+1' + suffix
+        for suffix in ('.key', '.private', '.uuid', '.dn', '.digest'))
+
+    # installed keys are read from the key directory after restart
+    del installed[:], notified[:]
+    mgr = make_bindmgr(monkeypatch, installed, notified)
+    mgr.ldap_keys[zone] = {
+        '1': dict(key1, idnsseckeypublish=['20170102000000Z'])}
+    mgr.sync_zone(zone)
+    assert installed == []
+    assert notified == []
+
+
+class RecordingConsumer(SyncReplConsumer):
+    def __init__(self, *args, **kwargs):
+        self.added = []
+        SyncReplConsumer.__init__(self, *args, **kwargs)
+
+    def application_add(self, uuid, dn, attributes):
+        self.added.append((uuid, dn, attributes['objectClass']))
+
+
+def test_syncrepl_persistent_store(tmpdir, monkeypatch):
+    monkeypatch.setattr(SyncreplConsumer, 'syncrepl_search',
+                        lambda self, *args, **kwargs: 1)
+    db_path = str(tmpdir.join('sync.db'))
+    base = 'cn=dns,dc=ipa,dc=example'
+
+    def start(filterstr='(objectClass=idnsZone)'):
+        consumer = RecordingConsumer('ldap://localhost', db_path=db_path)
+        consumer.syncrepl_search(base, 2, mode='refreshAndPersist',
+                                 filterstr=filterstr)
+        return consumer
+
+    consumer = start()
+    assert consumer.syncrepl_get_cookie() is None
+    consumer.syncrepl_entry('idnsname=a,%s' % base,
+                            {'objectClass': ['idnsZone']}, 'uuid-a')
+    consumer.syncrepl_entry('idnsname=b,%s' % base,
+                            {'objectClass': ['idnsZone']}, 'uuid-b')
+    consumer.syncrepl_set_cookie('cookie1')
+    # not followed by a cookie, discarded
+    consumer.syncrepl_entry('idnsname=c,%s' % base,
+                            {'objectClass': ['idnsZone']}, 'uuid-c')
+    consumer.close_db()
+
+    consumer = start()
+    assert consumer.syncrepl_get_cookie() == 'cookie1'
+    assert sorted(consumer.added) == [
+        ('uuid-a', 'idnsname=a,%s' % base, ['idnsZone']),
+        ('uuid-b', 'idnsname=b,%s' % base, ['idnsZone']),
+    ]
+    consumer.syncrepl_delete(['uuid-a'])
+    consumer.syncrepl_set_cookie('cookie2')
+    consumer.close_db()
+
+    consumer = start()
+    assert consumer.syncrepl_get_cookie() == 'cookie2'
+    assert [uuid for uuid, _dn, _oc in consumer.added] == ['uuid-b']
+    consumer.close_db()
+
+    # state of a different search is not used
+    consumer = start(filterstr='(objectClass=idnsSecKey)')
+    assert consumer.syncrepl_get_cookie() is None
+    assert consumer.added == []
+    consumer.close_db()
@@ -142,6 +142,43 @@ class test_ldap(object):
         serial = x509.load_certificate(cert, x509.DER).serial_number
         assert serial is not None
 
+    def test_iter_entries(self):
+        """
+        Test that iter_entries streams the same entries as find_entries
+        """
+        self.conn = ldap2(api)
+        self.conn.connect(autobind=AUTOBIND_DISABLED)
+        base_dn = DN(api.env.container_service, api.env.basedn)
+        entries, _truncated = self.conn.find_entries(
+            '(objectclass=ipaservice)', ['krbprincipalname'], base_dn)
+        streamed = list(self.conn.iter_entries(
+            '(objectclass=ipaservice)', ['krbprincipalname'], base_dn,
+            paged_search=True))
+        assert (sorted(e.dn for e in streamed) ==
+                sorted(e.dn for e in entries))
+
+    def test_iter_entries_empty(self):
+        """
+        Test that iter_entries yields nothing for an empty result set
+        """
+        self.conn = ldap2(api)
+        self.conn.connect(autobind=AUTOBIND_DISABLED)
+        assert list(self.conn.iter_entries(
+            '(cn=nonexistent-entry)', [''], api.env.basedn)) == []
+
+    def test_iter_entries_close(self):
+        """
+        Test that an unfinished iter_entries search can be abandoned
+        """
+        self.conn = ldap2(api)
+        self.conn.connect(autobind=AUTOBIND_DISABLED)
+        result = self.conn.iter_entries(
+            None, [''], api.env.basedn, paged_search=True)
+        next(result)
+        result.close()
+        entry = self.conn.get_entry(api.env.basedn, ['associateddomain'])
+        assert entry.single_value['associateddomain'] == api.env.domain
+
 
 @pytest.mark.tier0
 class test_LDAPEntry(object):
@@ -0,0 +1,173 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for adding and removing group members in bulk
+"""
+
+import re
+
+import ldap
+import pytest
+
+from ipalib import errors
+from ipalib.request import context, Connection
+from ipapython.dn import DN
+from ipaserver.plugins.ldap2 import ldap2
+
+BASE_DN = DN('dc=example,dc=com')
+USERS_DN = DN(('cn', 'users'), ('cn', 'accounts'), BASE_DN)
+GROUPS_DN = DN(('cn', 'groups'), ('cn', 'accounts'), BASE_DN)
+GROUP_DN = DN(('cn', 'g1'), GROUPS_DN)
+
+
+def user_dn(name):
+    return DN(('uid', name), USERS_DN)
+
+
+class FakeDirectory(object):
+    """
+    python-ldap connection to a directory of users and groups which
+    understands the searches and modifies of add_entries_to_group and
+    remove_entries_from_group
+    """
+    def __init__(self, dns, members=()):
+        self.dns = set(dns)
+        self.members = set(members)
+        self.searches = []
+        self.modifies = []
+
+    def search_ext(self, base, scope, filterstr, attrlist, serverctrls=None,
+                   timeout=-1, sizelimit=0):
+        base = DN(base)
+        if isinstance(filterstr, bytes):
+            filterstr = filterstr.decode('utf-8')
+        self.searches.append((base, scope, filterstr))
+        if scope == ldap.SCOPE_BASE:
+            if base not in self.dns:
+                raise ldap.NO_SUCH_OBJECT({'desc': 'No such object'})
+            self.results = [base]
+        else:
+            assert scope == ldap.SCOPE_ONELEVEL
+            avas = {(attr.lower(), value.lower()) for attr, value
+                    in re.findall(r'\(([^()=|&]+)=([^()]*)\)', filterstr)}
+            self.results = [
+                dn for dn in self.dns if dn[1:] == base and
+                (dn[0].attr.lower(), dn[0].value.lower()) in avas]
+        return 1
+
+    def result3(self, msgid, all=1):
+        if self.results:
+            dn = self.results.pop(0)
+            return ldap.RES_SEARCH_ENTRY, [(str(dn), {})], msgid, []
+        return ldap.RES_SEARCH_RESULT, [], msgid, []
+
+    def modify_s(self, dn, modlist):
+        assert DN(dn) == GROUP_DN
+        [(op, attr, values)] = modlist
+        assert attr == 'member'
+        values = [DN(v.decode('utf-8')) for v in values]
+        self.modifies.append((op, values))
+        if op == ldap.MOD_ADD:
+            if len(set(values)) != len(values) or self.members & set(values):
+                raise ldap.TYPE_OR_VALUE_EXISTS({'desc': 'Value exists'})
+            self.members.update(values)
+        else:
+            if len(set(values)) != len(values) or \
+                    not set(values) <= self.members:
+                raise ldap.NO_SUCH_ATTRIBUTE({'desc': 'No such attribute'})
+            self.members.difference_update(values)
+
+
+class FakeEnv(object):
+    in_server = False
+    context = 'server'
+    basedn = BASE_DN
+    ldap_uri = 'ldap://localhost'
+
+
+class FakeAPI(object):
+    env = FakeEnv()
+
+
+@pytest.mark.tier0
+class TestGroupMembers(object):
+    users = [user_dn(u'user%d' % i) for i in range(5)]
+
+    @pytest.fixture
+    def directory(self):
+        return FakeDirectory(self.users + [GROUP_DN])
+
+    @pytest.fixture
+    def backend(self, request, directory):
+        backend = ldap2(FakeAPI())
+        backend.member_chunk_size = 2
+        setattr(context, backend.id, Connection(directory, lambda: None))
+        request.addfinalizer(lambda: delattr(context, backend.id))
+        return backend
+
+    def test_add(self, backend, directory):
+        assert backend.add_entries_to_group(self.users, GROUP_DN) == []
+        assert directory.members == set(self.users)
+        # a search and a modify per chunk of members
+        assert len(directory.searches) == 3
+        assert all(scope == ldap.SCOPE_ONELEVEL
+                   for _base, scope, _filter in directory.searches)
+        assert [len(values) for _op, values in directory.modifies] == [
+            2, 2, 1]
+
+    def test_add_failed(self, backend, directory):
+        directory.members.add(self.users[1])
+        missing = user_dn(u'missing')
+        dns = [missing, self.users[0], GROUP_DN, self.users[1],
+               self.users[2]]
+
+        failed = backend.add_entries_to_group(dns, GROUP_DN)
+        # failures are reported in input order
+        assert [(dn, type(e)) for dn, e in failed] == [
+            (missing, errors.NotFound),
+            (GROUP_DN, errors.SameGroupError),
+            (self.users[1], errors.AlreadyGroupMember),
+        ]
+        assert directory.members == set(self.users[:3])
+        # the chunk with the existing member is added one by one
+        assert directory.modifies == [
+            (ldap.MOD_ADD, [self.users[0], self.users[1]]),
+            (ldap.MOD_ADD, [self.users[0]]),
+            (ldap.MOD_ADD, [self.users[1]]),
+            (ldap.MOD_ADD, [self.users[2]]),
+        ]
+
+    def test_add_same_group(self, backend, directory):
+        assert backend.add_entries_to_group(
+            [GROUP_DN], GROUP_DN, allow_same=True) == []
+        assert directory.members == {GROUP_DN}
+
+    def test_add_reports_input_dn(self, backend, directory):
+        directory.members.add(self.users[0])
+        dn = user_dn(u'USER0')
+        [(failed_dn, e)] = backend.add_entries_to_group([dn], GROUP_DN)
+        assert isinstance(e, errors.AlreadyGroupMember)
+        assert str(failed_dn) == str(dn)
+
+    def test_add_stores_server_dn(self, backend, directory):
+        assert backend.add_entries_to_group(
+            [user_dn(u'USER0')], GROUP_DN) == []
+        [(_op, [value])] = directory.modifies
+        assert str(value) == str(self.users[0])
+
+    def test_remove(self, backend, directory):
+        directory.members.update(self.users)
+        assert backend.remove_entries_from_group(self.users, GROUP_DN) == []
+        assert directory.members == set()
+        assert directory.searches == []
+        assert len(directory.modifies) == 3
+
+    def test_remove_failed(self, backend, directory):
+        directory.members.update(self.users[1:])
+        dns = self.users[:3]
+        failed = backend.remove_entries_from_group(dns, GROUP_DN)
+        assert [(dn, type(e)) for dn, e in failed] == [
+            (self.users[0], errors.NotGroupMember)]
+        assert directory.members == set(self.users[3:])
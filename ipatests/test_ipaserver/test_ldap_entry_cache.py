@@ -0,0 +1,62 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the server-side cache of singleton LDAP entries
+"""
+
+import pytest
+
+from ipapython.dn import DN
+from ipaserver.plugins.ldap2 import LDAPEntryCache
+
+CONFIG_DN = DN('cn=ipaconfig,cn=etc,dc=example,dc=com')
+RAW = {'ipaSearchTimeLimit': [b'2']}
+
+
+@pytest.mark.tier0
+class TestLDAPEntryCache(object):
+    key = (u'admin@EXAMPLE.COM', CONFIG_DN)
+
+    def test_empty(self):
+        cache = LDAPEntryCache()
+        assert cache.get(self.key) is None
+        assert len(cache) == 0
+
+    def test_fresh(self):
+        cache = LDAPEntryCache()
+        cache.set(self.key, str(CONFIG_DN), RAW, [b'10'])
+        assert cache.get(self.key) == (True, str(CONFIG_DN), RAW, [b'10'])
+        assert cache.get((u'bob@EXAMPLE.COM', CONFIG_DN)) is None
+
+    def test_expired(self):
+        cache = LDAPEntryCache(ttl=-1)
+        cache.set(self.key, str(CONFIG_DN), RAW, [b'10'])
+        fresh, _dn, _raw, usn = cache.get(self.key)
+        assert not fresh
+        assert usn == [b'10']
+
+        cache.ttl = 60
+        cache.touch(self.key)
+        assert cache.get(self.key)[0]
+
+    def test_max_size(self):
+        cache = LDAPEntryCache(max_size=1)
+        other_key = (u'bob@EXAMPLE.COM', CONFIG_DN)
+        cache.set(self.key, str(CONFIG_DN), RAW, None)
+        cache.set(other_key, str(CONFIG_DN), RAW, None)
+        assert len(cache) == 1
+        assert cache.get(self.key) is None
+        assert cache.get(other_key) is not None
+
+    def test_invalidate(self):
+        cache = LDAPEntryCache()
+        other_dn = DN('cn=UPG Definition,cn=etc,dc=example,dc=com')
+        cache.set(self.key, str(CONFIG_DN), RAW, None)
+        cache.set((u'bob@EXAMPLE.COM', CONFIG_DN), str(CONFIG_DN), RAW, None)
+        cache.set((u'bob@EXAMPLE.COM', other_dn), str(other_dn), RAW, None)
+        cache.invalidate(CONFIG_DN)
+        assert len(cache) == 1
+        cache.invalidate()
+        assert len(cache) == 0
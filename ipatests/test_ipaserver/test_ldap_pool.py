@@ -0,0 +1,106 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the server-side pool of bound LDAP connections
+"""
+
+import ldap
+import pytest
+
+from ipaserver.plugins.ldap2 import LDAPConnectionPool
+
+
+class FakeConnection(object):
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.unbound = False
+
+    def whoami_s(self):
+        if not self.healthy:
+            raise ldap.SERVER_DOWN()
+        return 'dn: uid=admin'
+
+    def unbind_s(self):
+        self.unbound = True
+
+
+@pytest.mark.tier0
+class TestLDAPConnectionPool(object):
+    key = ('ldapi://socket', u'admin@EXAMPLE.COM')
+
+    def test_empty(self):
+        pool = LDAPConnectionPool()
+        assert pool.checkout(self.key) is None
+        assert len(pool) == 0
+
+    def test_reuse(self):
+        pool = LDAPConnectionPool()
+        conn = FakeConnection()
+        pool.register(self.key, conn)
+        assert pool.checkin(conn)
+        assert len(pool) == 1
+        assert pool.checkout(self.key) is conn
+        assert len(pool) == 0
+        assert not conn.unbound
+
+    def test_other_principal(self):
+        pool = LDAPConnectionPool()
+        conn = FakeConnection()
+        pool.register(self.key, conn)
+        pool.checkin(conn)
+        assert pool.checkout(('ldapi://socket', u'bob@EXAMPLE.COM')) is None
+        assert pool.checkout(self.key) is conn
+
+    def test_unmanaged(self):
+        pool = LDAPConnectionPool()
+        conn = FakeConnection()
+        assert not pool.checkin(conn)
+        pool.register(self.key, conn)
+        pool.discard(conn)
+        assert not pool.checkin(conn)
+
+    def test_max_size(self):
+        pool = LDAPConnectionPool(max_size=1)
+        first, second = FakeConnection(), FakeConnection()
+        pool.register(self.key, first)
+        pool.register(self.key, second)
+        assert pool.checkin(first)
+        assert pool.checkin(second)
+        assert len(pool) == 1
+        assert first.unbound
+        assert pool.checkout(self.key) is second
+
+    def test_disabled(self):
+        pool = LDAPConnectionPool(max_size=0)
+        conn = FakeConnection()
+        pool.register(self.key, conn)
+        assert not pool.checkin(conn)
+
+    def test_max_idle(self):
+        pool = LDAPConnectionPool(max_idle=-1)
+        conn = FakeConnection()
+        pool.register(self.key, conn)
+        pool.checkin(conn)
+        assert pool.checkout(self.key) is None
+        assert conn.unbound
+
+    def test_health_check(self):
+        pool = LDAPConnectionPool(check_interval=-1)
+        healthy, dead = FakeConnection(), FakeConnection(healthy=False)
+        pool.register(self.key, healthy)
+        pool.register(self.key, dead)
+        pool.checkin(healthy)
+        pool.checkin(dead)
+        assert pool.checkout(self.key) is healthy
+        assert dead.unbound
+
+    def test_clear(self):
+        pool = LDAPConnectionPool()
+        conn = FakeConnection()
+        pool.register(self.key, conn)
+        pool.checkin(conn)
+        pool.clear()
+        assert len(pool) == 0
+        assert conn.unbound
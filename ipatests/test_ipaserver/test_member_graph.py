@@ -0,0 +1,169 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the server-side membership graph
+"""
+
+import ldap
+import pytest
+
+from ipalib.request import context, Connection
+from ipapython.dn import DN
+from ipaserver.plugins.ldap2 import MemberGraph, ldap2
+
+BASE_DN = DN('dc=example,dc=com')
+
+
+def group_dn(name):
+    return DN(('cn', name), ('cn', 'groups'), ('cn', 'accounts'), BASE_DN)
+
+
+def user_dn(name):
+    return DN(('uid', name), ('cn', 'users'), ('cn', 'accounts'), BASE_DN)
+
+
+def values(*dns):
+    return [str(dn).encode('utf-8') for dn in dns]
+
+
+@pytest.mark.tier0
+class TestMemberGraph(object):
+    @pytest.fixture
+    def graph(self):
+        graph = MemberGraph(BASE_DN)
+        # g1 -> g2 -> g3, rule -> g1
+        graph.syncrepl_entry(
+            str(group_dn('g1')),
+            {'member': values(user_dn('u1'), group_dn('g2'))}, 'uuid-g1')
+        graph.syncrepl_entry(
+            str(group_dn('g2')),
+            {'member': values(user_dn('u2'), group_dn('g3'))}, 'uuid-g2')
+        graph.syncrepl_entry(
+            str(group_dn('g3')),
+            {'member': values(user_dn('u3'), user_dn('u1'))}, 'uuid-g3')
+        graph.syncrepl_entry(
+            'cn=rule,%s' % BASE_DN,
+            {'memberUser': values(group_dn('g1'))}, 'uuid-rule')
+        return graph
+
+    def test_indirect_members(self, graph):
+        assert graph.get_indirect_members(group_dn('g1')) == {
+            user_dn('u2'), group_dn('g3'), user_dn('u3'), user_dn('u1')}
+        assert graph.get_indirect_members(group_dn('g3')) == set()
+        assert graph.get_indirect_members(DN('cn=rule', BASE_DN)) == {
+            user_dn('u1'), group_dn('g2'), user_dn('u2'), group_dn('g3'),
+            user_dn('u3')}
+
+    def test_direct_memberof(self, graph):
+        assert graph.get_direct_memberof(user_dn('u1')) == {
+            group_dn('g1'), group_dn('g3')}
+        assert graph.get_direct_memberof(group_dn('g1')) == {
+            DN('cn=rule', BASE_DN)}
+        assert graph.get_direct_memberof(user_dn('nobody')) == set()
+
+    def test_cycle(self, graph):
+        graph.syncrepl_entry(
+            str(group_dn('g3')), {'member': values(group_dn('g1'))},
+            'uuid-g3')
+        assert graph.get_indirect_members(group_dn('g3')) == {
+            user_dn('u1'), group_dn('g1'), group_dn('g2'), user_dn('u2'),
+            group_dn('g3')}
+
+    def test_modify(self, graph):
+        graph.syncrepl_entry(
+            str(group_dn('g2')), {'member': values(user_dn('u2'))},
+            'uuid-g2')
+        assert graph.get_indirect_members(group_dn('g1')) == {user_dn('u2')}
+        assert graph.get_direct_memberof(group_dn('g3')) == set()
+
+    def test_delete(self, graph):
+        graph.syncrepl_delete(['uuid-g2'])
+        assert graph.get_indirect_members(group_dn('g1')) == set()
+        assert graph.get_direct_memberof(user_dn('u2')) == set()
+        assert len(graph) == 3
+
+    def test_present(self, graph):
+        graph.syncrepl_present(['uuid-g1', 'uuid-g3', 'uuid-rule'])
+        graph.syncrepl_present(None)
+        assert len(graph) == 3
+        assert graph.get_direct_memberof(group_dn('g3')) == set()
+
+    def test_clear(self, graph):
+        graph.syncrepl_set_cookie('cookie')
+        graph.clear()
+        assert len(graph) == 0
+        assert graph.syncrepl_get_cookie() is None
+
+
+class FakeEnv(object):
+    in_server = True
+    context = 'server'
+    basedn = BASE_DN
+    ldap_uri = 'ldap://localhost'
+    ldap_pool_size = 0
+    ldap_entry_cache_ttl = 0
+    member_graph_size = 2
+
+
+class FakeAPI(object):
+    env = FakeEnv()
+
+
+@pytest.mark.tier0
+class TestGetMemberGraph(object):
+    @pytest.fixture
+    def backend(self, request, monkeypatch):
+        refreshed = []
+        monkeypatch.setattr(MemberGraph, 'refresh',
+                            lambda graph, conn: refreshed.append(graph))
+        backend = ldap2(FakeAPI())
+        backend.refreshed = refreshed
+        setattr(context, backend.id, Connection(object(), lambda: None))
+
+        def fin():
+            delattr(context, backend.id)
+            if hasattr(context, 'principal'):
+                delattr(context, 'principal')
+        request.addfinalizer(fin)
+        return backend
+
+    def get_graph(self, backend, principal):
+        setattr(context, 'principal', principal)
+        return backend.get_member_graph()
+
+    def test_per_principal(self, backend):
+        admin = self.get_graph(backend, u'admin@EXAMPLE.COM')
+        assert admin is not None
+        assert self.get_graph(backend, u'admin@EXAMPLE.COM') is admin
+        bob = self.get_graph(backend, u'bob@EXAMPLE.COM')
+        assert bob is not None and bob is not admin
+        assert backend.refreshed == [admin, admin, bob]
+
+    def test_eviction(self, backend):
+        admin = self.get_graph(backend, u'admin@EXAMPLE.COM')
+        bob = self.get_graph(backend, u'bob@EXAMPLE.COM')
+        assert self.get_graph(backend, u'admin@EXAMPLE.COM') is admin
+        # the least recently used graph is dropped
+        carol = self.get_graph(backend, u'carol@EXAMPLE.COM')
+        assert carol is not None
+        assert len(backend._member_graphs) == 2
+        assert self.get_graph(backend, u'admin@EXAMPLE.COM') is admin
+        new_bob = self.get_graph(backend, u'bob@EXAMPLE.COM')
+        assert new_bob is not bob
+        assert backend.refreshed == [admin, bob, admin, carol, admin, new_bob]
+
+    def test_unavailable(self, backend, monkeypatch):
+        def refresh(graph, conn):
+            backend.refreshed.append(graph)
+            raise ldap.UNAVAILABLE_CRITICAL_EXTENSION({'desc': 'Critical'})
+
+        monkeypatch.setattr(MemberGraph, 'refresh', refresh)
+        assert self.get_graph(backend, u'admin@EXAMPLE.COM') is None
+        # syncrepl is not tried again
+        assert self.get_graph(backend, u'bob@EXAMPLE.COM') is None
+        assert len(backend.refreshed) == 1
+
+    def test_no_principal(self, backend):
+        assert backend.get_member_graph() is None
@@ -22,12 +22,15 @@ Test the `ipaserver.rpc` module.
 """
 
 import json
+import zlib
+
 import pytest
 
 import six
 
 from ipatests.util import assert_equal, raises, PluginTester
 from ipalib import errors
+from ipalib.request import context
 from ipaserver import rpcserver
 
 if six.PY3:
@@ -261,3 +264,174 @@ class test_jsonserver(PluginTester):
         options = dict(givenname=u'John', sn='Doe')
         d = dict(method=u'user_add', params=(args, options), id=18)
         assert o.unmarshal(json.dumps(d)) == (u'user_add', args, options, 18)
+
+    def test_marshal(self):
+        """
+        Test the `ipaserver.rpcserver.jsonserver.marshal_chunks` method.
+        """
+        o, _api, _home = self.instance('Backend', in_server=True)
+        result = dict(
+            count=3,
+            result=[dict(uid=(u'user%d' % i,), cert=(b'\x00\x01',))
+                    for i in range(3)],
+        )
+        chunks = list(o.marshal_chunks(result, None, 18))
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        assert b''.join(chunks) == o.marshal(result, None, 18)
+
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+        assert response['id'] == 18
+        assert response['error'] is None
+        assert response['result']['result'][2]['uid'] == [u'user2']
+
+
+@pytest.mark.parametrize("accept_encoding,expected", [
+    (None, None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('deflate, gzip', 'gzip'),
+    ('deflate', 'deflate'),
+    ('gzip;q=0, deflate;q=0.5', 'deflate'),
+    ('*', 'gzip'),
+    ('*, gzip;q=0', 'deflate'),
+])
+def test_get_content_encoding(accept_encoding, expected):
+    environ = {}
+    if accept_encoding is not None:
+        environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    assert rpcserver.get_content_encoding(environ) == expected
+
+
+@pytest.mark.parametrize("coding,wbits", [
+    ('gzip', 16 + zlib.MAX_WBITS),
+    ('deflate', zlib.MAX_WBITS),
+])
+def test_compress_chunks(coding, wbits):
+    chunks = [b'{"result": ', b'"' + b'x' * 100000 + b'"', b'}']
+    compressed = b''.join(rpcserver.compress_chunks(chunks, coding))
+    assert len(compressed) < 1000
+    assert zlib.decompress(compressed, wbits) == b''.join(chunks)
+
+
+def test_response_cache():
+    cache = rpcserver.ResponseCache(max_size=2)
+    cache.set('a', u'1', dict(result=u'a'))
+    assert cache.get('a', u'1') == dict(result=u'a')
+
+    # a result is only valid at the last USN it was computed at
+    assert cache.get('a', u'2') is None
+    assert cache.get('a', u'1') is None
+
+    cache.set('a', u'2', dict(result=u'a'))
+    cache.set('b', u'2', dict(result=u'b'))
+    assert cache.get('a', u'2') is not None
+    cache.set('c', u'2', dict(result=u'c'))
+    # the least recently used result is dropped
+    assert len(cache) == 2
+    assert cache.get('b', u'2') is None
+    assert cache.get('a', u'2') is not None
+
+
+def test_response_cache_remember():
+    cache = rpcserver.ResponseCache(max_size=2)
+    assert not cache.remember('a')
+    assert cache.remember('a')
+    # a marked key has no result
+    assert cache.get('a', u'1') is None
+
+    cache.set('b', u'1', dict(result=u'b'))
+    assert cache.remember('b')
+    assert cache.get('b', u'1') == dict(result=u'b')
+
+
+class FakeLDAP(object):
+    def __init__(self):
+        self.usn_lookups = 0
+
+    def isconnected(self):
+        return True
+
+    def get_last_usn(self):
+        self.usn_lookups += 1
+        return u'10'
+
+
+class FakeCommand(object):
+    cache_response = True
+    full_name = u'user_show/1'
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **options):
+        self.calls += 1
+        return dict(result=self.calls)
+
+
+class FakeExecutioner(object):
+    def __init__(self):
+        ldap2 = FakeLDAP()
+        self.api = type('api', (), dict(
+            Backend=type('Backend', (), dict(ldap2=ldap2))))
+        self._response_cache = rpcserver.ResponseCache()
+
+    execute_command = six.get_unbound_function(
+        rpcserver.WSGIExecutioner._execute_command)
+
+
+def test_execute_cached_command(request, monkeypatch):
+    def fin():
+        for name in ('response_etag', 'response_not_modified'):
+            if hasattr(context, name):
+                delattr(context, name)
+    request.addfinalizer(fin)
+    monkeypatch.setenv('LANG', 'en_US.UTF-8')
+    executioner = FakeExecutioner()
+    ldap2 = executioner.api.Backend.ldap2
+    command = FakeCommand()
+    args = (u'admin',)
+
+    # the first request of a key does not look up the last USN
+    assert executioner.execute_command(command, args, {}, {}) == dict(
+        result=1)
+    assert ldap2.usn_lookups == 0
+
+    # a repeated request is cached
+    assert executioner.execute_command(command, args, {}, {}) == dict(
+        result=2)
+    assert executioner.execute_command(command, args, {}, {}) == dict(
+        result=2)
+    assert ldap2.usn_lookups == 2
+    assert command.calls == 2
+
+    # a matching ETag is answered without executing the command
+    etag = rpcserver.get_etag(
+        json.dumps([None, command.full_name, 'en_US.UTF-8', args, {}],
+                   sort_keys=True), u'10')
+    environ = {'HTTP_IF_NONE_MATCH': etag}
+    assert executioner.execute_command(command, args, {}, environ) is None
+    assert command.calls == 2
+
+    # an ETag is validated even if the key was never requested
+    environ = {'HTTP_IF_NONE_MATCH': '*'}
+    assert executioner.execute_command(
+        command, (u'other',), {}, environ) == dict(result=3)
+    assert ldap2.usn_lookups == 4
+
+
+def test_etag():
+    etag = rpcserver.get_etag('key', u'10')
+    assert etag == rpcserver.get_etag('key', u'10')
+    assert etag != rpcserver.get_etag('key', u'11')
+    assert etag != rpcserver.get_etag('other', u'10')
+
+    assert not rpcserver.match_etag({}, etag)
+    assert rpcserver.match_etag({'HTTP_IF_NONE_MATCH': etag}, etag)
+    assert rpcserver.match_etag(
+        {'HTTP_IF_NONE_MATCH': '"abc", %s' % etag}, etag)
+    # the client may have nothing cached for this request
+    assert not rpcserver.match_etag({'HTTP_IF_NONE_MATCH': '*'}, etag)
+    assert not rpcserver.match_etag({'HTTP_IF_NONE_MATCH': '"abc"'}, etag)
+    # the tag of a response compressed by mod_deflate
+    assert rpcserver.match_etag(
+        {'HTTP_IF_NONE_MATCH': etag[:-1] + '-gzip"'}, etag)
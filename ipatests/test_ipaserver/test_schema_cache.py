@@ -0,0 +1,141 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the API schema cache file
+"""
+
+import gzip
+import os
+import sys
+import types
+
+import pytest
+
+from ipalib.request import context
+from ipalib.text import _
+from ipaplatform.paths import paths
+from ipaserver.plugins import schema as schema_plugin
+
+SCHEMA = {
+    'version': u'2.229',
+    'commands': ({'name': u'user_show', 'doc': u'Display a user.'},),
+    'classes': (),
+    'topics': (),
+    'fingerprint': u'0123abcd',
+}
+
+
+class FakeEnv(object):
+    in_tree = False
+
+
+class FakeAPI(object):
+    env = FakeEnv()
+
+    def __init__(self, plugins):
+        self.Command = plugins
+        self.Object = []
+
+
+@pytest.mark.tier0
+class TestSchemaCache(object):
+    @pytest.fixture
+    def module(self, request, tmpdir):
+        filename = tmpdir.join('fake_plugin.py')
+        filename.write('"""Fake plugin"""\n')
+        module = types.ModuleType('ipatests_fake_plugin')
+        module.__file__ = str(filename)
+        sys.modules[module.__name__] = module
+        request.addfinalizer(lambda: sys.modules.pop(module.__name__))
+        return module
+
+    @pytest.fixture
+    def command(self, module):
+        plugin = type('fake_plugin', (object,), {})
+        plugin.__module__ = module.__name__
+        return schema_plugin.schema(FakeAPI([plugin]))
+
+    @pytest.fixture
+    def cache_file(self, monkeypatch, tmpdir):
+        filename = str(tmpdir.mkdir('cache').join('api-schema.json.gz'))
+        monkeypatch.setattr(paths, 'IPA_API_SCHEMA_CACHE', filename)
+        return filename
+
+    def test_key(self, command, module, monkeypatch):
+        key = command._get_cache_key()
+        assert key == command._get_cache_key()
+
+        # the locale of the request does not matter
+        monkeypatch.setenv('LANG', 'cs_CZ.UTF-8')
+        assert command._get_cache_key() == key
+
+        # the modules defining plugins do
+        st = os.stat(module.__file__)
+        os.utime(module.__file__, (st.st_atime, st.st_mtime + 10))
+        assert command._get_cache_key() != key
+
+    def test_key_missing_module(self, command, module):
+        key = command._get_cache_key()
+        os.unlink(module.__file__)
+        assert command._get_cache_key() != key
+
+    def test_store_load(self, command, cache_file):
+        assert command._load_cache(u'key') is None
+
+        command._store_cache(u'key', SCHEMA)
+        assert oct(os.stat(cache_file).st_mode & 0o777) == oct(0o644)
+        assert command._load_cache(u'key') == SCHEMA
+        assert command._load_cache(u'other') is None
+
+        # no temporary files are left behind
+        assert os.listdir(os.path.dirname(cache_file)) == [
+            os.path.basename(cache_file)]
+
+    def test_load_corrupted(self, command, cache_file):
+        with open(cache_file, 'wb') as f:
+            f.write(b'not gzip')
+        assert command._load_cache(u'key') is None
+
+        with gzip.open(cache_file, 'wb') as f:
+            f.write(b'["not", "a", "dict"]')
+        assert command._load_cache(u'key') is None
+
+    def test_store_failed(self, command, monkeypatch, tmpdir):
+        filename = str(tmpdir.join('missing', 'api-schema.json.gz'))
+        monkeypatch.setattr(paths, 'IPA_API_SCHEMA_CACHE', filename)
+        command._store_cache(u'key', SCHEMA)
+        assert command._load_cache(u'key') is None
+
+    def test_get_schema(self, command, cache_file, monkeypatch):
+        generated = []
+
+        def generate_schema(**kwargs):
+            generated.append(kwargs)
+            return SCHEMA
+
+        monkeypatch.setattr(command, '_generate_schema', generate_schema)
+        assert command._get_schema(version=u'2.229') == SCHEMA
+        assert command._get_schema(version=u'2.229') == SCHEMA
+        assert generated == [dict(version=u'2.229')]
+
+
+@pytest.mark.tier0
+def test_c_locale(request):
+    message = _('Display a user.')
+    translation = object()
+    context.languages = ['cs']
+    context.__dict__[message.key] = translation
+
+    def cleanup():
+        del context.languages
+        del context.__dict__[message.key]
+    request.addfinalizer(cleanup)
+
+    with schema_plugin._c_locale():
+        assert context.languages == ['C']
+        assert message.as_unicode() == u'Display a user.'
+
+    assert context.languages == ['cs']
+    assert context.__dict__[message.key] is translation
@@ -30,6 +30,7 @@ from ipapython.dn import DN
 import pytest
 
 group1 = u'testgroup1'
+group2 = u'testgroup2'
 first1 = u'John'
 
 
@@ -54,6 +55,7 @@ class test_batch(Declarative):
 
     cleanup_commands = [
         ('group_del', [group1], {}),
+        ('group_del', [group2], {}),
     ]
 
     tests = [
@@ -264,4 +266,50 @@ class test_batch(Declarative):
             ),
         ),
 
+        dict(
+            desc='Parallel batch of reads around a write',
+            command=('batch', [
+                dict(method='group_show', params=([group2], dict())),
+                dict(method='group_show', params=([u'admins'], dict())),
+                dict(method='group_add',
+                    params=([group2], dict(description=u'Test desc 1'))),
+                dict(method='group_show', params=([group2], dict())),
+                dict(method='group_find', params=([group2], dict())),
+            ], dict(parallel=True)),
+            expected=dict(
+                count=5,
+                results=deepequal_list(
+                    dict(
+                        error=u'%s: group not found' % group2,
+                        error_name=u'NotFound',
+                        error_code=4001,
+                        error_kw=dict(
+                            reason=u'%s: group not found' % group2,
+                        ),
+                    ),
+                    dict(
+                        value=u'admins',
+                        summary=None,
+                        result=Fuzzy(type=dict),
+                        error=None),
+                    dict(
+                        value=group2,
+                        summary=u'Added group "testgroup2"',
+                        result=Fuzzy(type=dict),
+                        error=None),
+                    dict(
+                        value=group2,
+                        summary=None,
+                        result=Fuzzy(type=dict),
+                        error=None),
+                    dict(
+                        count=1,
+                        truncated=False,
+                        summary=u'1 group matched',
+                        result=Fuzzy(type=list),
+                        error=None),
+                ),
+            ),
+        ),
+
     ]